@@ -0,0 +1,246 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""asyncio based communication with the OpenDaVINCI middleware (Python 3.6+ only)"""
+
+__license__ = "GNU General Public License"
+__docformat__ = 'reStructuredText'
+
+import asyncio
+import os
+import socket
+import struct
+
+from internal.logger import Logger
+from internal.registry import loadProtoDict
+from internal.timestamps import DATETIME, MODES, arrivalNow, makeTimeStamps
+from internal.wire import LENGTH_OPENDAVINCI_HEADER, ContainerPeeker, packHeader, parseContainer, unpackHeader
+
+
+class _Subscriber:
+    """Bounded per-subscriber queue, full queues either drop the oldest or the newest entry"""
+
+    def __init__(self, maxsize, dropOldest):
+        self.queue = asyncio.Queue(maxsize)
+        self.dropOldest = dropOldest
+        self.dropped = 0
+
+    def offer(self, item):
+        if self.queue.full():
+            self.dropped += 1
+            if not self.dropOldest:
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+
+
+class _MulticastProtocol(asyncio.DatagramProtocol):
+    def __init__(self, node):
+        self.node = node
+
+    def datagram_received(self, data, addr):
+        self.node._datagramReceived(data)
+
+    def error_received(self, exc):
+        Logger.logWarn("Multicast socket error: " + str(exc))
+
+
+class AsyncDVnode:
+    """Event loop driven equivalent of DVnode, no threads are started
+
+    Example:
+        node = AsyncDVnode(cid=111)
+        await node.connect()
+        async for msg, timeStamps in node.subscribe(19):
+            print(msg)
+
+    Every subscriber owns a bounded queue, a slow consumer only loses its own messages and never blocks the other
+    subscribers or the event loop.
+    """
+
+    def __init__(self, cid, port=12175, queueSize=100, dropOldest=True, loop=None, timeStampMode=DATETIME):
+        """
+        Parameters
+        ----------
+        cid : int
+            conference id of the OpenDaVINCI session
+        port : int
+            UDP multicast port
+        queueSize : int
+            default queue size of each subscriber
+        dropOldest : bool
+            default policy of full subscriber queues, True keeps the newest data, False drops incoming data
+        loop : asyncio.AbstractEventLoop
+            event loop to use, defaults to the running loop on connect()
+        timeStampMode : string
+            'datetime', 'ns' or 'float', see DVnode
+        """
+        assert cid <= 255
+        assert timeStampMode in MODES
+        self.MCAST_PORT = port
+        self.MCAST_GRP = "225.0.0." + str(cid)
+        Logger.logInfo("Starting asyncio node with CID: " + str(cid) + " !")
+        self.queueSize = queueSize
+        self.dropOldest = dropOldest
+        self.timeStampMode = timeStampMode
+        self.loop = loop
+        self.transport = None
+        self.containerSubscribers = list()
+        self.messageSubscribers = dict()
+        self.knownIDs = set()
+        self.Logger = Logger
+        self.path = os.path.dirname(os.path.abspath(__file__))
+        self.proto_dict = loadProtoDict(self.path)
+        self.peeker = ContainerPeeker(self.proto_dict[0])
+
+    async def connect(self):
+        """
+        Needs to be awaited to receive or publish any data.
+        """
+        assert self.transport is None
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', self.MCAST_PORT))
+        req = struct.pack("4sl", socket.inet_aton(self.MCAST_GRP), socket.INADDR_ANY)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, req)
+        sock.setblocking(False)
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: _MulticastProtocol(self), sock=sock)
+
+    def close(self):
+        """
+        Closes the multicast socket, running iterators stop waiting for new data only when cancelled.
+        """
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def publish(self, container):
+        """
+        Publishes data using OpenDaVINCI, this is the python equivalent to getConference().send(container);
+
+        Parameters
+        ----------
+        container : opendavinci_pb2.odcore_data_MessageContainer
+            container to publish
+        """
+        await self.publish_raw(container.SerializeToString())
+
+    async def publish_raw(self, string):
+        """
+        Publishes an already serialized container.
+
+        Parameters
+        ----------
+        string : opendavinci_pb2.odcore_data_MessageContainer().SerializeToString()
+            string to publish
+        """
+        self.transport.sendto(packHeader(len(string)) + string, (self.MCAST_GRP, self.MCAST_PORT))
+
+    async def containers(self, queueSize=None, dropOldest=None):
+        """
+        Asynchronous iterator over all received containers.
+
+        Parameters
+        ----------
+        queueSize : int
+            size of the queue of this subscriber, defaults to the node setting
+        dropOldest : bool
+            policy of the queue of this subscriber, defaults to the node setting
+        """
+        subscriber = self.__newSubscriber(queueSize, dropOldest)
+        self.containerSubscribers.append(subscriber)
+        try:
+            while True:
+                container, _ = await subscriber.queue.get()
+                yield container
+        finally:
+            self.containerSubscribers.remove(subscriber)
+
+    async def subscribe(self, msgID, queueSize=None, dropOldest=None):
+        """
+        Asynchronous iterator over the decoded messages of one type, yields (msg, timeStamps) like the DVnode callbacks.
+
+        Parameters
+        ----------
+        msgID : int
+            Message identifier from the ODVD or Protobuf file.
+        queueSize : int
+            size of the queue of this subscriber, defaults to the node setting
+        dropOldest : bool
+            policy of the queue of this subscriber, defaults to the node setting
+        """
+        if msgID not in self.proto_dict:
+            raise KeyError("Message ID " + str(msgID) + " unknown!")
+        msgType = self.proto_dict[msgID]
+        subscriber = self.__newSubscriber(queueSize, dropOldest)
+        self.messageSubscribers.setdefault(msgID, list()).append(subscriber)
+        try:
+            while True:
+                container, arrival = await subscriber.queue.get()
+                msg = msgType()
+                msg.ParseFromString(container.serializedData)
+                yield msg, makeTimeStamps(self.timeStampMode, container, arrival)
+        finally:
+            self.messageSubscribers[msgID].remove(subscriber)
+            if not self.messageSubscribers[msgID]:
+                del self.messageSubscribers[msgID]
+
+    def getDroppedCount(self):
+        """
+        returns the number of containers dropped by all currently active subscribers
+        """
+        dropped = sum(s.dropped for s in self.containerSubscribers)
+        for subscribers in self.messageSubscribers.values():
+            dropped += sum(s.dropped for s in subscribers)
+        return dropped
+
+    def getKnownMessageIDs(self):
+        """
+        returns all yet received message ID's since the node is connected
+        """
+        return list(self.knownIDs)
+
+    def __newSubscriber(self, queueSize, dropOldest):
+        if queueSize is None:
+            queueSize = self.queueSize
+        if dropOldest is None:
+            dropOldest = self.dropOldest
+        return _Subscriber(queueSize, dropOldest)
+
+    def _datagramReceived(self, data):
+        arrival = arrivalNow()
+        if len(data) <= LENGTH_OPENDAVINCI_HEADER:
+            return
+        size = unpackHeader(data)
+        if size is None:
+            return
+        if len(data) < size + LENGTH_OPENDAVINCI_HEADER:
+            self.Logger.logWarn("Dropping incomplete container, multi datagram containers are not supported!")
+            return
+        payload = memoryview(data)[LENGTH_OPENDAVINCI_HEADER:LENGTH_OPENDAVINCI_HEADER + size]
+        # only parse containers somebody is waiting for
+        dataType = self.peeker.peekDataType(payload)
+        self.knownIDs.add(dataType)
+        if not self.containerSubscribers and dataType not in self.messageSubscribers:
+            return
+        container = parseContainer(self.proto_dict[0](), payload)
+        for subscriber in self.containerSubscribers:
+            subscriber.offer((container, arrival))
+        for subscriber in self.messageSubscribers.get(container.dataType, ()):
+            subscriber.offer((container, arrival))
@@ -20,33 +20,80 @@
 __license__ = "GNU General Public License"
 __docformat__ = 'reStructuredText'
 
-import datetime
+# the receive queues, profiler, time stamp and snapshot classes are part of the interface of the DVnode, the recording
+# classes are imported on first use, see _RECORDING_CLASSES
+__all__ = [
+    'DVnode',
+    'ContainerQueue', 'DropNewestQueue', 'DropOldestQueue', 'LatestValueQueue', 'PriorityLaneQueue',
+    'CallbackProfiler', 'ProfilerHook',
+    'TimeStamps', 'TimeStampsNs',
+    'StatisticsSnapshot', 'ImageStreamSnapshot',
+    'LazyContainer', 'ReadAhead', 'Recorder', 'Recording', 'RecordingReader',
+]
+
+import itertools
 import os
-import posix_ipc
+import select
 import signal
 import socket
 import struct
 import sys
-import sysv_ipc
 import threading
-
-from import_file import import_file
+import time
 
 from internal.logger import Logger
-import json
+from internal.dispatch import KeyedSerialDispatcher
+from internal.fragments import FRAGMENT_MARKER, Reassembler, fragments, isFragment
+from internal.imagepipeline import ImagePipeline, ImageStreamSnapshot
+from internal.profiling import CallbackProfiler, ProfilerHook, callbackName
+from internal.queues import ContainerQueue, DropNewestQueue, DropOldestQueue, LatestValueQueue, PriorityLaneQueue
+from internal.registry import loadProtoDict
+from internal.statistics import StatisticsSnapshot, TrafficStatistics
+from internal.timestamps import (DATETIME, MODES, TimeStamps, TimeStampsNs, arrivalNow, makeTimeStamps, monotonicNs,
+                                 wallNs)
+from internal.wire import (LENGTH_OPENDAVINCI_HEADER, MAX_DATAGRAM_SIZE, ContainerEncoder, ContainerPeeker, packHeader,
+                           parseContainer, unpackHeader)
 
 # prints whether python is version 3 or not
 python_version = sys.version_info.major
 if python_version == 3:
     Logger.logInfo("OpenDaVINCI running under Python 3.x")
     import _thread as thread
-    import queue as Queue
 else:
     Logger.logInfo("OpenDaVINCI running under Python 2.x")
     import thread as thread
-    import Queue
 
-import numpy as np
+# larger containers are sent with sendmsg, header and payload are handed to the kernel separately instead of being
+# copied into one string. Below, copying is cheaper than the more expensive sendmsg call.
+SCATTER_GATHER_MIN_SIZE = 8192
+
+# numpy and multiprocessing are imported on demand, they dominate the start up time of nodes which don't need them
+
+# the recording classes are imported on first use as well, e.g. DVnode.Recorder, since they pull in the compression
+# libraries. Python < 3.7 has no module __getattr__, there they are imported right away.
+_RECORDING_CLASSES = {
+    'LazyContainer': 'internal.recreader',
+    'ReadAhead': 'internal.readahead',
+    'Recorder': 'internal.recorder',
+    'Recording': 'internal.recording',
+    'RecordingReader': 'internal.recreader',
+}
+
+
+def __getattr__(name):
+    if name not in _RECORDING_CLASSES:
+        raise AttributeError("module 'DVnode' has no attribute '" + name + "'")
+    import importlib
+    value = getattr(importlib.import_module(_RECORDING_CLASSES[name]), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):
+    from internal.readahead import ReadAhead
+    from internal.recorder import Recorder
+    from internal.recording import Recording
+    from internal.recreader import LazyContainer, RecordingReader
 
 
 class DVnode:
@@ -55,7 +102,68 @@ class DVnode:
     You can create multiple objects of the class with different cid's (or equal). So you can easily transmit data between two cid spaces.
     """
 
-    def __init__(self, cid, port=12175):
+    def __init__(self, cid, port=12175, zeroCopy=False, receiveBuffers=16, filterUnsubscribed=True, processes=0,
+                 ringSize=4 * 1024 * 1024, containerQueue=None, orderedDispatch=True, orderKey=None,
+                 timeStampMode=DATETIME, statistics=True, profiler=None, imageThreads=1, fragmentation=False,
+                 fragmentSize=MAX_DATAGRAM_SIZE, reassemblyTimeout=1.0, socketBufferSize=None, latencySampling=16):
+        """
+        Parameters
+        ----------
+        cid : int
+            conference id of the OpenDaVINCI session
+        port : int
+            UDP multicast port
+        zeroCopy : bool
+            receive into a pool of preallocated buffers and parse the containers from memoryviews instead of
+            allocating new strings for every datagram. Set to False to use the classic receive loop.
+        receiveBuffers : int
+            number of preallocated receive buffers, also the maximum number of datagrams drained per wakeup
+        filterUnsubscribed : bool
+            read the dataType straight from the wire and drop containers nobody registered a callback for,
+            before they are parsed. Set to False to parse and queue every container.
+        processes : int
+            number of worker processes decoding the containers and running the callbacks. 0 keeps the worker threads.
+            Containers of one dataType always go to the same process, so they are handled in order.
+            All callbacks need to be registered before connect() is called, since the processes are forked there.
+        ringSize : int
+            size in bytes of the shared memory ring buffer of each worker process
+        containerQueue : ContainerQueue
+            receive queue policy of the worker threads, e.g. DropOldestQueue(100), LatestValueQueue or
+            PriorityLaneQueue. Defaults to DropNewestQueue(10).
+        orderedDispatch : bool
+            containers with the same key are handed to the callbacks in receive order and never concurrently,
+            different keys still run in parallel. Set to False for the unordered mode with maximum throughput.
+        orderKey : function
+            returns the ordering key of a container, defaults to its dataType
+        timeStampMode : string
+            'datetime' hands [sent, received] datetime objects to the callbacks. 'ns' and 'float' hand over
+            TimeStamps objects in integer nanoseconds respectively float seconds, which are much cheaper to build
+            and additionally carry the monotonic and wall clock arrival time of the container.
+        statistics : bool
+            keep per message type traffic statistics, see getStatistics(). Counting costs about 1 us per container,
+            the latency is only sampled, see latencySampling.
+        profiler : CallbackProfiler
+            records queue wait, parse and execution time of every callback and reports callbacks exceeding the
+            budget of the profiler, e.g. CallbackProfiler(budget=0.005). None disables the profiling.
+        imageThreads : int
+            number of threads running the image callbacks. Only the newest frame of every image stream is kept,
+            older frames are skipped, see getImageStatistics(). 0 runs the image callbacks on the worker threads.
+        fragmentation : bool
+            publish containers which don't fit into one datagram as several fragments. Receiving fragments is
+            always supported, but older nodes and OpenDaVINCI itself ignore them.
+        fragmentSize : int
+            maximum size of a fragment datagram in bytes
+        reassemblyTimeout : float
+            seconds after which an incompletely received container is given up, see getFragmentCounters()
+        socketBufferSize : int
+            receive buffer size of the socket in bytes, None keeps the system default. Large fragmented containers
+            arrive in bursts which easily overflow the default buffer. The kernel limits the size to
+            net.core.rmem_max.
+        latencySampling : int
+            the statistics read the sent time stamp of every latencySampling-th container of a type for the latency,
+            which costs about 8 us per container. 1 measures the latency of every container.
+        """
+        assert timeStampMode in MODES
         assert cid <= 255
         self.MCAST_PORT = port
         self.MCAST_GRP = "225.0.0." + str(cid)
@@ -65,45 +173,59 @@ class DVnode:
         self.connected = False
         self.callbacks = dict()
         self.imageCallbacks = dict()
+        self.sharedImages = None
+        self.imageWriters = dict()
+        self.imageWriterLock = threading.Lock()
+        self.imageThreads = imageThreads
+        self.imagePipeline = None
         self.containerCallbacks = list()
         self.knownIDs = list()
+        self.knownIDSet = set()
+        self.statistics = TrafficStatistics(latencySampling=latencySampling) if statistics else None
+        self.profiler = profiler
         self.sock = None
-        self.modules = dict()
+        self.zeroCopy = zeroCopy
+        self.receiveBuffers = max(1, int(receiveBuffers))
         self.Logger = Logger
         self.path = os.path.dirname(os.path.abspath(__file__))
-        try:
-            with open(os.path.join(self.path, "proto_dict.json"), 'r') as fp:
-                tmp_proto_string_dict = json.load(fp)
-                self.proto_string_dict = dict()
-                ## correcting keys to int , since json does't support numbers
-                for key in tmp_proto_string_dict.keys():
-                    self.proto_string_dict[int(key)] = tmp_proto_string_dict[key]
-        except:
-            self.Logger.logError(" proto_dict.json not found! Run autogen_proto.py first!")
-            sys.exit(-1)
-        self.proto_dict = dict()
-        self.Logger.logInfo("Loading " + str(len(self.proto_string_dict.keys())) + " Messages..")
-        for key in self.proto_string_dict.keys():
-            entry = self.proto_string_dict[key]
-            module = self.__cached_import(entry[0])
-            self.proto_dict[key] = getattr(module, entry[1])
-        self.Logger.logInfo("Finished Loading Messages..")
+        self.proto_dict = loadProtoDict(self.path)
+        self.filterUnsubscribed = filterUnsubscribed
+        self.peeker = ContainerPeeker(self.proto_dict[0])
+        self.encoder = ContainerEncoder(self.proto_dict[0])
+        self.validatedTypes = set()
+        self.MessageContainer = self.proto_dict[0]
+        self.fragmentation = fragmentation
+        self.fragmentSize = fragmentSize
+        self.fragmentSender = struct.unpack('<L', os.urandom(4))[0]
+        self.fragmentSequence = itertools.count()
+        self.reassembler = Reassembler(reassemblyTimeout)
+        self.truncated = 0
+        self.socketBufferSize = socketBufferSize
         self.threads = list()
-        self.containerQueue = Queue.Queue(10)
-        for i in range(self.threadLimit):
+        self.processes = list()
+        self.rings = list()
+        if processes:
+            from internal.shmring import SharedRingBuffer
+            self.rings = [SharedRingBuffer(ringSize) for _ in range(processes)]
+        self.containerQueue = containerQueue if containerQueue is not None else DropNewestQueue(10)
+        if imageThreads and not self.rings:
+            self.imagePipeline = ImagePipeline(self.__deliverImage, imageThreads)
+        self.ringDropCounts = dict()
+        self.ringDropped = 0
+        self.reportedDrops = 0
+        self.lastDropWarning = 0
+        self.timeStampMode = timeStampMode
+        self.dispatcher = None
+        if orderedDispatch:
+            if orderKey is None:
+                orderKey = lambda container: container.dataType
+            self.dispatcher = KeyedSerialDispatcher(self.containerQueue, lambda item: orderKey(item[0]))
+        for i in range(self.threadLimit if not self.rings else 0):
             worker = threading.Thread(target=self.__threadedContainerHandler, args=(self.containerQueue,))
             worker.setDaemon(True)
             worker.start()
             self.threads.append(worker)
 
-    def __cached_import(self, file):
-        if file in self.modules.keys():
-            return self.modules[file]
-        else:
-            imp = import_file(file)
-            self.modules[file] = imp
-            return imp
-
     def connect(self):
         """
         Needs to be called to receive or publish any data.
@@ -112,12 +234,28 @@ class DVnode:
         # open UDP multicast socect
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.socketBufferSize:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socketBufferSize)
         self.sock.bind(('', self.MCAST_PORT))  # use MCAST_GRP instead of '' to listen only / to MCAST_GRP, not all groups on MCAST_PORT
         req = struct.pack("4sl", socket.inet_aton(self.MCAST_GRP), socket.INADDR_ANY)
         self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, req)
+        self.address = (self.MCAST_GRP, self.MCAST_PORT)
+        # python 2 has no sendmsg
+        self.scatterGather = hasattr(self.sock, 'sendmsg')
         self.connected = True
+        if self.rings:
+            from internal.shmring import forkContext
+            context = forkContext()
+        for ring in self.rings:
+            worker = context.Process(target=self.__processContainerHandler, args=(ring,))
+            worker.daemon = True
+            worker.start()
+            self.processes.append(worker)
         if not self.run:
-            thread.start_new_thread(self.__spin, ())
+            if self.zeroCopy:
+                thread.start_new_thread(self.__spinZeroCopy, ())
+            else:
+                thread.start_new_thread(self.__spin, ())
             self.run = True
 
     def publish(self, container):
@@ -130,10 +268,7 @@ class DVnode:
         container : opendavinci_pb2.odcore_data_MessageContainer
             container to publish
         """
-        data = container.SerializeToString()
-        header = self.__get_od_header(len(data))
-        tosend = header + data
-        self.sock.sendto(tosend, (self.MCAST_GRP, self.MCAST_PORT))
+        self.__send(container.SerializeToString())
 
     def publish_raw(self, string):
         """
@@ -143,17 +278,143 @@ class DVnode:
         Parameters
         ----------
         string : opendavinci_pb2.odcore_data_MessageContainer().SerializeToString()
-            string to publish
+            string to publish, any bytes like object e.g. a memoryview works as well
         """
-        header = self.__get_od_header(len(string))
-        tosend = header + string
-        self.sock.sendto(tosend, (self.MCAST_GRP, self.MCAST_PORT))
+        self.__send(string)
 
-    @staticmethod
-    def __get_od_header(size):
-        a = struct.pack("<B", *bytearray([0x0D, ]))
-        b = struct.pack("<L", ((size & 0xFFFFFF) << 8) | 0xA4)
-        return a + b
+    def publishMessage(self, msgID, msg):
+        """
+        Publishes a single message, the container around it is written directly instead of building and serializing
+        a MessageContainer. The sent and received time stamps are set to the current time.
+
+        Parameters
+        ----------
+        msgID : int
+            message identifier, has to be known by autogen_proto.py
+        msg : protobuf message
+            message to publish, already serialized messages are accepted as well
+        """
+        if hasattr(msg, 'SerializeToString'):
+            if (msgID, type(msg)) not in self.validatedTypes:
+                self.__validateMessage(msgID, msg)
+            payload = msg.SerializeToString()
+        else:
+            if msgID not in self.proto_dict:
+                raise ValueError("Message ID " + str(msgID) + " unknown!")
+            payload = msg
+        now = wallNs() // 1000
+        stamp = (now // 1000000, now % 1000000)
+        prefix, payload, suffix = self.encoder.encode(msgID, payload, stamp, stamp)
+        size = len(prefix) + len(payload) + len(suffix)
+        if size > MAX_DATAGRAM_SIZE - LENGTH_OPENDAVINCI_HEADER and self.fragmentation:
+            self.__sendFragments(prefix + payload + suffix)
+        elif self.scatterGather and size >= SCATTER_GATHER_MIN_SIZE:
+            self.sock.sendmsg((packHeader(size) + prefix, payload, suffix), (), 0, self.address)
+        else:
+            self.sock.sendto(packHeader(size) + prefix + payload + suffix, self.address)
+
+    def __validateMessage(self, msgID, msg):
+        if msgID not in self.proto_dict:
+            raise ValueError("Message ID " + str(msgID) + " unknown!")
+        if msg.DESCRIPTOR.full_name != self.proto_dict[msgID].DESCRIPTOR.full_name:
+            raise ValueError("Message ID " + str(msgID) + " belongs to " + self.getMessageName(msgID) + ", not to " +
+                             msg.DESCRIPTOR.full_name + "!")
+        self.validatedTypes.add((msgID, type(msg)))
+
+    def publish_many(self, containers):
+        """
+        Publishes several containers at once, cheaper than calling publish() for each of them.
+
+        Parameters
+        ----------
+        containers : iterable
+            opendavinci_pb2.odcore_data_MessageContainer objects to publish, in this order
+        """
+        self.publish_raw_many(container.SerializeToString() for container in containers)
+
+    def publish_raw_many(self, strings):
+        """
+        Publishes several serialized containers at once, see publish_raw().
+
+        Parameters
+        ----------
+        strings : iterable
+            serialized containers, any bytes like objects
+        """
+        address = self.address
+        sendto = self.sock.sendto
+        sendmsg = self.sock.sendmsg if self.scatterGather else None
+        for data in strings:
+            size = len(data)
+            if size > MAX_DATAGRAM_SIZE - LENGTH_OPENDAVINCI_HEADER and self.fragmentation:
+                self.__sendFragments(data)
+            elif sendmsg is not None and size >= SCATTER_GATHER_MIN_SIZE:
+                sendmsg((packHeader(size), data), (), 0, address)
+            else:
+                sendto(packHeader(size) + data, address)
+
+    def __send(self, data):
+        size = len(data)
+        if size > MAX_DATAGRAM_SIZE - LENGTH_OPENDAVINCI_HEADER and self.fragmentation:
+            self.__sendFragments(data)
+        elif self.scatterGather and size >= SCATTER_GATHER_MIN_SIZE:
+            self.sock.sendmsg((packHeader(size), data), (), 0, self.address)
+        else:
+            self.sock.sendto(packHeader(size) + data, self.address)
+
+    def __sendFragments(self, data):
+        sequence = next(self.fragmentSequence) & 0xFFFFFFFF
+        for header, chunk in fragments(data, self.fragmentSender, sequence, self.fragmentSize):
+            if self.scatterGather:
+                self.sock.sendmsg((header, chunk), (), 0, self.address)
+            else:
+                self.sock.sendto(header + chunk.tobytes(), self.address)
+
+    def publishImage(self, name, image):
+        """
+        Publishes a frame as OpenDaVINCI SharedImage, readable by every SharedImageViewer or registerImageCallback.
+        The shared memory segment and semaphore are created on the first call and reused afterwards, the frame is
+        copied once into the shared memory.
+
+        Parameters
+        ----------
+        name : string
+            name of the video stream
+        image : numpy.ndarray
+            uint8 array of shape (height, width, bytesPerPixel) or (height, width), e.g. an openCV image
+        """
+        name = str(name)
+        writer = self.imageWriters.get(name)
+        if writer is None:
+            with self.imageWriterLock:
+                writer = self.imageWriters.get(name)
+                if writer is None:
+                    from internal.sharedimage import SharedImageWriter
+                    writer = self.imageWriters[name] = SharedImageWriter(name)
+        msg = self.proto_dict[14]()
+        msg.name = name
+        msg.size, msg.width, msg.height, msg.bytesPerPixel = writer.write(image)
+        container = self.proto_dict[0]()
+        container.dataType = 14
+        container.serializedData = msg.SerializeToString()
+        now = wallNs() // 1000
+        container.sent.seconds = container.received.seconds = now // 1000000
+        container.sent.microseconds = container.received.microseconds = now % 1000000
+        self.publish(container)
+
+    def closeImages(self, remove=True):
+        """
+        Detaches the shared memory of all images published with publishImage().
+
+        Parameters
+        ----------
+        remove : bool
+            delete the segments and semaphores, consumers still attached keep their segment until they detach
+        """
+        with self.imageWriterLock:
+            for writer in self.imageWriters.values():
+                writer.close(remove)
+            self.imageWriters.clear()
 
     def getMessagte(self, container):
         try:
@@ -172,6 +433,10 @@ class DVnode:
             name = "unkown"
         return name
 
+    def __checkLateRegistration(self):
+        if self.processes:
+            self.Logger.logWarn("Callback registered after connect(), the worker processes will not run it!")
+
     def registerCallback(self, msgID, func, params=()):
         """
         Registers a new Callback function
@@ -195,6 +460,7 @@ class DVnode:
             should contain all other parameters which should be forwarded to the callback function
         """
         assert hasattr(func, '__call__')
+        self.__checkLateRegistration()
         if (not msgID in self.proto_dict):
             self.Logger.logWarn("Message ID " + str(msgID) + " unknown!")
             sys.exit(-1)
@@ -216,9 +482,10 @@ class DVnode:
             Callback function to be called
         """
         assert hasattr(func, '__call__')
+        self.__checkLateRegistration()
         self.containerCallbacks.append([func, params])
 
-    def registerImageCallback(self, name, func, params=()):
+    def registerImageCallback(self, name, func, params=(), zeroCopy=False):
         """
         Registers a new Callback function, but directly decodes the image message to an numpy array, which can easy used with openCV
 
@@ -237,15 +504,45 @@ class DVnode:
             Callback function to be called
         params : tuple
             should contain all other parameters which should be forwarded to the callback function
+        zeroCopy : bool
+            hand a SharedImageView onto the shared memory to the callback instead of a copied numpy array.
+            The producer can't write the next frame until the view is released, which happens after the callback
+            returned at the latest. Use image.array to access the pixels and image.copy() to keep them.
         """
         assert hasattr(func, '__call__')
-        self.imageCallbacks[str(name)] = (func, params)
+        self.__checkLateRegistration()
+        if self.sharedImages is None:
+            from internal.sharedimage import SharedImageCache
+            self.sharedImages = SharedImageCache()
+        self.imageCallbacks[str(name)] = (func, params, zeroCopy)
+
+    def loadColumns(self, filename, msgIDs=None, mmap=True):
+        """
+        Returns the messages of a recording as NumPy structured arrays, one per message type, with the columns
+        sent and received (nanoseconds) and one column per scalar message field. The arrays are exported into
+        filename.columns on the first call and mapped from there afterwards.
+
+            wgs84 = node.loadColumns("drive.rec", [19])[19]
+            latitude = wgs84['latitude']
+
+        Parameters
+        ----------
+        filename : string
+            recording to load
+        msgIDs : iterable
+            message identifiers to load, None loads all known types in the recording
+        mmap : bool
+            map the arrays read only instead of reading them into memory
+        """
+        from internal.columns import loadColumns
+        return loadColumns(filename, self.proto_dict, msgIDs, mmap)
 
     @staticmethod
     def writeToFile(container, filename):
         """
         Writes given container to File and automatically add the OpenDaVINCI recording header.
         Repeated call will append the Data to the file. If you want a fresh recording you need to delete the file manually
+        To record many containers use a Recorder, which keeps the file open and writes in the background.
 
         Parameters
         ----------
@@ -263,69 +560,106 @@ class DVnode:
             myfile.write(b)
             myfile.write(buf)
 
-    @staticmethod
-    def __getCRC32(string):
-        retVal = 0
-
-        for char in string:
-            retVal = retVal ^ ord(char) ^ 0x04C11DB7  # The CRC32 polynomial.
-
-        return retVal
-
-    def __ImageConverter(self, msg, stamps, callback):
-        # FIXME: incorporate _POSIX_NAME_MAX if available instead of constant 14, also the fallback to 12 if not defined
-        MAX_NAME_LENGTH = 14
-        name = str("/" + msg.name.replace("/", "_"))[:MAX_NAME_LENGTH]
-        sem = posix_ipc.Semaphore(str(name))
-        sm = sysv_ipc.SharedMemory(self.__getCRC32(name))
-        sem.acquire()
+    def __ImageConverter(self, msg, stamps, callback, arrival=None, start=0):
+        stream = self.sharedImages.get(msg)
+        if callback[2]:
+            image = stream.view(msg)
+        else:
+            image = stream.read(msg)
         try:
-            image = sm.read(msg.size + 4)[4:]
+            if self.profiler is None or arrival is None:
+                callback[0](image, stamps, *callback[1])
+            else:
+                converted = monotonicNs()
+                callback[0](image, stamps, *callback[1])
+                self.profiler.record("image:" + msg.name + ":" + callbackName(callback[0]), start - arrival[0],
+                                     converted - start, monotonicNs() - converted)
         finally:
-            sm.detach()
-            sem.release()
-            sem.close()
-
-        tmp = np.frombuffer(image, np.uint8).reshape(msg.height, msg.width, msg.bytesPerPixel)
-        callback[0](tmp, stamps, *callback[1])
+            if callback[2]:
+                image.release()
 
     def __threadedContainerHandler(self, queue):
+        if self.dispatcher is not None:
+            self.dispatcher.work(self.__handleQueuedContainer)
         while True:
-            container = queue.get()
-            if container.dataType != 8:
-                self.__handleContainer(container)
+            self.__handleQueuedContainer(queue.get())
 
-            queue.task_done()
+    def __handleQueuedContainer(self, item):
+        if item[0].dataType != 8:
+            self.__handleContainer(item[0], item[1])
 
-    def __handleContainer(self, container):
-        for callback, params in self.containerCallbacks:
-            callback(container, *params)
+    def __processContainerHandler(self, ring):
+        if self.imageThreads:
+            # threads don't survive the fork, so every worker process gets its own pipeline
+            self.imagePipeline = ImagePipeline(self.__deliverImage, self.imageThreads)
+        MessageContainer = self.proto_dict[0]
+        while True:
+            arrival, payload = ring.acquire()
+            try:
+                container = parseContainer(MessageContainer(), payload)
+            finally:
+                ring.release()
+            if container.dataType != 8:
+                self.__handleContainer(container, arrival)
 
-        if container.dataType in self.callbacks.keys():
-            msg = self.callbacks[container.dataType][1]()
+    def __handleContainer(self, container, arrival):
+        profiler = self.profiler
+        for callback, params in self.containerCallbacks:
+            if profiler is None:
+                callback(container, *params)
+            else:
+                start = monotonicNs()
+                callback(container, *params)
+                profiler.record("container:" + callbackName(callback), start - arrival[0], 0, monotonicNs() - start)
+
+        timestamps = None
+        if container.dataType in self.callbacks:
+            func, msgType, params = self.callbacks[container.dataType]
+            start = monotonicNs() if profiler is not None else 0
+            msg = msgType()
             msg.ParseFromString(container.serializedData)
-            send = datetime.datetime.fromtimestamp(timestamp=container.sent.seconds) + datetime.timedelta(
-                microseconds=container.sent.microseconds)
-            received = datetime.datetime.fromtimestamp(timestamp=container.received.seconds) + datetime.timedelta(
-                microseconds=container.received.microseconds)
-            timestamps = [send, received]
-            self.callbacks[container.dataType][0](msg, timestamps, *self.callbacks[container.dataType][2])
+            timestamps = makeTimeStamps(self.timeStampMode, container, arrival)
+            if profiler is None:
+                func(msg, timestamps, *params)
+            else:
+                parsed = monotonicNs()
+                func(msg, timestamps, *params)
+                profiler.record(str(container.dataType) + ":" + callbackName(func), start - arrival[0], parsed - start,
+                                monotonicNs() - parsed)
 
         if container.dataType == 14:
-            msg = self.proto_dict[14]()
-            msg.ParseFromString(container.serializedData)
-            send = datetime.datetime.fromtimestamp(timestamp=container.sent.seconds) + datetime.timedelta(
-                microseconds=container.sent.microseconds)
-            received = datetime.datetime.fromtimestamp(timestamp=container.received.seconds) + datetime.timedelta(
-                microseconds=container.received.microseconds)
-            timestamps = [send, received]
-            if msg.name in self.imageCallbacks.keys():
-                self.__ImageConverter(msg, timestamps, self.imageCallbacks[msg.name])
+            if self.imagePipeline is None:
+                start = monotonicNs() if profiler is not None else 0
+                msg = self.proto_dict[14]()
+                msg.ParseFromString(container.serializedData)
+                if msg.name in self.imageCallbacks:
+                    if timestamps is None:
+                        timestamps = makeTimeStamps(self.timeStampMode, container, arrival)
+                    self.__ImageConverter(msg, timestamps, self.imageCallbacks[msg.name], arrival, start)
+            elif self.rings:
+                self.__offerImage(container, arrival)
+
+    def __offerImage(self, container, arrival):
+        msg = self.proto_dict[14]()
+        msg.ParseFromString(container.serializedData)
+        if msg.name in self.imageCallbacks:
+            sent = container.sent
+            self.imagePipeline.offer(msg.name, (msg, container, arrival), arrival,
+                                     sent.seconds * 1000000000 + sent.microseconds * 1000)
+
+    def __deliverImage(self, item):
+        msg, container, arrival = item
+        start = monotonicNs() if self.profiler is not None else 0
+        timestamps = makeTimeStamps(self.timeStampMode, container, arrival)
+        self.__ImageConverter(msg, timestamps, self.imageCallbacks[msg.name], arrival, start)
 
     def __spin(self):
         while True:
+            if self.__idle():
+                continue
             # try:
             data = self.sock.recv(65507)
+            arrival = arrivalNow()
             if len(data) > 5:  # LENGTH_OPENDAVINCI_HEADER = 5
                 # fix for running python2 and 3:
                 try:
@@ -338,21 +672,201 @@ class DVnode:
                 size = (struct.unpack('<L', data[1:5])[0] >> 8)
                 # Check for OpenDaVINCI header.
                 if byte0 == int('0x0D', 16) and byte1 == int('0xA4', 16):
-                    i = 0
-                    while len(data) < size + 5:
-                        print("Waiting for more udp data, current retry: ", i)
-                        i += 1
-                        data += self.sock.recv(65507)
-                    container = self.proto_dict[0]()
-                    container.ParseFromString(data[5:])
-                    if container.dataType not in self.knownIDs:
-                        self.knownIDs.append(container.dataType)
-                    if not self.containerQueue.full():
-                        self.containerQueue.put_nowait(container)
-                    else:
-                        self.Logger.logWarn("Receive buffer full! Decrease Proccessing time or Message send rate!")
-                        # except:
-                        #    print("Unexpected error:", sys.exc_info()[0])
+                    if len(data) < size + 5:
+                        # a datagram is never continued by the next one, larger containers need fragmentation
+                        self.truncated += 1
+                        continue
+                    self.__handlePayload(memoryview(data)[5:size + 5], arrival)
+                elif byte0 == 0x0D and byte1 == FRAGMENT_MARKER:
+                    self.__handleFragment(data, len(data), arrival)
+                    # except:
+                    #    print("Unexpected error:", sys.exc_info()[0])
+
+    def __spinZeroCopy(self):
+        pool = [bytearray(MAX_DATAGRAM_SIZE) for _ in range(self.receiveBuffers)]
+        views = [memoryview(buf) for buf in pool]
+        sizes = [0] * len(pool)
+        arrivals = [None] * len(pool)
+        while True:
+            if self.__idle():
+                continue
+            # block for the first datagram, then drain whatever else is already queued in the socket
+            sizes[0] = self.sock.recv_into(pool[0])
+            arrivals[0] = arrivalNow()
+            count = 1
+            while count < len(pool):
+                try:
+                    sizes[count] = self.sock.recv_into(pool[count], 0, socket.MSG_DONTWAIT)
+                except socket.error:
+                    break
+                arrivals[count] = arrivalNow()
+                count += 1
+
+            for i in range(count):
+                nbytes = sizes[i]
+                if nbytes <= LENGTH_OPENDAVINCI_HEADER:
+                    continue
+                size = unpackHeader(pool[i])
+                # Check for OpenDaVINCI header.
+                if size is None:
+                    if isFragment(pool[i]):
+                        self.__handleFragment(views[i], nbytes, arrivals[i])
+                    continue
+                if nbytes < size + LENGTH_OPENDAVINCI_HEADER:
+                    # a datagram is never continued by the next one, larger containers need fragmentation
+                    self.truncated += 1
+                    continue
+                self.__handlePayload(views[i][LENGTH_OPENDAVINCI_HEADER:size + LENGTH_OPENDAVINCI_HEADER], arrivals[i])
+
+    def __idle(self):
+        # incomplete containers are given up after the timeout even if no more fragments arrive
+        if self.reassembler.pending and not select.select([self.sock], [], [], self.reassembler.timeout / 4.0)[0]:
+            self.reassembler.expire(monotonicNs())
+            return True
+        return False
+
+    def __handleFragment(self, buf, nbytes, arrival):
+        data = self.reassembler.add(buf, nbytes, arrival[0])
+        if data is not None:
+            self.__handlePayload(memoryview(data), arrival)
+
+    def __handlePayload(self, payload, arrival):
+        """Accounts, filters, parses and queues one received container"""
+        dataType = self.__account(payload, 0, len(payload), arrival)
+        if self.rings:
+            self.__shardPayload(payload, dataType, arrival)
+            return
+        if self.filterUnsubscribed and not self.__isWanted(dataType):
+            return
+        self.__enqueueContainer(parseContainer(self.MessageContainer(), payload), arrival)
+
+    def __account(self, buf, start, end, arrival):
+        """Peeks the container in buf[start:end], updates the known ID's and the statistics, returns the dataType"""
+        dataType = self.peeker.peekDataType(buf, start, end)
+        if self.statistics is not None:
+            sent = None
+            if self.statistics.latencyDue(dataType):
+                sentSeconds, sentMicroseconds = self.peeker.peek(buf, start, end)[1:3]
+                sent = sentSeconds * 1000000000 + sentMicroseconds * 1000
+            self.statistics.update(dataType, end - start, arrival, sent)
+        if dataType not in self.knownIDSet:
+            self.knownIDSet.add(dataType)
+            self.knownIDs.append(dataType)
+        return dataType
+
+    def __shardPayload(self, payload, dataType, arrival):
+        if self.filterUnsubscribed and not self.__isWanted(dataType):
+            return
+        if not self.rings[dataType % len(self.rings)].put(payload, arrival):
+            self.ringDropCounts[dataType] = self.ringDropCounts.get(dataType, 0) + 1
+            self.ringDropped += 1
+            self.__warnDrop()
+
+    def __isWanted(self, dataType):
+        """Tells whether any callback is interested in the given dataType"""
+        # ModuleStatistics are never handed to the callbacks
+        if dataType == 8:
+            return False
+        return bool(self.containerCallbacks) or dataType in self.callbacks or (dataType == 14 and bool(self.imageCallbacks))
+
+    def __enqueueContainer(self, container, arrival):
+        if container.dataType == 14 and self.imagePipeline is not None:
+            # images bypass the container queue, it only gets them if other callbacks want them as well
+            self.__offerImage(container, arrival)
+            if not self.containerCallbacks and 14 not in self.callbacks:
+                return
+        self.containerQueue.put(container.dataType, (container, arrival))
+        self.__warnDrop()
+
+    def __warnDrop(self):
+        # at most one warning per second
+        dropped = self.containerQueue.dropped + self.ringDropped
+        if dropped == self.reportedDrops:
+            return
+        now = time.time()
+        if now - self.lastDropWarning >= 1.0:
+            self.lastDropWarning = now
+            self.reportedDrops = dropped
+            self.Logger.logWarn("Receive buffer full! Decrease Proccessing time or Message send rate! (" +
+                                str(dropped) + " containers dropped so far)")
+
+    def getDropCounts(self):
+        """
+        returns a dict with the number of dropped containers per message ID since the program runs
+        """
+        drops = self.containerQueue.getDropCounts()
+        for dataType, count in list(self.ringDropCounts.items()):
+            drops[dataType] = drops.get(dataType, 0) + count
+        return drops
+
+    def getStatistics(self, window=1.0):
+        """
+        Returns the traffic statistics of all yet received message types, needs statistics=True.
+
+        Parameters
+        ----------
+        window : float
+            length of the sliding window in seconds used for the rates, at most 10 seconds
+
+        Returns
+        -------
+        dict
+            message identifier --> StatisticsSnapshot(dataType, count, bytes, rate, byteRate, interArrival, jitter,
+            latency, minLatency, maxLatency, lastArrival)
+        """
+        assert self.statistics is not None
+        return self.statistics.snapshots(window)
+
+    def getMessageStatistics(self, msgID, window=1.0):
+        """
+        returns the StatisticsSnapshot of one message type or None if it was never received, see getStatistics()
+        """
+        assert self.statistics is not None
+        return self.statistics.snapshot(msgID, window)
+
+    def getCallbackProfiles(self):
+        """
+        Returns the profiles of all yet called callbacks, needs a profiler. In multiprocessing mode the callbacks run
+        in the worker processes, whose profiles are not visible here.
+
+        Returns
+        -------
+        dict
+            callback name --> CallbackProfileSnapshot(name, count, overBudget, wait, parse, callback), the last three
+            are HistogramSnapshot(count, mean, p50, p90, p99, p999, max) in nanoseconds
+        """
+        assert self.profiler is not None
+        return self.profiler.snapshots()
+
+    def getImageStatistics(self):
+        """
+        Returns the delivery statistics of the image streams, needs imageThreads > 0. In multiprocessing mode the
+        images are handled in the worker processes, whose statistics are not visible here.
+
+        Returns
+        -------
+        dict
+            image stream name --> ImageStreamSnapshot(name, received, delivered, skipped, fps, latency, maxLatency,
+            endToEnd), latencies in seconds
+        """
+        if self.imagePipeline is None:
+            return dict()
+        return self.imagePipeline.snapshots()
+
+    def getFragmentCounters(self):
+        """
+        Returns the counters of the fragment reassembly.
+
+        Returns
+        -------
+        dict
+            completed, incomplete (given up after the timeout or to bound the memory) and pending containers,
+            duplicate and malformed fragments, late fragments of containers already completed or given up, and
+            truncated datagrams, which are shorter than their header says
+        """
+        counters = self.reassembler.counters()
+        counters['truncated'] = self.truncated
+        return counters
 
     def getKnownMessageIDs(self):
         """
@@ -17,34 +17,33 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
+import hashlib
 import json
+import multiprocessing
 import os
 import subprocess
 import sys
 from distutils.spawn import find_executable
 
-from import_file import import_file
-
 from internal.logger import Logger
 
-# prints whether python is version 3 or not
-Logger.logInfo("OpenDaVINCI running under Python " + str(sys.version_info.major) + "." + str(sys.version_info.minor))
-
 script_path = os.path.dirname(os.path.abspath(__file__))
+cache_file = os.path.join(script_path, "proto", ".autogen_cache.json")
 
-if len(sys.argv) < 2:
-    Logger.logError("Missing Parameters, minimum number of parameter is 2!")
+
+def usage():
     Logger.logInfo("Usage: ")
-    Logger.logInfo("       $ autogen_proto.py protofolder1 protofolder2")
+    Logger.logInfo("       $ autogen_proto.py [--force] [--jobs=N] protofolder1 protofolder2")
     Logger.logInfo("")
+    Logger.logInfo("Unchanged protofiles are skipped, --force recompiles all of them. --jobs sets the number of parallel protoc runs.")
     Logger.logInfo("One of the protofiles must contain the odcore_data_MessageContainer message, if not the process will fail!", color=Logger.YELLOW)
     Logger.logInfo("")
-    sys.exit(-1)
 
 
 class ProtoBuild():
     def __init__(self):
         self.protoc = self.find_protoc()
+        self.version = subprocess.check_output([self.protoc, "--version"]).decode().strip()
 
     def find_protoc(self):
         """Locates protoc executable"""
@@ -61,41 +60,141 @@ class ProtoBuild():
         return protoc
 
     def run(self, protopath, protofile):
-        script_path = os.path.dirname(os.path.abspath(__file__))
         proto = os.path.join(protopath, protofile)
         Logger.logInfo('Protobuf-compiling: ' + proto)
         subprocess.check_call([self.protoc, str('--python_out=' + script_path + '/proto/.'), proto, "--proto_path=" + str(protopath)])  # --proto_path
         return [os.path.join(script_path, "proto"), protofile.replace('.proto', '_pb2.py')]
 
 
-protos = list()
-proto_dict = dict()
-
-builder = ProtoBuild()
-for path in range(1, len(sys.argv)):
-    for dirpath, dirnames, filenames in os.walk(sys.argv[path]):
-        for filename in [f for f in filenames if f.endswith(".proto")]:
-            current_proto = (builder.run(dirpath, filename))
-            proto_python_file = os.path.abspath(os.path.join(current_proto[0], current_proto[1]))
-            proto_module = import_file(proto_python_file)
-            file = os.path.join(dirpath, filename)
-            with open(file, 'r') as File:
-                lines = File.readlines()
-                for line_nr, line in enumerate(lines):
-                    if line.startswith("// Message identifier: "):
-                        id = int(line.replace("// Message identifier: ", "").rstrip().replace(".", ""))
-                        message = lines[line_nr + 1].split(" ")[1]
-                        proto_dict[id] = [str(proto_python_file), str(message)]
-
-if not 0 in proto_dict.keys():
-    Logger.logError("ID: 0 --> odcore_data_MessageContainer not found in Protofiles!! Can't continue..")
-    sys.exit(-1)
-
-python_version = sys.version_info.major
-
-with open(os.path.join(script_path, "proto_dict.json"), 'w') as fp:
-    json.dump(proto_dict, fp, sort_keys=True, indent=2)
-Logger.logInfo('')
-Logger.logInfo('Succesfully written new database to proto_dict.json!', color=Logger.GREEN)
-
-Logger.logInfo(str(len(proto_dict.keys())) + " messages found!", color=Logger.GREEN)
+def scan_message_ids(file):
+    """Returns the message identifiers declared in a protofile as dict id --> message name"""
+    messages = dict()
+    with open(file, 'r') as File:
+        lines = File.readlines()
+        for line_nr, line in enumerate(lines):
+            if line.startswith("// Message identifier: "):
+                id = int(line.replace("// Message identifier: ", "").rstrip().replace(".", ""))
+                messages[id] = lines[line_nr + 1].split(" ")[1]
+    return messages
+
+
+def build(job):
+    """Compiles one protofile and scans its message identifiers, runs in the worker processes"""
+    builder, dirpath, filename = job
+    current_proto = builder.run(dirpath, filename)
+    proto_python_file = os.path.abspath(os.path.join(current_proto[0], current_proto[1]))
+    return os.path.join(dirpath, filename), proto_python_file, scan_message_ids(os.path.join(dirpath, filename))
+
+
+def file_hash(builder, file):
+    """Content hash of a protofile, also covering the protoc version"""
+    sha = hashlib.sha1(builder.version.encode())
+    with open(file, 'rb') as f:
+        sha.update(f.read())
+    return sha.hexdigest()
+
+
+def load_cache():
+    try:
+        with open(cache_file, 'r') as fp:
+            return json.load(fp)
+    except (IOError, ValueError):
+        return dict()
+
+
+def write_if_changed(filename, content):
+    try:
+        with open(filename, 'r') as fp:
+            if fp.read() == content:
+                return False
+    except IOError:
+        pass
+    with open(filename, 'w') as fp:
+        fp.write(content)
+    return True
+
+
+def main():
+    # prints whether python is version 3 or not
+    Logger.logInfo("OpenDaVINCI running under Python " + str(sys.version_info.major) + "." + str(sys.version_info.minor))
+
+    force = False
+    jobs = multiprocessing.cpu_count()
+    folders = list()
+    for arg in sys.argv[1:]:
+        if arg == "--force":
+            force = True
+        elif arg.startswith("--jobs="):
+            jobs = max(1, int(arg[len("--jobs="):]))
+        else:
+            folders.append(arg)
+
+    if len(folders) < 1:
+        Logger.logError("Missing Parameters, minimum number of parameter is 2!")
+        usage()
+        sys.exit(-1)
+
+    builder = ProtoBuild()
+    cache = dict() if force else load_cache()
+    new_cache = dict()
+    todo = list()
+    for folder in folders:
+        for dirpath, dirnames, filenames in os.walk(folder):
+            for filename in [f for f in filenames if f.endswith(".proto")]:
+                file = os.path.join(dirpath, filename)
+                digest = file_hash(builder, file)
+                entry = cache.get(file)
+                if entry is not None and entry["hash"] == digest and os.path.exists(entry["module"]):
+                    new_cache[file] = entry
+                else:
+                    todo.append(((builder, dirpath, filename), digest))
+
+    Logger.logInfo(str(len(new_cache)) + " protofiles unchanged, " + str(len(todo)) + " to compile..")
+    if todo:
+        pool = multiprocessing.Pool(min(jobs, len(todo)))
+        try:
+            results = pool.map(build, [job for job, digest in todo])
+        finally:
+            pool.close()
+            pool.join()
+        for (job, digest), (file, module, messages) in zip(todo, results):
+            new_cache[file] = {"hash": digest, "module": module, "messages": messages}
+
+    # merge the registry from all protofiles, the json keys of cached entries are strings
+    proto_dict = dict()
+    for file in sorted(new_cache.keys()):
+        entry = new_cache[file]
+        for id, message in entry["messages"].items():
+            proto_dict[int(id)] = [str(entry["module"]), str(message)]
+
+    if not 0 in proto_dict.keys():
+        Logger.logError("ID: 0 --> odcore_data_MessageContainer not found in Protofiles!! Can't continue..")
+        sys.exit(-1)
+
+    with open(cache_file, 'w') as fp:
+        json.dump(new_cache, fp, sort_keys=True, indent=2)
+
+    changed = write_if_changed(os.path.join(script_path, "proto_dict.json"),
+                               json.dumps(proto_dict, sort_keys=True, indent=2))
+
+    # precompiled registry with paths relative to the script folder, preferred by the DVnode
+    registry = "# Generated by autogen_proto.py, do not edit!\n"
+    registry += "# message identifier --> (_pb2 module relative to this folder, message name)\n\n"
+    registry += "MESSAGES = {\n"
+    for id in sorted(proto_dict.keys()):
+        relative_path = os.path.relpath(proto_dict[id][0], script_path)
+        registry += "    " + str(id) + ": (" + repr(str(relative_path)) + ", " + repr(proto_dict[id][1]) + "),\n"
+    registry += "}\n"
+    changed = write_if_changed(os.path.join(script_path, "proto_registry.py"), registry) or changed
+
+    Logger.logInfo('')
+    if changed:
+        Logger.logInfo('Succesfully written new database to proto_dict.json and proto_registry.py!', color=Logger.GREEN)
+    else:
+        Logger.logInfo('Database is up to date!', color=Logger.GREEN)
+
+    Logger.logInfo(str(len(proto_dict.keys())) + " messages found!", color=Logger.GREEN)
+
+
+if __name__ == "__main__":
+    main()
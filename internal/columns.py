@@ -0,0 +1,308 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Columnar export of recordings into NumPy structured arrays
+
+The messages of every type are decoded once into drive.rec.columns/<dataType>.npy, one row per container. The
+columns are the sent and received time stamps of the container in nanoseconds and the scalar fields of the message,
+fields of nested messages are flattened to dotted names like "position.x". Repeated, string and bytes fields are
+left out. meta.json in the same folder records the state of the recording and the schema of every exported type,
+exports of a changed recording or message definition are redone.
+"""
+
+import json
+import os
+from operator import attrgetter
+
+import numpy as np
+from google.protobuf.descriptor import FieldDescriptor
+from numpy.lib.format import open_memmap
+
+from internal.logger import Logger
+from internal.recindex import openIndex
+from internal.recreader import RecordingReader
+from internal.wire import parseContainer
+
+COLUMNS_SUFFIX = ".columns"
+META_FILE = "meta.json"
+META_VERSION = 1
+TIME_COLUMNS = ('sent', 'received')
+
+_NUMPY_TYPES = {
+    FieldDescriptor.TYPE_DOUBLE: '<f8',
+    FieldDescriptor.TYPE_FLOAT: '<f4',
+    FieldDescriptor.TYPE_INT64: '<i8',
+    FieldDescriptor.TYPE_SINT64: '<i8',
+    FieldDescriptor.TYPE_SFIXED64: '<i8',
+    FieldDescriptor.TYPE_UINT64: '<u8',
+    FieldDescriptor.TYPE_FIXED64: '<u8',
+    FieldDescriptor.TYPE_INT32: '<i4',
+    FieldDescriptor.TYPE_SINT32: '<i4',
+    FieldDescriptor.TYPE_SFIXED32: '<i4',
+    FieldDescriptor.TYPE_ENUM: '<i4',
+    FieldDescriptor.TYPE_UINT32: '<u4',
+    FieldDescriptor.TYPE_FIXED32: '<u4',
+    FieldDescriptor.TYPE_BOOL: '?',
+}
+
+
+def columnsPath(path):
+    """
+    returns the folder of the exported columns of the given recording
+    """
+    return path + COLUMNS_SUFFIX
+
+
+def _isRepeated(field):
+    try:
+        return field.is_repeated
+    except AttributeError:
+        # older protobuf versions only have the label
+        return field.label == FieldDescriptor.LABEL_REPEATED
+
+
+def messageColumns(descriptor, prefix="", parents=()):
+    """
+    Returns the columns of a message type.
+
+    Parameters
+    ----------
+    descriptor : google.protobuf.descriptor.Descriptor
+        DESCRIPTOR of the message class
+
+    Returns
+    -------
+    list
+        (column name, numpy type) of all scalar fields, nested messages are flattened, recursive ones only once
+    """
+    columns = list()
+    for field in descriptor.fields:
+        if _isRepeated(field):
+            continue
+        if field.type == FieldDescriptor.TYPE_MESSAGE:
+            if field.message_type.full_name not in parents:
+                columns.extend(messageColumns(field.message_type, prefix + field.name + ".",
+                                              parents + (descriptor.full_name,)))
+        elif field.type in _NUMPY_TYPES:
+            columns.append((prefix + field.name, _NUMPY_TYPES[field.type]))
+    return columns
+
+
+class _Export:
+    """Columns of one message type while they are written"""
+
+    def __init__(self, path, messageType, rows):
+        self.path = path
+        self.message = messageType()
+        fields = messageColumns(messageType.DESCRIPTOR)
+        names = [name for name, numpyType in fields]
+        # the time stamps move aside if the message has fields with the same names
+        timeColumns = [name if name not in names else "container." + name for name in TIME_COLUMNS]
+        self.dtype = np.dtype([(name, '<i8') for name in timeColumns] + fields)
+        if not names:
+            self.getter = lambda msg: ()
+        elif len(names) == 1:
+            getter = attrgetter(names[0])
+            self.getter = lambda msg: (getter(msg),)
+        else:
+            self.getter = attrgetter(*names)
+        self.rows = rows
+        self.array = open_memmap(path, mode='w+', dtype=self.dtype, shape=(rows,)) if rows else None
+        self.chunk = list()
+        self.written = 0
+        self.errors = 0
+
+    def flush(self):
+        if self.chunk:
+            self.array[self.written:self.written + len(self.chunk)] = np.array(self.chunk, dtype=self.dtype)
+            self.written += len(self.chunk)
+            self.chunk = list()
+
+    def close(self):
+        self.flush()
+        if self.array is None:
+            np.save(self.path, np.zeros(0, dtype=self.dtype))
+            return
+        self.array.flush()
+        if self.written < self.rows:
+            # broken messages were left out, the file has to shrink
+            array = self.array
+            self.array = None
+            temporary = self.path + ".tmp"
+            shrunk = open_memmap(temporary, mode='w+', dtype=self.dtype, shape=(self.written,))
+            for start in range(0, self.written, 1 << 20):
+                stop = min(start + (1 << 20), self.written)
+                shrunk[start:stop] = array[start:stop]
+            shrunk.flush()
+            del shrunk, array
+            os.rename(temporary, self.path)
+        self.array = None
+
+
+def _recordingState(path):
+    stat = os.stat(path)
+    return stat.st_size, int(stat.st_mtime)
+
+
+def _loadMeta(path, state):
+    try:
+        with open(os.path.join(columnsPath(path), META_FILE), 'r') as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return dict()
+    if meta.get('version') != META_VERSION or [meta.get('size'), meta.get('mtime')] != list(state):
+        return dict()
+    return meta.get('types', dict())
+
+
+def _schema(messageType):
+    # round trip through json, so it compares equal to the stored one
+    fields = messageColumns(messageType.DESCRIPTOR)
+    return json.loads(json.dumps(dict(message=messageType.DESCRIPTOR.full_name, columns=fields)))
+
+
+def exportColumns(path, protoDict, dataTypes=None, chunkSize=65536, writeIndex=True):
+    """
+    Decodes the messages of a recording into one .npy file per message type, see loadColumns().
+    The recording is read once in file order, the memory use is bounded by chunkSize rows per type.
+
+    Parameters
+    ----------
+    path : string
+        path of the .rec file
+    protoDict : dict
+        message identifier --> message class, e.g. node.proto_dict
+    dataTypes : iterable
+        message identifiers to export, None exports all known types in the recording
+    chunkSize : int
+        number of rows decoded before they are written
+    writeIndex : bool
+        store the sidecar index of the recording, which is needed to count the rows
+
+    Returns
+    -------
+    dict
+        message identifier --> number of exported rows
+    """
+    state = _recordingState(path)
+    index = openIndex(path, writeIndex)
+    counts = dict()
+    for dataType in index.dataTypes:
+        counts[dataType] = counts.get(dataType, 0) + 1
+    if dataTypes is None:
+        dataTypes = [dataType for dataType in counts if dataType in protoDict]
+    folder = columnsPath(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    meta = _loadMeta(path, state)
+
+    exports = dict()
+    for dataType in dataTypes:
+        if dataType not in protoDict:
+            Logger.logWarn("Message ID " + str(dataType) + " unknown, it is not exported!")
+            continue
+        exports[dataType] = _Export(os.path.join(folder, str(dataType) + ".npy"), protoDict[dataType],
+                                    counts.get(dataType, 0))
+        meta.pop(str(dataType), None)
+
+    container = protoDict[0]()
+    with RecordingReader(path) as reader:
+        buf = None
+        for offset, dataType in zip(index.offsets, index.dataTypes):
+            export = exports.get(dataType)
+            if export is None:
+                continue
+            buf = reader.read(offset)
+            try:
+                parseContainer(container, buf)
+                export.message.ParseFromString(container.serializedData)
+            except Exception:
+                export.errors += 1
+                continue
+            sent = container.sent
+            received = container.received
+            export.chunk.append((sent.seconds * 1000000000 + sent.microseconds * 1000,
+                                 received.seconds * 1000000000 + received.microseconds * 1000) +
+                                export.getter(export.message))
+            if len(export.chunk) >= chunkSize:
+                export.flush()
+        # the mapping can only be closed without views onto it
+        buf = None
+
+    rows = dict()
+    for dataType, export in exports.items():
+        export.close()
+        if export.errors:
+            Logger.logWarn(str(export.errors) + " messages with ID " + str(dataType) + " are broken, they are left out!")
+        rows[dataType] = export.written
+        schema = _schema(protoDict[dataType])
+        schema['rows'] = export.written
+        meta[str(dataType)] = schema
+    # the recording state is only stored once all columns are written
+    with open(os.path.join(folder, META_FILE), 'w') as f:
+        json.dump(dict(version=META_VERSION, size=state[0], mtime=state[1], types=meta), f)
+    return rows
+
+
+def loadColumns(path, protoDict, dataTypes=None, mmap=True, writeIndex=True):
+    """
+    Returns the messages of a recording as NumPy structured arrays, one row per container. The columns are exported
+    on the first use and whenever the recording or the message definition changed, afterwards the arrays are mapped
+    from the .npy files without reading them.
+
+        columns = loadColumns("drive.rec", node.proto_dict, [19])
+        wgs84 = columns[19]
+        seconds = (wgs84['sent'] - wgs84['sent'][0]) / 1e9
+        latitude = wgs84['latitude']
+
+    Parameters
+    ----------
+    path : string
+        path of the .rec file
+    protoDict : dict
+        message identifier --> message class, e.g. node.proto_dict
+    dataTypes : iterable
+        message identifiers to load, None loads all known types in the recording
+    mmap : bool
+        map the arrays read only instead of reading them into memory
+    writeIndex : bool
+        store the sidecar index of the recording
+
+    Returns
+    -------
+    dict
+        message identifier --> structured array with the columns sent, received (nanoseconds) and the message fields
+    """
+    if dataTypes is None:
+        dataTypes = sorted(dataType for dataType in set(openIndex(path, writeIndex).dataTypes)
+                           if dataType in protoDict)
+    meta = _loadMeta(path, _recordingState(path))
+    stale = [dataType for dataType in dataTypes
+             if dataType in protoDict and (str(dataType) not in meta or
+                                           dict(meta[str(dataType)], rows=None) !=
+                                           dict(_schema(protoDict[dataType]), rows=None))]
+    if stale:
+        exportColumns(path, protoDict, stale, writeIndex=writeIndex)
+        meta = _loadMeta(path, _recordingState(path))
+    columns = dict()
+    for dataType in dataTypes:
+        if str(dataType) not in meta:
+            continue
+        file = os.path.join(columnsPath(path), str(dataType) + ".npy")
+        # empty files can't be mapped
+        columns[dataType] = np.load(file, mmap_mode='r' if mmap and meta[str(dataType)]['rows'] else None)
+    return columns
@@ -0,0 +1,319 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Block compressed recordings
+
+A compressed recording starts with a file header (b"ODRZ", version, codec, reserved) followed by blocks. Every block
+holds a run of complete containers in the plain .rec format, compressed on its own:
+
+    codec (uint8), compressed size (uint32), uncompressed size (uint32), compressed data
+
+Codec 0 marks a block stored uncompressed, e.g. since it held already compressed images. Offsets into a compressed
+recording, as used by the sidecar index and the readers, count the uncompressed bytes, so they are the same as in the
+plain recording. A truncated last block is ignored, like a truncated last container of a plain recording.
+
+zlib and lzma come with python, zstd and lz4 are used if the zstandard and lz4 packages are installed.
+"""
+
+import os
+import shutil
+import struct
+import time
+import zlib
+
+COMPRESSED_MAGIC = b"ODRZ"
+COMPRESSED_VERSION = 1
+FILE_HEADER = struct.Struct('<4sBBH')
+BLOCK_HEADER = struct.Struct('<BLL')
+STORED = 0
+
+
+class Codec:
+    """Compression method of the blocks"""
+
+    def __init__(self, name, identifier, defaultLevel, compress, decompress):
+        self.name = name
+        self.identifier = identifier
+        self.defaultLevel = defaultLevel
+        self.compress = compress  # compress(data, level)
+        self.decompress = decompress  # decompress(data, uncompressed size)
+
+
+def _zlibCodec():
+    return Codec('zlib', 1, 6, zlib.compress, lambda data, size: zlib.decompress(data))
+
+
+def _lzmaCodec():
+    import lzma
+    return Codec('lzma', 2, 6, lambda data, level: lzma.compress(data, preset=level),
+                 lambda data, size: lzma.decompress(data))
+
+
+def _zstdCodec():
+    import zstandard
+    decompressor = zstandard.ZstdDecompressor()
+    return Codec('zstd', 3, 3, lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+                 lambda data, size: decompressor.decompress(data, max_output_size=size))
+
+
+def _lz4Codec():
+    import lz4.block
+    # levels above 0 select the slower high compression mode
+    return Codec('lz4', 4, 0, lambda data, level: lz4.block.compress(
+        data, mode='high_compression' if level > 0 else 'default', compression=level, store_size=False),
+                 lambda data, size: lz4.block.decompress(data, uncompressed_size=size))
+
+
+CODECS = dict()
+for _factory in (_zlibCodec, _lzmaCodec, _zstdCodec, _lz4Codec):
+    try:
+        _codec = _factory()
+    except ImportError:
+        # the optional codecs are missing
+        continue
+    CODECS[_codec.name] = CODECS[_codec.identifier] = _codec
+del _factory, _codec
+
+
+def getCodec(codec):
+    """
+    returns the Codec with the given name or identifier, raises a ValueError if it is unknown or not installed
+    """
+    try:
+        return CODECS[codec]
+    except KeyError:
+        raise ValueError("Compression " + str(codec) + " is not available, choose one of " +
+                         ", ".join(sorted(name for name in CODECS if not isinstance(name, int))))
+
+
+def isCompressed(buf):
+    """
+    returns whether buf, the start of a recording, is the file header of a compressed recording
+    """
+    return bytes(buf[:len(COMPRESSED_MAGIC)]) == COMPRESSED_MAGIC
+
+
+def readFileHeader(buf):
+    """
+    returns the Codec of the compressed recording starting in buf
+    """
+    magic, version, codec, reserved = FILE_HEADER.unpack_from(buf)
+    if version != COMPRESSED_VERSION:
+        raise ValueError("Compressed recording version " + str(version) + " is not supported!")
+    return getCodec(codec)
+
+
+def readBlockIndex(buf, size):
+    """
+    Walks the block headers of a compressed recording.
+
+    Parameters
+    ----------
+    buf : mmap
+        the recording
+    size : int
+        its size
+
+    Returns
+    -------
+    tuple
+        (file offsets of the block headers, uncompressed offsets of the blocks, uncompressed size, file offset behind
+        the last complete block)
+    """
+    offsets = list()
+    starts = list()
+    position = FILE_HEADER.size
+    start = 0
+    while position + BLOCK_HEADER.size <= size:
+        codec, compressedSize, rawSize = BLOCK_HEADER.unpack_from(buf, position)
+        if position + BLOCK_HEADER.size + compressedSize > size:
+            break
+        offsets.append(position)
+        starts.append(start)
+        position += BLOCK_HEADER.size + compressedSize
+        start += rawSize
+    return offsets, starts, start, position
+
+
+def decompressBlock(buf, offset):
+    """
+    returns the uncompressed data of the block at the given file offset, stored blocks are returned as slice of buf
+    """
+    codec, compressedSize, rawSize = BLOCK_HEADER.unpack_from(buf, offset)
+    start = offset + BLOCK_HEADER.size
+    data = buf[start:start + compressedSize]
+    if codec == STORED:
+        return data
+    data = getCodec(codec).decompress(data, rawSize)
+    if len(data) != rawSize:
+        raise ValueError("Block at offset " + str(offset) + " is corrupt!")
+    return data
+
+
+class BlockWriter:
+    """Writes blocks of containers into a compressed recording"""
+
+    def __init__(self, file, codec='zlib', level=None, append=False):
+        """
+        Parameters
+        ----------
+        file : file
+            file opened for binary writing
+        codec : string
+            zlib, lzma, zstd or lz4
+        level : int
+            compression level, None for the default of the codec
+        append : bool
+            the file already holds a compressed recording of the same codec, the file header is not written
+        """
+        self.file = file
+        self.codec = getCodec(codec)
+        self.level = self.codec.defaultLevel if level is None else level
+        if not append:
+            file.write(FILE_HEADER.pack(COMPRESSED_MAGIC, COMPRESSED_VERSION, self.codec.identifier, 0))
+        self.rawBytes = 0
+        self.compressedBytes = 0
+
+    def write(self, data):
+        """
+        Compresses data, complete containers including their headers, into one block and writes it.
+
+        Returns
+        -------
+        int
+            number of bytes written
+        """
+        if not data:
+            return 0
+        compressed = self.codec.compress(data, self.level)
+        codec = self.codec.identifier
+        if len(compressed) >= len(data):
+            # incompressible, e.g. images which are already compressed
+            compressed = data
+            codec = STORED
+        self.file.write(BLOCK_HEADER.pack(codec, len(compressed), len(data)))
+        self.file.write(compressed)
+        self.rawBytes += len(data)
+        self.compressedBytes += BLOCK_HEADER.size + len(compressed)
+        return BLOCK_HEADER.size + len(compressed)
+
+
+def convertRecording(source, target, compression='zlib', level=None, blockSize=1024 * 1024, index=True):
+    """
+    Converts a recording between the plain and the compressed format, or between codecs.
+
+    Parameters
+    ----------
+    source : string
+        recording to read, plain or compressed
+    target : string
+        recording to write, an existing file is replaced
+    compression : string
+        codec of the target, None writes a plain recording
+    level : int
+        compression level, None for the default of the codec
+    blockSize : int
+        uncompressed size of the blocks, larger blocks compress better, smaller ones seek faster. The blocks of
+        compressed sources are kept.
+    index : bool
+        write the sidecar index of the target, which is the same as the one of the source
+
+    Returns
+    -------
+    tuple
+        (uncompressed bytes, bytes written)
+    """
+    from internal.recindex import IndexWriter, indexPath, openIndex
+    from internal.recreader import RecordingReader
+
+    total = 0
+    with RecordingReader(source) as reader, open(target, 'wb') as out:
+        writer = BlockWriter(out, compression, level) if compression is not None else None
+        for offset, data in reader.chunks(blockSize):
+            if writer is not None:
+                writer.write(data)
+            else:
+                out.write(data)
+            total += len(data)
+        data = None
+        written = out.tell()
+    if index:
+        # the offsets count uncompressed bytes, so both formats share the index
+        rows = openIndex(source)
+        if os.path.exists(indexPath(source)):
+            shutil.copyfile(indexPath(source), indexPath(target))
+        else:
+            indexWriter = IndexWriter(indexPath(target))
+            indexWriter.extend(rows)
+            indexWriter.close()
+    return total, written
+
+
+def benchmarkCodecs(source, codecs=None, blockSize=1024 * 1024, limit=None):
+    """
+    Measures compression ratio and throughput of the codecs on the blocks of a recording, in memory.
+
+    Parameters
+    ----------
+    source : string
+        recording to read, plain or compressed
+    codecs : iterable
+        (codec name, level) pairs, None measures every installed codec with its default level
+    blockSize : int
+        uncompressed size of the blocks of plain sources
+    limit : int
+        only use the first limit uncompressed bytes
+
+    Returns
+    -------
+    list
+        one dict per codec with codec, level, rawBytes, compressedBytes, ratio and the compression and decompression
+        throughput in MB/s
+    """
+    from internal.recreader import RecordingReader
+
+    if codecs is None:
+        codecs = [(name, None) for name in sorted(name for name in CODECS if not isinstance(name, int))]
+    results = [dict(codec=name, level=getCodec(name).defaultLevel if level is None else level, rawBytes=0,
+                    compressedBytes=0, compressTime=0.0, decompressTime=0.0) for name, level in codecs]
+
+    def measure(data):
+        for result in results:
+            codec = getCodec(result['codec'])
+            started = time.time()
+            compressed = codec.compress(data, result['level'])
+            middle = time.time()
+            codec.decompress(compressed, len(data))
+            result['compressTime'] += middle - started
+            result['decompressTime'] += time.time() - middle
+            result['rawBytes'] += len(data)
+            result['compressedBytes'] += BLOCK_HEADER.size + min(len(compressed), len(data))
+
+    total = 0
+    with RecordingReader(source) as reader:
+        for offset, data in reader.chunks(blockSize):
+            measure(data)
+            total += len(data)
+            if limit is not None and total >= limit:
+                break
+        data = None
+
+    for result in results:
+        result['ratio'] = result['rawBytes'] / float(max(1, result['compressedBytes']))
+        result['compressSpeed'] = result['rawBytes'] / 1e6 / max(1e-9, result.pop('compressTime'))
+        result['decompressSpeed'] = result['rawBytes'] / 1e6 / max(1e-9, result.pop('decompressTime'))
+    return results
@@ -0,0 +1,70 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Keyed serial dispatching on top of the DVnode worker threads"""
+
+import traceback
+
+from internal.logger import Logger
+
+
+class KeyedSerialDispatcher:
+    """Lets several worker threads consume one queue while items with equal keys are handled one after another
+
+    The queue keeps the pending items of every key in their own FIFO and only hands out items whose key isn't handled
+    by another thread, see ContainerQueue.getOrdered(). The items of busy keys stay queued in their order, so they
+    still count against the size of the queue and its policy decides what is dropped when the callbacks can't keep
+    up. Items with different keys still run in parallel.
+    """
+
+    def __init__(self, queue, key=None):
+        """
+        Parameters
+        ----------
+        queue : ContainerQueue
+            queue to consume, it's switched to ordered mode
+        key : function
+            returns the ordering key of an item, defaults to the dataType of the container
+        """
+        self.queue = queue
+        self.key = key if key is not None else (lambda container: container.dataType)
+        queue.orderBy(self.key)
+
+    @property
+    def deferred(self):
+        """
+        number of items which had to wait because an item with the same key was handled at the time they arrived
+        """
+        return self.queue.deferred
+
+    def work(self, handler):
+        """
+        Worker thread loop, never returns.
+
+        Parameters
+        ----------
+        handler : function
+            called with every item
+        """
+        while True:
+            key, item = self.queue.getOrdered()
+            try:
+                handler(item)
+            except Exception:
+                Logger.logError("Exception in callback:\n" + traceback.format_exc())
+            finally:
+                self.queue.release(key)
@@ -0,0 +1,238 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Chunked transport of containers which don't fit into one datagram
+
+A fragment datagram starts with 0x0D like an OpenDaVINCI datagram, but is marked with 0xA5 instead of 0xA4, so
+receivers without fragment support ignore it. The header is followed by a slice of the serialized container:
+
+    0x0D, 0xA5, sender (uint32), sequence (uint32), offset (uint32), container size (uint32)
+
+sender is a random number identifying the publishing node, sequence counts the fragmented containers of a sender.
+"""
+
+import bisect
+import struct
+from collections import OrderedDict
+
+FRAGMENT_MARKER = 0xA5
+FRAGMENT_HEADER = struct.Struct('<BBLLLL')
+# number of completed or given up containers whose late fragments are recognized
+FINISHED_LIMIT = 4096
+
+
+def isFragment(buf):
+    """
+    returns whether the datagram in buf is a fragment, buf needs to be a bytearray or memoryview in python 2
+    """
+    return buf[0] == 0x0D and buf[1] == FRAGMENT_MARKER
+
+
+def fragments(payload, sender, sequence, fragmentSize):
+    """
+    Splits a serialized container into fragments.
+
+    Parameters
+    ----------
+    payload : bytes
+        serialized container
+    sender : int
+        identifier of the publishing node
+    sequence : int
+        sequence number of the container
+    fragmentSize : int
+        maximum datagram size including the fragment header
+
+    Returns
+    -------
+    list
+        (header, slice of the payload) per fragment, the slices are memoryviews
+    """
+    view = memoryview(payload)
+    total = len(payload)
+    step = fragmentSize - FRAGMENT_HEADER.size
+    assert step > 0
+    return [(FRAGMENT_HEADER.pack(0x0D, FRAGMENT_MARKER, sender, sequence, offset, total), view[offset:offset + step])
+            for offset in range(0, total, step)]
+
+
+class _PendingContainer:
+    __slots__ = ('data', 'total', 'starts', 'ends', 'received', 'started')
+
+    def __init__(self, total, started):
+        self.data = bytearray(total)
+        self.total = total
+        # sorted offsets of the received fragments and their ends, the fragments never overlap
+        self.starts = list()
+        self.ends = dict()
+        self.received = 0
+        self.started = started
+
+
+class Reassembler:
+    """Collects the fragments of the containers of all senders
+
+    The memory is bounded: each sender has at most maxPending incomplete containers and all of them together at most
+    maxBytes, the oldest incomplete container is given up first. Containers not completed within the timeout are
+    given up as well. All of them are counted as incomplete. Fragments which don't match the size of their container
+    or overlap fragments received before are counted as malformed and dropped. Fragments of the last FINISHED_LIMIT
+    containers which were completed or given up are counted as late and dropped, so they don't start a new one.
+    """
+
+    def __init__(self, timeout=1.0, maxPending=4, maxBytes=64 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+        timeout : float
+            seconds after the first fragment until an incomplete container is given up
+        maxPending : int
+            maximum number of incomplete containers per sender
+        maxBytes : int
+            maximum size of all incomplete containers together, larger containers are rejected right away
+        """
+        self.timeout = timeout
+        self.timeoutNs = int(timeout * 1e9)
+        self.maxPending = maxPending
+        self.maxBytes = maxBytes
+        self.pending = OrderedDict()
+        self.pendingPerSender = dict()
+        self.pendingBytes = 0
+        # (sender, sequence) of the completed and given up containers, oldest first
+        self.finished = OrderedDict()
+        self.lastExpiry = 0
+        self.completed = 0
+        self.incomplete = 0
+        self.duplicates = 0
+        self.malformed = 0
+        self.late = 0
+
+    def add(self, buf, nbytes, now):
+        """
+        Stores one fragment.
+
+        Parameters
+        ----------
+        buf : bytes
+            fragment datagram, header included
+        nbytes : int
+            size of the datagram
+        now : int
+            monotonic time in nanoseconds
+
+        Returns
+        -------
+        bytearray
+            the serialized container if this was its last missing fragment, otherwise None
+        """
+        if now - self.lastExpiry >= self.timeoutNs // 4:
+            self.expire(now)
+        if nbytes < FRAGMENT_HEADER.size:
+            self.malformed += 1
+            return None
+        sender, sequence, offset, total = FRAGMENT_HEADER.unpack_from(buf)[2:]
+        length = nbytes - FRAGMENT_HEADER.size
+        if length <= 0 or offset + length > total or total > self.maxBytes:
+            self.malformed += 1
+            return None
+        key = (sender, sequence)
+        if key in self.finished:
+            self.late += 1
+            return None
+        container = self.pending.get(key)
+        if container is None:
+            container = self.__start(key, total, now)
+        elif total != container.total:
+            self.malformed += 1
+            return None
+        end = offset + length
+        i = bisect.bisect_right(container.starts, offset)
+        if (i and container.ends[container.starts[i - 1]] > offset) or \
+                (i < len(container.starts) and container.starts[i] < end):
+            # only complete coverage may complete a container, overlapping fragments never come from fragments()
+            if container.ends.get(offset) == end:
+                self.duplicates += 1
+            else:
+                self.malformed += 1
+            return None
+        container.data[offset:end] = buf[FRAGMENT_HEADER.size:nbytes]
+        container.starts.insert(i, offset)
+        container.ends[offset] = end
+        container.received += length
+        if container.received < total:
+            return None
+        self.__finish(key)
+        self.completed += 1
+        return container.data
+
+    def __start(self, key, total, now):
+        sender = key[0]
+        if self.pendingPerSender.get(sender, 0) >= self.maxPending:
+            for oldest in self.pending:
+                if oldest[0] == sender:
+                    self.__giveUp(oldest)
+                    break
+        while self.pending and self.pendingBytes + total > self.maxBytes:
+            self.__giveUp(next(iter(self.pending)))
+        container = self.pending[key] = _PendingContainer(total, now)
+        self.pendingPerSender[sender] = self.pendingPerSender.get(sender, 0) + 1
+        self.pendingBytes += total
+        return container
+
+    def __remove(self, key):
+        container = self.pending.pop(key)
+        self.pendingBytes -= container.total
+        count = self.pendingPerSender[key[0]] - 1
+        if count:
+            self.pendingPerSender[key[0]] = count
+        else:
+            del self.pendingPerSender[key[0]]
+
+    def __finish(self, key):
+        self.__remove(key)
+        self.finished[key] = None
+        if len(self.finished) > FINISHED_LIMIT:
+            self.finished.popitem(last=False)
+
+    def __giveUp(self, key):
+        self.__finish(key)
+        self.incomplete += 1
+
+    def expire(self, now):
+        """
+        Gives up the containers not completed within the timeout. add() does so regularly, the receiver should
+        call it as well while no fragments arrive.
+
+        Parameters
+        ----------
+        now : int
+            monotonic time in nanoseconds
+        """
+        self.lastExpiry = now
+        # the containers are ordered by their first fragment
+        while self.pending:
+            key, container = next(iter(self.pending.items()))
+            if now - container.started < self.timeoutNs:
+                break
+            self.__giveUp(key)
+
+    def counters(self):
+        """
+        returns a dict with the number of completed, incomplete (given up) and pending containers as well as the
+        number of duplicate, malformed and late fragments
+        """
+        return dict(completed=self.completed, incomplete=self.incomplete, pending=len(self.pending),
+                    duplicates=self.duplicates, malformed=self.malformed, late=self.late)
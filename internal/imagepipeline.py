@@ -0,0 +1,169 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Delivery of shared images on dedicated threads, keeping only the newest frame of every stream"""
+
+import threading
+import traceback
+from collections import deque, namedtuple
+
+from internal.logger import Logger
+from internal.timestamps import monotonicNs, wallNs
+
+ImageStreamSnapshot = namedtuple('ImageStreamSnapshot', [
+    'name',  # image stream name
+    'received',  # frames received since start
+    'delivered',  # frames handed to the callback
+    'skipped',  # frames replaced by a newer one before the callback could take them
+    'fps',  # smoothed rate of delivered frames per second
+    'latency',  # smoothed time between arrival and return of the callback in seconds
+    'maxLatency',
+    'endToEnd',  # smoothed time between sending and return of the callback in seconds, needs synchronized clocks
+])
+
+
+class _ImageStream:
+    __slots__ = ('received', 'delivered', 'skipped', 'lastDelivery', 'interval', 'latency', 'maxLatency',
+                 'endToEnd')
+
+    def __init__(self):
+        self.received = 0
+        self.delivered = 0
+        self.skipped = 0
+        self.lastDelivery = None
+        self.interval = None
+        self.latency = None
+        self.maxLatency = None
+        self.endToEnd = None
+
+
+class ImagePipeline:
+    """Hands the frames of every image stream to a handler on its own threads
+
+    Each stream has a single slot holding its newest frame, a frame arriving while the slot is still occupied replaces
+    the old one, which is counted as skipped. Frames of one stream are never handled concurrently, so a slow callback
+    only delays its own stream and never the other messages.
+    """
+
+    def __init__(self, handler, threads=1, gain=1.0 / 16):
+        """
+        Parameters
+        ----------
+        handler : function
+            called with every delivered item
+        threads : int
+            number of delivery threads, more than one only helps with several streams
+        gain : float
+            smoothing factor of fps and latencies
+        """
+        self.handler = handler
+        self.gain = gain
+        self.condition = threading.Condition(threading.Lock())
+        self.slots = dict()
+        self.ready = deque()
+        self.active = set()
+        self.streams = dict()
+        self.threads = list()
+        for i in range(threads):
+            worker = threading.Thread(target=self.__work)
+            worker.setDaemon(True)
+            worker.start()
+            self.threads.append(worker)
+
+    def offer(self, name, item, arrival, sent=None):
+        """
+        Stores the newest frame of a stream, called by the receive thread.
+
+        Parameters
+        ----------
+        name : string
+            image stream name
+        item : object
+            handed to the handler
+        arrival : tuple
+            (monotonic, wall clock) arrival time in nanoseconds
+        sent : int
+            sent time stamp of the frame in nanoseconds, None to skip the end to end latency
+        """
+        with self.condition:
+            stream = self.streams.get(name)
+            if stream is None:
+                stream = self.streams[name] = _ImageStream()
+            stream.received += 1
+            if name in self.slots:
+                stream.skipped += 1
+            elif name not in self.active:
+                self.ready.append(name)
+                self.condition.notify()
+            self.slots[name] = (item, arrival, sent)
+
+    def __work(self):
+        while True:
+            with self.condition:
+                while not self.ready:
+                    self.condition.wait()
+                name = self.ready.popleft()
+                item, arrival, sent = self.slots.pop(name)
+                self.active.add(name)
+
+            try:
+                self.handler(item)
+            except Exception:
+                Logger.logError("Exception in image callback:\n" + traceback.format_exc())
+            done = monotonicNs()
+            doneTime = wallNs()
+
+            with self.condition:
+                self.__account(self.streams[name], arrival, sent, done, doneTime)
+                self.active.discard(name)
+                if name in self.slots:
+                    self.ready.append(name)
+                    self.condition.notify()
+
+    def __account(self, stream, arrival, sent, done, doneTime):
+        stream.delivered += 1
+        if stream.lastDelivery is not None:
+            interval = (done - stream.lastDelivery) / 1e9
+            if stream.interval is None:
+                stream.interval = interval
+            else:
+                stream.interval += (interval - stream.interval) * self.gain
+        stream.lastDelivery = done
+
+        latency = (done - arrival[0]) / 1e9
+        if stream.latency is None:
+            stream.latency = stream.maxLatency = latency
+        else:
+            stream.latency += (latency - stream.latency) * self.gain
+            stream.maxLatency = max(stream.maxLatency, latency)
+
+        if sent:
+            endToEnd = (doneTime - sent) / 1e9
+            if stream.endToEnd is None:
+                stream.endToEnd = endToEnd
+            else:
+                stream.endToEnd += (endToEnd - stream.endToEnd) * self.gain
+
+    def snapshots(self):
+        """
+        returns a dict stream name --> ImageStreamSnapshot
+        """
+        with self.condition:
+            return dict((name, ImageStreamSnapshot(name, stream.received, stream.delivered, stream.skipped,
+                                                   1.0 / stream.interval if stream.interval else 0.0, stream.latency,
+                                                   stream.maxLatency, stream.endToEnd))
+                        for name, stream in self.streams.items())
@@ -0,0 +1,201 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Latency profiling of the DVnode callbacks"""
+
+import threading
+from collections import namedtuple
+
+from internal.logger import Logger
+from internal.timestamps import monotonicNs
+
+CallbackProfileSnapshot = namedtuple('CallbackProfileSnapshot', [
+    'name',  # callback name, e.g. "19:myCallback"
+    'count',  # number of calls
+    'overBudget',  # number of calls which took longer than the budget
+    'wait',  # HistogramSnapshot of the time between arrival and dispatch
+    'parse',  # HistogramSnapshot of the decoding time
+    'callback',  # HistogramSnapshot of the callback execution time
+])
+
+HistogramSnapshot = namedtuple('HistogramSnapshot', ['count', 'mean', 'p50', 'p90', 'p99', 'p999', 'max'])
+
+
+def callbackName(func):
+    """
+    returns a readable name of a callback function
+    """
+    return getattr(func, '__name__', None) or repr(func)
+
+
+class Histogram:
+    """Log-linear histogram of integer values in the style of HdrHistogram
+
+    Every power of two is split into 2 ** subBucketBits buckets, so a recorded value is reproduced with a relative
+    error below 2 ** -subBucketBits.
+    """
+
+    def __init__(self, subBucketBits=4, maxBits=44):
+        self.subBucketBits = subBucketBits
+        self.subBuckets = 1 << subBucketBits
+        self.counts = [0] * ((maxBits - subBucketBits + 1) * self.subBuckets)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def __index(self, value):
+        if value < self.subBuckets:
+            return value
+        shift = value.bit_length() - self.subBucketBits - 1
+        return min((shift + 1) * self.subBuckets + (value >> shift) - self.subBuckets, len(self.counts) - 1)
+
+    def __highestEquivalent(self, index):
+        if index < self.subBuckets:
+            return index
+        shift = index // self.subBuckets - 1
+        sub = index % self.subBuckets + self.subBuckets
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.counts[self.__index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        returns the smallest recorded value (within the histogram precision) which is >= percent % of all values
+        """
+        if not self.count:
+            return 0
+        threshold = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(self.__highestEquivalent(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        mean = self.total / float(self.count) if self.count else 0.0
+        return HistogramSnapshot(self.count, mean, self.percentile(50), self.percentile(90), self.percentile(99),
+                                 self.percentile(99.9), self.max)
+
+
+class ProfilerHook:
+    """Base class of telemetry exporters, override the methods you are interested in
+
+    The hooks are called from the worker threads, so keep them short.
+    """
+
+    def onSample(self, name, waitNs, parseNs, callbackNs):
+        """called after every callback with the measured times in nanoseconds"""
+        pass
+
+    def onSlowCallbacks(self, snapshots):
+        """called together with the rate limited slow callback report with a list of CallbackProfileSnapshots"""
+        pass
+
+
+class _CallbackProfile:
+    __slots__ = ('name', 'wait', 'parse', 'callback', 'overBudget', 'reportedOverBudget')
+
+    def __init__(self, name):
+        self.name = name
+        self.wait = Histogram()
+        self.parse = Histogram()
+        self.callback = Histogram()
+        self.overBudget = 0
+        self.reportedOverBudget = 0
+
+    def snapshot(self):
+        return CallbackProfileSnapshot(self.name, self.callback.count, self.overBudget, self.wait.snapshot(),
+                                       self.parse.snapshot(), self.callback.snapshot())
+
+
+class CallbackProfiler:
+    """Records wait, parse and execution time of every callback and reports callbacks exceeding a time budget"""
+
+    def __init__(self, budget=0.01, reportInterval=5.0, hooks=()):
+        """
+        Parameters
+        ----------
+        budget : float
+            maximum callback execution time in seconds, slower calls are reported
+        reportInterval : float
+            minimum time between two slow callback reports in seconds
+        hooks : iterable
+            ProfilerHook instances receiving the measurements
+        """
+        self.budgetNs = int(budget * 1e9)
+        self.reportIntervalNs = int(reportInterval * 1e9)
+        self.hooks = list(hooks)
+        self.profiles = dict()
+        self.lock = threading.Lock()
+        self.lastReport = 0
+
+    def record(self, name, waitNs, parseNs, callbackNs):
+        """
+        Accounts one callback execution, all times in nanoseconds.
+        """
+        with self.lock:
+            profile = self.profiles.get(name)
+            if profile is None:
+                profile = self.profiles[name] = _CallbackProfile(name)
+            profile.wait.record(waitNs)
+            profile.parse.record(parseNs)
+            profile.callback.record(callbackNs)
+            report = None
+            if callbackNs > self.budgetNs:
+                profile.overBudget += 1
+                now = monotonicNs()
+                if now - self.lastReport >= self.reportIntervalNs:
+                    self.lastReport = now
+                    report = self.__collectSlow()
+        for hook in self.hooks:
+            hook.onSample(name, waitNs, parseNs, callbackNs)
+        if report:
+            self.__report(report)
+
+    def __collectSlow(self):
+        slow = list()
+        for profile in self.profiles.values():
+            if profile.overBudget != profile.reportedOverBudget:
+                profile.reportedOverBudget = profile.overBudget
+                slow.append(profile.snapshot())
+        return slow
+
+    def __report(self, slow):
+        line = "Slow callbacks (budget " + str(round(self.budgetNs / 1e6, 3)) + " ms):"
+        for snapshot in slow:
+            line += "\n  " + snapshot.name + ": p50 " + str(round(snapshot.callback.p50 / 1e6, 3)) + " ms, p99 " + \
+                    str(round(snapshot.callback.p99 / 1e6, 3)) + " ms, max " + \
+                    str(round(snapshot.callback.max / 1e6, 3)) + " ms, queue wait p99 " + \
+                    str(round(snapshot.wait.p99 / 1e6, 3)) + " ms, " + str(snapshot.overBudget) + " of " + \
+                    str(snapshot.count) + " calls over budget"
+        Logger.logWarn(line)
+        for hook in self.hooks:
+            hook.onSlowCallbacks(slow)
+
+    def snapshots(self):
+        """
+        returns a dict callback name --> CallbackProfileSnapshot, times in nanoseconds
+        """
+        with self.lock:
+            return dict((name, profile.snapshot()) for name, profile in self.profiles.items())
@@ -0,0 +1,366 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Receive queue policies of the DVnode
+
+All queues are thread safe, put() never blocks and returns False if the new entry was dropped, get() blocks until
+an entry is available. Every dropped entry is counted for its dataType.
+"""
+
+import heapq
+import threading
+from collections import deque
+from operator import attrgetter
+
+
+class _Entry:
+    """A pending item, dropped and taken entries are only marked dead and skipped later"""
+
+    __slots__ = ('sequence', 'dataType', 'item', 'lane', 'key', 'alive')
+
+    def __init__(self, sequence, dataType, item, lane):
+        self.sequence = sequence
+        self.dataType = dataType
+        self.item = item
+        self.lane = lane
+        self.key = None
+        self.alive = True
+
+
+class ContainerQueue:
+    """Base class of all receive queues, subclasses implement the policy in _push with _append and _remove
+
+    The entries are kept in FIFO lanes, get() serves lane 0 first. After orderBy() the queue additionally keeps the
+    pending entries of every key in their own FIFO, see getOrdered().
+    """
+
+    def __init__(self, maxsize, lanes=1):
+        self.maxsize = maxsize
+        self.condition = threading.Condition()
+        self.dropCounts = dict()
+        self.dropped = 0
+        self.lanes = [deque() for _ in range(lanes)]
+        self.laneSizes = [0] * lanes
+        self.size = 0
+        self.sequence = 0
+
+        # ordered mode, see orderBy()
+        self.key = None
+        # key --> deque of its entries
+        self.keys = dict()
+        # per lane a heap of (sequence, key) of the keys which are ready, by the next entry of the key
+        self.ready = [list() for _ in range(lanes)]
+        # key --> sequence it is queued with in ready, stale heap entries are skipped
+        self.readySequence = dict()
+        self.busy = set()
+        self.deferred = 0
+
+    def put(self, dataType, item):
+        """
+        Adds an item, never blocks.
+
+        Parameters
+        ----------
+        dataType : int
+            message identifier of the item, used by the policies and for the drop accounting
+        item : object
+            usually the received container
+
+        Returns
+        -------
+        bool
+            False if the item itself was dropped
+        """
+        with self.condition:
+            accepted = self._push(dataType, item)
+            self.condition.notify()
+        return accepted
+
+    def get(self):
+        """
+        Removes and returns the next item, blocks until one is available. Not for queues in ordered mode.
+        """
+        with self.condition:
+            while True:
+                for lane in self.lanes:
+                    while lane:
+                        entry = lane.popleft()
+                        if entry.alive:
+                            self.__discard(entry)
+                            return entry.item
+                self.condition.wait()
+
+    def orderBy(self, key):
+        """
+        Switches the queue to ordered mode, getOrdered() then only hands out items whose key isn't claimed.
+
+        Parameters
+        ----------
+        key : function
+            returns the ordering key of an item
+        """
+        with self.condition:
+            self.key = key
+            pending = [entry for lane in self.lanes for entry in lane if entry.alive]
+            for entry in sorted(pending, key=attrgetter('sequence')):
+                self.__index(entry)
+
+    def getOrdered(self):
+        """
+        Removes the first item in queue order whose key isn't claimed and claims its key until release(), blocks until
+        there is one. The items of a key are thereby handed out one after another in the order they were put, they
+        stay queued meanwhile and are still subject to the queue policy.
+
+        Returns
+        -------
+        tuple
+            (key, item)
+        """
+        with self.condition:
+            while True:
+                entry = self.__nextReady()
+                if entry is not None:
+                    return entry.key, entry.item
+                self.condition.wait()
+
+    def release(self, key):
+        """
+        Releases a key claimed by getOrdered(), its next item can be taken then.
+        """
+        with self.condition:
+            self.busy.discard(key)
+            head = self.__head(key)
+            if head is not None:
+                self.__markReady(key, head)
+                self.condition.notify()
+
+    def qsize(self):
+        with self.condition:
+            return self.size
+
+    def getDropCounts(self):
+        """
+        returns a dict with the number of dropped items per dataType
+        """
+        with self.condition:
+            return dict(self.dropCounts)
+
+    def _countDrop(self, dataType):
+        self.dropCounts[dataType] = self.dropCounts.get(dataType, 0) + 1
+        self.dropped += 1
+
+    def _push(self, dataType, item):
+        raise NotImplementedError()
+
+    def _append(self, dataType, item, lane=0):
+        """
+        queues an item at the end of a lane and returns its entry
+        """
+        entry = _Entry(self.sequence, dataType, item, lane)
+        self.sequence += 1
+        self.lanes[lane].append(entry)
+        self.laneSizes[lane] += 1
+        self.size += 1
+        if self.key is not None:
+            self.__index(entry)
+        return entry
+
+    def _remove(self, entry):
+        """
+        drops a pending entry
+        """
+        self.__discard(entry)
+
+    def _oldest(self, lane, accept=None):
+        """
+        returns the oldest pending entry of a lane which is accepted, None if there is none
+        """
+        for entry in self.lanes[lane]:
+            if entry.alive and (accept is None or accept(entry)):
+                return entry
+        return None
+
+    def __discard(self, entry):
+        entry.alive = False
+        self.size -= 1
+        self.laneSizes[entry.lane] -= 1
+        lane = self.lanes[entry.lane]
+        while lane and not lane[0].alive:
+            lane.popleft()
+        if len(lane) > 2 * self.laneSizes[entry.lane] + 64:
+            # entries taken in ordered mode pile up behind a busy key
+            self.lanes[entry.lane] = deque(pending for pending in lane if pending.alive)
+
+    def __index(self, entry):
+        key = entry.key = self.key(entry.item)
+        entries = self.keys.get(key)
+        if entries is None:
+            entries = self.keys[key] = deque()
+        if key in self.busy:
+            self.deferred += 1
+        elif key not in self.readySequence:
+            # a free key with pending entries is always ready, so this is its next entry
+            self.__markReady(key, entry)
+        entries.append(entry)
+
+    def __head(self, key):
+        # next pending entry of a key
+        entries = self.keys.get(key)
+        while entries and not entries[0].alive:
+            entries.popleft()
+        if not entries:
+            self.keys.pop(key, None)
+            return None
+        return entries[0]
+
+    def __markReady(self, key, entry):
+        self.readySequence[key] = entry.sequence
+        heapq.heappush(self.ready[entry.lane], (entry.sequence, key))
+
+    def __nextReady(self):
+        index = 0
+        while index < len(self.ready):
+            heap = self.ready[index]
+            if not heap:
+                index += 1
+                continue
+            sequence, key = heapq.heappop(heap)
+            if self.readySequence.get(key) != sequence:
+                continue
+            del self.readySequence[key]
+            head = self.__head(key)
+            if head is None:
+                continue
+            if head.sequence != sequence:
+                # the entry the key was ready with was dropped, the next one may be in another lane
+                self.__markReady(key, head)
+                index = min(index, head.lane)
+                continue
+            self.keys[key].popleft()
+            self.busy.add(key)
+            self.__discard(head)
+            return head
+        return None
+
+
+class DropNewestQueue(ContainerQueue):
+    """FIFO queue, a full queue drops the incoming item (default behaviour of the DVnode)"""
+
+    def __init__(self, maxsize=10):
+        ContainerQueue.__init__(self, maxsize)
+
+    def _push(self, dataType, item):
+        if self.size >= self.maxsize:
+            self._countDrop(dataType)
+            return False
+        self._append(dataType, item)
+        return True
+
+
+class DropOldestQueue(ContainerQueue):
+    """FIFO ring buffer, a full queue drops its oldest item to make room for the incoming one"""
+
+    def __init__(self, maxsize=10):
+        ContainerQueue.__init__(self, maxsize)
+
+    def _push(self, dataType, item):
+        if self.size >= self.maxsize:
+            oldest = self._oldest(0)
+            self._remove(oldest)
+            self._countDrop(oldest.dataType)
+        self._append(dataType, item)
+        return True
+
+
+class LatestValueQueue(ContainerQueue):
+    """FIFO queue which keeps at most one pending item per conflated dataType
+
+    A new item of a conflated dataType replaces the pending one and keeps its place in the queue.
+    Other types are queued normally and dropped if the queue is full. In ordered mode only items with the same key
+    replace each other.
+    """
+
+    def __init__(self, maxsize=10, types=None):
+        """
+        Parameters
+        ----------
+        maxsize : int
+            maximum number of pending items
+        types : iterable
+            dataTypes to conflate, None conflates all types
+        """
+        ContainerQueue.__init__(self, maxsize)
+        self.types = None if types is None else set(types)
+        self.latest = dict()
+
+    def _push(self, dataType, item):
+        conflate = self.types is None or dataType in self.types
+        if conflate:
+            entry = self.latest.get(dataType)
+            if entry is not None and entry.alive and (self.key is None or self.key(item) == entry.key):
+                self._countDrop(dataType)
+                entry.item = item
+                return True
+        if self.size >= self.maxsize:
+            self._countDrop(dataType)
+            return False
+        entry = self._append(dataType, item)
+        if conflate:
+            self.latest[dataType] = entry
+        return True
+
+
+class PriorityLaneQueue(ContainerQueue):
+    """One FIFO lane per priority, get() always serves the lane with the highest priority first
+
+    Every lane is bounded by maxsize, types listed in neverDrop are always accepted.
+    """
+
+    def __init__(self, priorities, maxsize=10, neverDrop=(), dropOldest=False):
+        """
+        Parameters
+        ----------
+        priorities : dict
+            dataType --> lane, lane 0 is served first. Unlisted types share the lane behind the last listed one.
+        maxsize : int
+            maximum number of pending items per lane
+        neverDrop : iterable
+            dataTypes which are never dropped, e.g. control messages
+        dropOldest : bool
+            full lanes drop their oldest item instead of the incoming one
+        """
+        self.priorities = dict(priorities)
+        self.defaultLane = max(self.priorities.values()) + 1 if self.priorities else 0
+        ContainerQueue.__init__(self, maxsize, self.defaultLane + 1)
+        self.neverDrop = set(neverDrop)
+        self.dropOldest = dropOldest
+
+    def _push(self, dataType, item):
+        lane = self.priorities.get(dataType, self.defaultLane)
+        if self.laneSizes[lane] >= self.maxsize and dataType not in self.neverDrop:
+            # the oldest droppable entry of the lane makes room
+            oldest = self._oldest(lane, self.__droppable) if self.dropOldest else None
+            if oldest is None:
+                self._countDrop(dataType)
+                return False
+            self._remove(oldest)
+            self._countDrop(oldest.dataType)
+        self._append(dataType, item, lane)
+        return True
+
+    def __droppable(self, entry):
+        return entry.dataType not in self.neverDrop
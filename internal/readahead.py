@@ -0,0 +1,217 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Read-ahead of recordings on a background thread"""
+
+import threading
+import traceback
+from collections import deque
+
+from internal.logger import Logger
+from internal.timestamps import monotonicNs
+
+# a blocked producer continues once the queue is below this fraction of its limits
+REFILL = 0.75
+
+
+class ReadAhead:
+    """Reads the containers of a recording on a producer thread, ahead of the consumer
+
+    The producer copies the containers out of the file, which is where a slow disk or network file system blocks,
+    and peeks their sent time stamps. It stays at most depth containers, maxBytes bytes and ahead seconds of recording
+    time in front of the consumer. Whenever the consumer finds the queue empty, it counts an underrun and the time it
+    waited.
+    """
+
+    def __init__(self, reader, offset=0, depth=100000, ahead=5.0, maxBytes=256 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+        reader : RecordingReader
+            the recording, it has to stay open until the read-ahead is closed
+        offset : int
+            file offset of the first container header
+        depth : int
+            maximum number of queued containers
+        ahead : float
+            maximum distance between the sent time stamps of the last queued and the last consumed container in
+            seconds, None disables it
+        maxBytes : int
+            maximum size of all queued containers
+        """
+        self.reader = reader
+        self.offset = offset
+        self.depth = depth
+        self.aheadNs = int(ahead * 1e9) if ahead is not None else None
+        self.maxBytes = maxBytes
+        self.condition = threading.Condition(threading.Lock())
+        self.items = deque()
+        self.queuedBytes = 0
+        self.cursor = None
+        self.finished = False
+        self.blocked = False
+        self.nextSent = None
+        self.closed = False
+        self.error = None
+
+        # counters
+        self.read = 0
+        self.delivered = 0
+        self.maxQueued = 0
+        self.underruns = 0
+        self.underrunNs = 0
+        self.maxUnderrunNs = 0
+
+        self.thread = threading.Thread(target=self.__work)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def __full(self, sent, fill=1.0):
+        # an empty queue always takes the next container, whatever its size or time stamp
+        if not self.items:
+            return False
+        if len(self.items) >= self.depth * fill or self.queuedBytes >= self.maxBytes * fill:
+            return True
+        if self.aheadNs is None:
+            return False
+        cursor = self.cursor if self.cursor is not None else self.items[0][1]
+        return sent - cursor > self.aheadNs * fill
+
+    def __work(self):
+        peek = self.reader.peeker.peek
+        try:
+            for offset, size, payload in self.reader.scan(self.offset):
+                data = bytes(payload)
+                seconds, microseconds = peek(data)[1:3]
+                sent = seconds * 1000000000 + microseconds * 1000
+                with self.condition:
+                    while self.__full(sent) and not self.closed:
+                        self.blocked = True
+                        self.nextSent = sent
+                        self.condition.notify_all()
+                        self.condition.wait()
+                    self.blocked = False
+                    if self.closed:
+                        return
+                    self.items.append((offset, sent, data))
+                    self.queuedBytes += size
+                    self.read += 1
+                    if len(self.items) > self.maxQueued:
+                        self.maxQueued = len(self.items)
+                    self.condition.notify_all()
+        except Exception:
+            self.error = traceback.format_exc()
+            Logger.logError("Read-ahead of " + str(getattr(self.reader, 'path', self.reader)) + " failed:\n" +
+                            self.error)
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def prefill(self, timeout=None):
+        """
+        Blocks until the queue is filled up to one of its limits or the recording is read completely, e.g. before
+        starting a timed replay.
+        """
+        deadline = monotonicNs() + int(timeout * 1e9) if timeout is not None else None
+        with self.condition:
+            while not self.blocked and not self.finished:
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - monotonicNs()
+                    if remaining <= 0:
+                        return
+                    self.condition.wait(remaining / 1e9)
+
+    def get(self):
+        """
+        Returns the next container, blocks until it is read.
+
+        Returns
+        -------
+        tuple
+            (offset, sent time stamp in nanoseconds, serialized container) or None at the end of the recording
+        """
+        with self.condition:
+            if not self.items and not self.finished:
+                started = monotonicNs()
+                while not self.items and not self.finished:
+                    self.condition.wait()
+                waited = monotonicNs() - started
+                self.underruns += 1
+                self.underrunNs += waited
+                if waited > self.maxUnderrunNs:
+                    self.maxUnderrunNs = waited
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.queuedBytes -= len(item[2])
+            self.cursor = item[1]
+            self.delivered += 1
+            if self.blocked and not self.__full(self.nextSent, REFILL):
+                # the producer only continues once a quarter of the queue is free, so it reads in bursts
+                self.condition.notify_all()
+            return item
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self):
+        """
+        stops the producer, the reader can be closed afterwards
+        """
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+            self.queuedBytes = 0
+            self.condition.notify_all()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def getCounters(self):
+        """
+        Returns
+        -------
+        dict
+            read and delivered containers, currently and at most queued containers, queued bytes, the recording time
+            queued in seconds, the number of underruns and the total and longest time the consumer waited in seconds
+        """
+        with self.condition:
+            queuedTime = (self.items[-1][1] - self.items[0][1]) / 1e9 if self.items else 0.0
+            return dict(read=self.read, delivered=self.delivered, queued=len(self.items), maxQueued=self.maxQueued,
+                        queuedBytes=self.queuedBytes, queuedTime=queuedTime, underruns=self.underruns,
+                        underrunTime=self.underrunNs / 1e9, maxUnderrun=self.maxUnderrunNs / 1e9)
+
+    def report(self):
+        """
+        returns a readable summary of getCounters()
+        """
+        counters = self.getCounters()
+        return "Read ahead " + str(counters['read']) + " containers, at most " + str(counters['maxQueued']) + \
+               " queued, " + str(counters['underruns']) + " underruns, waited " + \
+               str(round(counters['underrunTime'] * 1e3, 1)) + " ms in total, at most " + \
+               str(round(counters['maxUnderrun'] * 1e3, 1)) + " ms"
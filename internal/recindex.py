@@ -0,0 +1,277 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Sidecar index of .rec recordings
+
+The index of drive.rec is stored in drive.rec.idx: a 16 byte header (b"ODIX", version, reserved) followed by one row
+of four little endian int64 per container: file offset of its header, sent time stamp in nanoseconds, dataType
+and size of the serialized container. The rows are in file order, so an index can be extended by appending.
+"""
+
+import bisect
+import struct
+import sys
+from array import array
+
+from internal.logger import Logger
+from internal.recreader import RecordingReader
+from internal.wire import LENGTH_OPENDAVINCI_HEADER
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"ODIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sLQ')
+COLUMNS = 4
+
+try:
+    array('q')
+    TYPECODE = 'q'
+except ValueError:
+    # python 2 has no 'q', long is 64 bit on the supported platforms
+    TYPECODE = 'l'
+
+
+def indexPath(path):
+    """
+    returns the path of the sidecar index of the given recording
+    """
+    return path + INDEX_SUFFIX
+
+
+def _toFile(rows):
+    if sys.byteorder == 'big':
+        rows = array(TYPECODE, rows)
+        rows.byteswap()
+    return rows.tostring() if sys.version_info.major == 2 else rows.tobytes()
+
+
+def scanRecording(reader, offset=0):
+    """
+    Reads the containers of a recording from the given offset on.
+
+    Parameters
+    ----------
+    reader : RecordingReader
+        the recording
+    offset : int
+        file offset of a container header
+
+    Yields
+    ------
+    tuple
+        (offset, sent time stamp in nanoseconds, dataType, size) of every complete container, a truncated or
+        corrupt tail ends the scan
+    """
+    peek = reader.peeker.peek
+    for position, size, payload in reader.scan(offset):
+        dataType, seconds, microseconds = peek(payload)[:3]
+        yield position, seconds * 1000000000 + microseconds * 1000, dataType, size
+
+
+class RecordingIndex:
+    """Columns offset, sent, dataType and size of all containers of a recording"""
+
+    def __init__(self, rows=None):
+        """
+        Parameters
+        ----------
+        rows : array
+            flat array of the rows, four int64 per container
+        """
+        if rows is None:
+            rows = array(TYPECODE)
+        self.offsets = rows[0::COLUMNS]
+        self.sent = rows[1::COLUMNS]
+        self.dataTypes = rows[2::COLUMNS]
+        self.sizes = rows[3::COLUMNS]
+        self.__sentMax = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, offset, sent, dataType, size):
+        self.offsets.append(offset)
+        self.sent.append(sent)
+        self.dataTypes.append(dataType)
+        self.sizes.append(size)
+        self.__sentMax = None
+
+    def end(self):
+        """
+        returns the file offset behind the last indexed container
+        """
+        if not self.offsets:
+            return 0
+        return self.offsets[-1] + LENGTH_OPENDAVINCI_HEADER + self.sizes[-1]
+
+    def startTime(self):
+        """
+        returns the earliest sent time stamp in nanoseconds
+        """
+        return min(self.sent) if self.sent else 0
+
+    def endTime(self):
+        """
+        returns the latest sent time stamp in nanoseconds
+        """
+        return max(self.sent) if self.sent else 0
+
+    def seek(self, time):
+        """
+        Returns the position of the first container sent at or after the given time, len(self) if there is none.
+        The time stamps of a recording are not strictly sorted, when several senders are recorded, so the search
+        runs on their running maximum.
+
+        Parameters
+        ----------
+        time : int
+            sent time stamp in nanoseconds
+        """
+        if self.__sentMax is None:
+            sentMax = list()
+            latest = None
+            for sent in self.sent:
+                if latest is None or sent > latest:
+                    latest = sent
+                sentMax.append(latest)
+            self.__sentMax = sentMax
+        return bisect.bisect_left(self.__sentMax, time)
+
+    def positions(self, dataTypes=None, start=0, stop=None):
+        """
+        Returns the positions of all containers between start and stop with one of the given dataTypes.
+
+        Parameters
+        ----------
+        dataTypes : iterable
+            message identifiers to select, None selects all
+        start : int
+            first position
+        stop : int
+            position behind the last one, None for the end
+        """
+        if stop is None:
+            stop = len(self)
+        if dataTypes is None:
+            return range(start, stop)
+        wanted = set(dataTypes)
+        types = self.dataTypes
+        return [position for position in range(start, stop) if types[position] in wanted]
+
+
+def loadIndex(path):
+    """
+    Reads the sidecar index of the given recording.
+
+    Returns
+    -------
+    RecordingIndex
+        the index or None if it is missing or broken
+    """
+    try:
+        with open(indexPath(path), 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    if len(data) < INDEX_HEADER.size:
+        return None
+    magic, version, reserved = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        return None
+    if (len(data) - INDEX_HEADER.size) % (COLUMNS * 8):
+        # partially written row, the index can't be extended anymore
+        return None
+    rows = array(TYPECODE)
+    if sys.version_info.major == 2:
+        rows.fromstring(data[INDEX_HEADER.size:])
+    else:
+        rows.frombytes(data[INDEX_HEADER.size:])
+    if sys.byteorder == 'big':
+        rows.byteswap()
+    return RecordingIndex(rows)
+
+
+def openIndex(path, update=True):
+    """
+    Returns the index of the given recording. A missing index is built, an index which doesn't cover the whole
+    recording, e.g. since it is still recorded, is extended. With update, the sidecar file is written as well.
+    """
+    index = loadIndex(path)
+    valid = index is not None
+    if not valid:
+        index = RecordingIndex()
+    rows = array(TYPECODE)
+    with RecordingReader(path) as reader:
+        if len(index):
+            # the indexed part has to match the recording, otherwise the file was replaced
+            last = index.offsets[-1]
+            if reader.size < index.end() or next(reader.scan(last, True), (0, None))[1] != index.sizes[-1]:
+                valid = False
+                index = RecordingIndex()
+        for row in scanRecording(reader, index.end()):
+            index.append(*row)
+            rows.extend(row)
+    if update and (rows or not valid):
+        try:
+            if valid:
+                with open(indexPath(path), 'ab') as f:
+                    f.write(_toFile(rows))
+            else:
+                writer = IndexWriter(indexPath(path))
+                writer.extend(index)
+                writer.close()
+        except (IOError, OSError):
+            Logger.logWarn("Can't write the index of " + path + ", it is rebuilt next time!")
+    return index
+
+
+class IndexWriter:
+    """Writes a sidecar index incrementally, used by the Recorder"""
+
+    def __init__(self, path, append=False):
+        """
+        Parameters
+        ----------
+        path : string
+            path of the index file
+        append : bool
+            append to an existing index, which has to be up to date
+        """
+        self.file = open(path, 'ab' if append else 'wb')
+        if self.file.tell() == 0:
+            self.file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0))
+        self.rows = array(TYPECODE)
+
+    def add(self, offset, sent, dataType, size):
+        self.rows.extend((offset, sent, dataType, size))
+
+    def extend(self, index):
+        for row in zip(index.offsets, index.sent, index.dataTypes, index.sizes):
+            self.rows.extend(row)
+
+    def flush(self):
+        """
+        writes the rows added so far
+        """
+        if self.rows:
+            self.file.write(_toFile(self.rows))
+            self.rows = array(TYPECODE)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
@@ -0,0 +1,284 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Buffered recording of containers into .rec files"""
+
+import threading
+import traceback
+from collections import deque
+
+from internal.compression import getCodec
+from internal.logger import Logger
+from internal.recwriter import RecordingWriter, lastRotatedNumber, rotatedName
+from internal.timestamps import monotonicNs
+from internal.wire import LENGTH_OPENDAVINCI_HEADER, ContainerPeeker
+
+
+class Recorder:
+    """Writes containers into OpenDaVINCI .rec files on a background thread
+
+    record() only appends the container to a bounded in memory buffer, so it can be called from callbacks. The writer
+    thread writes the buffer in large blocks. If the buffer is full, the container is dropped and counted.
+    The files are byte compatible with DVnode.writeToFile() and odrecorder, unless they are compressed. Compressed
+    files get one block per write, see internal.compression.
+
+    Rotated files are named like the first one with a running number in front of the extension:
+    drive.rec, drive.1.rec, drive.2.rec, ... Every file gets its sidecar index drive.rec.idx, drive.1.rec.idx, ...
+    An appending Recorder continues the last file of the series and numbers the following ones after it.
+    """
+
+    def __init__(self, filename, bufferSize=16 * 1024 * 1024, writeSize=1024 * 1024, flushInterval=1.0,
+                 fsync=False, rotateSize=None, rotateInterval=None, append=False, index=True, compression=None,
+                 compressionLevel=None):
+        """
+        Parameters
+        ----------
+        filename : string
+            file to record into
+        bufferSize : int
+            maximum number of bytes waiting to be written, further containers are dropped
+        writeSize : int
+            the writer thread writes blocks of up to this many bytes
+        flushInterval : float
+            maximum time in seconds a container stays in the buffers of the recorder and of python
+        fsync : bool
+            additionally force the data to disk on every flush, rotation and close
+        rotateSize : int
+            start a new file once the current one would exceed this many (uncompressed) bytes, None disables it
+        rotateInterval : float
+            start a new file every rotateInterval seconds, None disables it
+        append : bool
+            append to an existing file instead of truncating it, with rotated files to the last one
+        index : bool
+            write the sidecar index along with the recording, see Recording
+        compression : string
+            compress the files with zlib, lzma, zstd or lz4, None writes plain .rec files. The writer thread
+            compresses blocks of up to writeSize bytes, or whatever arrived within the flushInterval.
+        compressionLevel : int
+            compression level, None for the default of the codec
+        """
+        self.filename = filename
+        self.bufferSize = bufferSize
+        self.writeSize = writeSize
+        self.flushInterval = flushInterval
+        self.fsync = fsync
+        self.rotateSize = rotateSize
+        self.rotateIntervalNs = int(rotateInterval * 1e9) if rotateInterval else None
+        self.condition = threading.Condition(threading.Lock())
+        self.pending = deque()
+        self.buffered = 0
+        self.flushRequests = 0
+        self.flushed = 0
+        self.closed = False
+        self.index = index
+        self.peeker = ContainerPeeker()
+        self.compression = compression
+        self.compressionLevel = compressionLevel
+        if compression is not None:
+            # fails early if the codec isn't installed
+            getCodec(compression)
+
+        # counters, the ones of the current file are kept by its writer
+        self.recorded = 0
+        self.written = 0
+        self.writtenBytes = 0
+        self.fileWrittenBytes = 0
+        self.dropped = 0
+        self.maxBuffered = 0
+        self.lag = 0.0
+        self.maxLag = 0.0
+        self.errors = 0
+
+        self.files = list()
+        # number of the first file, only an appending recorder starts behind the first one
+        self.firstNumber = lastRotatedNumber(filename) if append else 0
+        self.writer = None
+        self.fileOpened = 0
+        self.__open(append)
+
+        self.thread = threading.Thread(target=self.__work)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def __open(self, append=False):
+        name = rotatedName(self.filename, self.firstNumber + len(self.files))
+        writer = RecordingWriter(name, self.compression, self.compressionLevel, self.writeSize, self.index, append,
+                                 self.fsync)
+        with self.condition:
+            if self.writer is not None:
+                # getCounters() adds the counters of the current file
+                self.written += self.writer.containers
+                self.writtenBytes += self.writer.writtenBytes
+                self.fileWrittenBytes += self.writer.fileWrittenBytes
+            self.writer = writer
+            self.files.append(name)
+        self.fileOpened = monotonicNs()
+
+    def record(self, container):
+        """
+        Records a container, can be registered as container callback directly.
+
+        Parameters
+        ----------
+        container : opendavinci_pb2.odcore_data_MessageContainer
+            container to record
+
+        Returns
+        -------
+        bool
+            False if the container was dropped, since the buffer is full
+        """
+        sent = container.sent
+        return self.record_raw(container.SerializeToString(), container.dataType,
+                               sent.seconds * 1000000000 + sent.microseconds * 1000)
+
+    def record_raw(self, string, dataType=None, sent=None):
+        """
+        Records an already serialized container, see record().
+
+        Parameters
+        ----------
+        string : bytes
+            serialized container
+        dataType : int
+            dataType of the container for the index, None to read it from the container
+        sent : int
+            sent time stamp of the container for the index in nanoseconds
+        """
+        size = len(string)
+        with self.condition:
+            assert not self.closed
+            if self.buffered + size + LENGTH_OPENDAVINCI_HEADER > self.bufferSize:
+                self.dropped += 1
+                return False
+            self.pending.append((string, monotonicNs(), dataType, sent))
+            self.buffered += size + LENGTH_OPENDAVINCI_HEADER
+            self.recorded += 1
+            if self.buffered > self.maxBuffered:
+                self.maxBuffered = self.buffered
+            if self.buffered >= self.writeSize:
+                self.condition.notify()
+        return True
+
+    def flush(self):
+        """
+        Blocks until everything recorded so far is written to the file (and to disk with fsync).
+        """
+        with self.condition:
+            self.flushRequests += 1
+            request = self.flushRequests
+            self.condition.notify()
+            while self.flushed < request and self.thread.is_alive():
+                self.condition.wait(0.1)
+
+    def close(self):
+        """
+        Writes the remaining buffer and closes the file.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __work(self):
+        lastFlush = monotonicNs()
+        flushIntervalNs = int(self.flushInterval * 1e9)
+        while True:
+            with self.condition:
+                if self.buffered < self.writeSize and self.flushRequests == self.flushed and not self.closed:
+                    self.condition.wait(max(0.0, (lastFlush + flushIntervalNs - monotonicNs()) / 1e9))
+                items = self.pending
+                self.pending = deque()
+                flushRequest = self.flushRequests
+                closing = self.closed
+            try:
+                self.__write(items)
+                now = monotonicNs()
+                if not closing and (flushRequest != self.flushed or now - lastFlush >= flushIntervalNs):
+                    self.writer.flush()
+                    lastFlush = now
+            except Exception:
+                # the containers are lost, but the recorder keeps running, e.g. after the disk ran full
+                self.__logError()
+            if closing:
+                try:
+                    self.writer.close()
+                except Exception:
+                    self.__logError()
+            with self.condition:
+                for item in items:
+                    self.buffered -= len(item[0]) + LENGTH_OPENDAVINCI_HEADER
+                self.flushed = flushRequest
+                self.condition.notify_all()
+            if closing:
+                return
+
+    def __logError(self):
+        self.errors += 1
+        Logger.logError("Recorder failed to write " + self.files[-1] + ":\n" + traceback.format_exc())
+
+    def __write(self, items):
+        writer = self.writer
+        for data, recorded, dataType, sent in items:
+            size = len(data) + LENGTH_OPENDAVINCI_HEADER
+            if writer.size() and self.__rotationDue(writer.blockBytes + size):
+                try:
+                    writer.close()
+                finally:
+                    self.__open()
+                writer = self.writer
+            if self.index and dataType is None:
+                dataType, seconds, microseconds = self.peeker.peek(data)[:3]
+                sent = seconds * 1000000000 + microseconds * 1000
+            writer.write(data, dataType, sent)
+        writer.writeBlock()
+        if items:
+            # time the oldest container waited until it was written
+            self.lag = (monotonicNs() - items[0][1]) / 1e9
+            if self.lag > self.maxLag:
+                self.maxLag = self.lag
+
+    def __rotationDue(self, size):
+        # size is the number of bytes the current file grows by
+        if self.rotateSize is not None and self.writer.bytes + size > self.rotateSize:
+            return True
+        return self.rotateIntervalNs is not None and monotonicNs() - self.fileOpened >= self.rotateIntervalNs
+
+    def getCounters(self):
+        """
+        Returns
+        -------
+        dict
+            recorded, written and dropped containers, written bytes (uncompressed and in the files), currently and at
+            most buffered bytes, the time the oldest container of the last and of the slowest write waited (lag,
+            maxLag) in seconds, write errors and the number of files
+        """
+        with self.condition:
+            writer = self.writer
+            return dict(recorded=self.recorded, written=self.written + writer.containers, dropped=self.dropped,
+                        writtenBytes=self.writtenBytes + writer.writtenBytes,
+                        fileWrittenBytes=self.fileWrittenBytes + writer.fileWrittenBytes, buffered=self.buffered,
+                        maxBuffered=self.maxBuffered, lag=self.lag, maxLag=self.maxLag, errors=self.errors,
+                        files=len(self.files))
@@ -0,0 +1,102 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Random access to .rec recordings"""
+
+from internal.recindex import openIndex
+from internal.recreader import RecordingReader
+
+
+class Recording:
+    """Reads the containers of a recording with the help of its sidecar index
+
+    The index is built on the first use and extended whenever the recording grew in the meantime.
+    Times are sent time stamps in seconds since the epoch. Compressed recordings are read transparently.
+    """
+
+    def __init__(self, path, writeIndex=True):
+        """
+        Parameters
+        ----------
+        path : string
+            path of the .rec file
+        writeIndex : bool
+            store a built or extended index next to the recording, set it to False for read only locations
+        """
+        self.path = path
+        self.index = openIndex(path, writeIndex)
+        self.reader = RecordingReader(path)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def startTime(self):
+        """
+        returns the earliest sent time stamp of the recording in seconds
+        """
+        return self.index.startTime() / 1e9
+
+    def endTime(self):
+        """
+        returns the latest sent time stamp of the recording in seconds
+        """
+        return self.index.endTime() / 1e9
+
+    def seek(self, time):
+        """
+        returns the position of the first container sent at or after time (seconds), len(self) if there is none
+        """
+        return self.index.seek(int(round(time * 1e9)))
+
+    def read(self, position):
+        """
+        returns the serialized container at the given position
+        """
+        return bytes(self.reader.read(self.index.offsets[position]))
+
+    def containers(self, dataTypes=None, start=None, end=None):
+        """
+        Iterates over the containers in file order, reading only the selected ones.
+
+        Parameters
+        ----------
+        dataTypes : iterable
+            message identifiers to select, None selects all
+        start : float
+            skip the containers sent before, in seconds
+        end : float
+            stop at the first container sent at or after, in seconds
+
+        Yields
+        ------
+        tuple
+            (sent time stamp in seconds, dataType, serialized container)
+        """
+        first = self.seek(start) if start is not None else 0
+        stop = self.seek(end) if end is not None else len(self.index)
+        index = self.index
+        for position in index.positions(dataTypes, first, stop):
+            yield index.sent[position] / 1e9, index.dataTypes[position], self.read(position)
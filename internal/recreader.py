@@ -0,0 +1,287 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Streaming reader of .rec recordings based on mmap"""
+
+import bisect
+import mmap
+import os
+
+from internal.compression import decompressBlock, isCompressed, readBlockIndex, readFileHeader
+from internal.logger import Logger
+from internal.wire import HEADER, LENGTH_OPENDAVINCI_HEADER, ContainerPeeker, parseContainer
+
+# pages behind the reader are given back to the kernel in steps of this size, so the resident memory stays constant
+RELEASE_STEP = 16 * 1024 * 1024
+
+
+class LazyContainer:
+    """MessageContainer which is only parsed when one of its fields is accessed
+
+    The dataType is read straight from the serialized container without parsing it.
+    """
+
+    __slots__ = ('payload', 'containerType', 'peeker', 'parsed')
+
+    def __init__(self, payload, containerType, peeker):
+        self.payload = payload
+        self.containerType = containerType
+        self.peeker = peeker
+        self.parsed = None
+
+    @property
+    def dataType(self):
+        return self.peeker.peekDataType(self.payload)
+
+    def container(self):
+        """
+        returns the parsed MessageContainer
+        """
+        if self.parsed is None:
+            self.parsed = parseContainer(self.containerType(), self.payload)
+        return self.parsed
+
+    def __getattr__(self, name):
+        return getattr(self.container(), name)
+
+
+class RecordingReader:
+    """Maps a recording into memory and iterates over its containers without copying them
+
+    The payloads are memoryviews into the mapping, they are only valid as long as the reader is open. Use bytes() to
+    keep one. The kernel reads the file on demand, so even recordings larger than the memory stream in constant
+    memory.
+
+    Block compressed recordings are read transparently, one block is decompressed at a time. Their offsets and size
+    count the uncompressed bytes, see internal.compression.
+    """
+
+    def __init__(self, path, containerType=None):
+        """
+        Parameters
+        ----------
+        path : string
+            path of the .rec file
+        containerType : class
+            MessageContainer class used by containers(), e.g. node.proto_dict[0]
+        """
+        self.path = path
+        self.containerType = containerType
+        self.peeker = ContainerPeeker(containerType)
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self.map, 'madvise'):
+                self.map.madvise(mmap.MADV_SEQUENTIAL)
+            try:
+                self.view = memoryview(self.map)
+            except TypeError:
+                # python 2 mmaps don't support memoryviews, slicing them copies
+                self.view = self.map
+        else:
+            # empty files can't be mapped
+            self.map = None
+            self.view = b""
+        self.releasable = hasattr(self.map, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+        self.codec = None
+        self.blockOffsets = None
+        self.cachedBlock = (None, None)
+        if isCompressed(self.view):
+            self.codec = readFileHeader(self.map)
+            self.blockOffsets, self.blockStarts, self.size, self.compressedEnd = readBlockIndex(self.map, self.size)
+
+    def close(self):
+        self.view = None
+        self.cachedBlock = (None, None)
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # payloads are still referenced, the mapping is closed once they are gone
+                pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.scan()
+
+    def scan(self, offset=0, headerOnly=False):
+        """
+        Iterates over the containers from the given offset on, a truncated or corrupt tail ends the iteration.
+
+        Parameters
+        ----------
+        offset : int
+            file offset of a container header
+        headerOnly : bool
+            only read the headers and yield None instead of the payload
+
+        Yields
+        ------
+        tuple
+            (offset, size, payload) of every container, payload is a memoryview of the serialized container
+        """
+        if self.blockOffsets is not None:
+            for item in self.__scanBlocks(offset, headerOnly):
+                yield item
+            return
+        end = self.size
+        buf = self.map
+        view = self.view
+        unpack = HEADER.unpack_from
+        released = offset - offset % RELEASE_STEP
+        # pages are released behind the reader, but never within the last RELEASE_STEP
+        nextRelease = released + 2 * RELEASE_STEP if self.releasable else end + 1
+        last = end - LENGTH_OPENDAVINCI_HEADER
+        while offset <= last:
+            byte0, word = unpack(buf, offset)
+            if byte0 != 0x0D or (word & 0xFF) != 0xA4:
+                Logger.logWarn("Recording is corrupt at offset " + str(offset) + ", stopped reading there!")
+                return
+            start = offset + LENGTH_OPENDAVINCI_HEADER
+            stop = start + (word >> 8)
+            if stop > end:
+                return
+            if headerOnly:
+                yield offset, stop - start, None
+            else:
+                yield offset, stop - start, view[start:stop]
+            offset = stop
+            if offset >= nextRelease:
+                # the pages stay in the page cache, they only leave the address space of this process
+                self.map.madvise(mmap.MADV_DONTNEED, released, RELEASE_STEP)
+                released += RELEASE_STEP
+                nextRelease += RELEASE_STEP
+
+    def __block(self, block):
+        if self.cachedBlock[0] != block:
+            self.cachedBlock = (None, None)
+            self.cachedBlock = (block, decompressBlock(self.view, self.blockOffsets[block]))
+        return self.cachedBlock[1]
+
+    def __scanBlocks(self, offset, headerOnly):
+        unpack = HEADER.unpack_from
+        first = max(0, bisect.bisect_right(self.blockStarts, offset) - 1)
+        released = self.blockOffsets[first] - self.blockOffsets[first] % RELEASE_STEP if self.blockOffsets else 0
+        for block in range(first, len(self.blockOffsets)):
+            base = self.blockStarts[block]
+            try:
+                data = self.__block(block)
+            except Exception as e:
+                Logger.logWarn("Recording is corrupt in the block at offset " + str(self.blockOffsets[block]) +
+                               " (" + str(e) + "), stopped reading there!")
+                return
+            view = data if isinstance(data, memoryview) else memoryview(data)
+            position = max(0, offset - base)
+            end = len(data)
+            while position < end:
+                byte0, word = unpack(data, position) if position + LENGTH_OPENDAVINCI_HEADER <= end else (0, 0)
+                start = position + LENGTH_OPENDAVINCI_HEADER
+                stop = start + (word >> 8)
+                if byte0 != 0x0D or (word & 0xFF) != 0xA4 or stop > end:
+                    # containers never span blocks
+                    Logger.logWarn("Recording is corrupt at offset " + str(base + position) + ", stopped reading there!")
+                    return
+                yield base + position, stop - start, None if headerOnly else view[start:stop]
+                position = stop
+            view = data = None
+            if self.releasable and self.blockOffsets[block] - released >= 2 * RELEASE_STEP:
+                self.map.madvise(mmap.MADV_DONTNEED, released, RELEASE_STEP)
+                released += RELEASE_STEP
+
+    def chunks(self, size, offset=0):
+        """
+        Iterates over runs of complete containers, headers included, e.g. to copy or compress them in blocks.
+
+        Parameters
+        ----------
+        size : int
+            minimum size of the runs of plain recordings, compressed ones are returned block by block
+        offset : int
+            file offset of a container header
+
+        Yields
+        ------
+        tuple
+            (offset, data) of every run, data is a memoryview
+        """
+        if self.blockOffsets is not None:
+            first = max(0, bisect.bisect_right(self.blockStarts, offset) - 1)
+            for block in range(first, len(self.blockOffsets)):
+                try:
+                    data = self.__block(block)
+                except Exception as e:
+                    Logger.logWarn("Recording is corrupt in the block at offset " + str(self.blockOffsets[block]) +
+                                   " (" + str(e) + "), stopped reading there!")
+                    return
+                start = max(0, offset - self.blockStarts[block])
+                yield self.blockStarts[block] + start, memoryview(data)[start:]
+            return
+        start = end = offset
+        for position, length, payload in self.scan(offset, True):
+            if position - start >= size:
+                yield start, memoryview(self.view[start:position])
+                start = position
+            end = position + LENGTH_OPENDAVINCI_HEADER + length
+        if end > start:
+            yield start, memoryview(self.view[start:end])
+
+    def read(self, offset):
+        """
+        returns the serialized container whose header is at the given offset as memoryview, see scan()
+        """
+        if self.blockOffsets is None:
+            data = self.view
+            base = 0
+        else:
+            block = bisect.bisect_right(self.blockStarts, offset) - 1
+            data = self.__block(block)
+            base = self.blockStarts[block]
+            if not isinstance(data, memoryview):
+                data = memoryview(data)
+        byte0, word = HEADER.unpack_from(data, offset - base)
+        if byte0 != 0x0D or (word & 0xFF) != 0xA4:
+            raise ValueError("No container at offset " + str(offset) + "!")
+        start = offset - base + LENGTH_OPENDAVINCI_HEADER
+        return data[start:start + (word >> 8)]
+
+    def containers(self, offset=0, lazy=True):
+        """
+        Iterates over the containers from the given offset on.
+
+        Parameters
+        ----------
+        offset : int
+            file offset of a container header
+        lazy : bool
+            yield LazyContainers, which are only parsed when needed, instead of parsed MessageContainers
+
+        Yields
+        ------
+        tuple
+            (offset, container)
+        """
+        assert self.containerType is not None
+        for position, size, payload in self.scan(offset):
+            container = LazyContainer(payload, self.containerType, self.peeker)
+            yield position, container if lazy else container.container()
@@ -0,0 +1,201 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Streaming merge, split and filter of recordings
+
+The containers are copied as they are, without parsing and serializing them again. Every recording is streamed
+through the RecordingReader and every output buffers at most one block, so the memory use doesn't depend on the size
+of the recordings. Times are sent time stamps in seconds since the epoch, like in Recording.
+"""
+
+import heapq
+
+from internal.recreader import RecordingReader
+from internal.recwriter import RecordingWriter, rotatedName
+from internal.wire import LENGTH_OPENDAVINCI_HEADER, parseContainer
+
+# smaller containers are parsed with the generated MessageContainer to read dataType and sent time stamp, which is
+# faster than peeking in python. Larger ones are peeked, since parsing would copy their payload.
+PARSE_LIMIT = 64 * 1024
+# upb keeps the memory of every parse in the arena of the message until it is deleted, so the parsing container is
+# replaced after this many containers
+RENEW_CONTAINER = 1024
+
+
+def selectContainers(path, containerType=None, dataTypes=None, exclude=None, start=None, end=None):
+    """
+    Iterates over the selected containers of a recording in file order.
+
+    Parameters
+    ----------
+    path : string
+        recording, plain or compressed
+    containerType : class
+        MessageContainer class, e.g. node.proto_dict[0], speeds up reading small containers
+    dataTypes : iterable
+        message identifiers to keep, None keeps all
+    exclude : iterable
+        message identifiers to drop
+    start : float
+        skip the containers before the first one sent at or after start
+    end : float
+        stop at the first container sent at or after end
+
+    Yields
+    ------
+    tuple
+        (sent time stamp in nanoseconds, dataType, serialized container as memoryview)
+    """
+    wanted = set(dataTypes) if dataTypes is not None else None
+    unwanted = set(exclude) if exclude is not None else set()
+    startNs = int(round(start * 1e9)) if start is not None else None
+    endNs = int(round(end * 1e9)) if end is not None else None
+    container = None
+    parsed = 0
+    with RecordingReader(path) as reader:
+        peek = reader.peeker.peek
+        for offset, size, payload in reader.scan():
+            if containerType is not None and size <= PARSE_LIMIT:
+                if parsed % RENEW_CONTAINER == 0:
+                    container = containerType()
+                parsed += 1
+                parseContainer(container, payload)
+                sent = container.sent
+                sent = sent.seconds * 1000000000 + sent.microseconds * 1000
+                dataType = container.dataType
+            else:
+                dataType, seconds, microseconds = peek(payload)[:3]
+                sent = seconds * 1000000000 + microseconds * 1000
+            if startNs is not None:
+                if sent < startNs:
+                    continue
+                # like Recording.containers(), the window starts at the first container within it
+                startNs = None
+            if endNs is not None and sent >= endNs:
+                return
+            if (wanted is None or dataType in wanted) and dataType not in unwanted:
+                yield sent, dataType, payload
+
+
+def mergeContainers(paths, containerType=None, dataTypes=None, exclude=None, start=None, end=None):
+    """
+    Merges the selected containers of several recordings by their sent time stamps, see selectContainers(). The
+    order within a recording is kept, containers sent at the same time are taken from the earlier recording first.
+
+    Yields
+    ------
+    tuple
+        (sent time stamp in nanoseconds, dataType, serialized container as memoryview)
+    """
+    def keyed(number, path):
+        for sequence, (sent, dataType, payload) in enumerate(
+                selectContainers(path, containerType, dataTypes, exclude, start, end)):
+            yield sent, number, sequence, dataType, payload
+
+    for sent, number, sequence, dataType, payload in heapq.merge(*[keyed(number, path)
+                                                                   for number, path in enumerate(paths)]):
+        yield sent, dataType, payload
+
+
+def recordingStart(path):
+    """
+    returns the sent time stamp of the first container of a recording in seconds, None if it is empty
+    """
+    with RecordingReader(path) as reader:
+        for offset, size, payload in reader.scan():
+            seconds, microseconds = reader.peeker.peek(payload)[1:3]
+            payload = None
+            return seconds + microseconds * 1e-6
+    return None
+
+
+class SplitWriter:
+    """Writes containers into a series of recordings, split by recording time and/or size
+
+    The files are named like the ones of a rotating Recorder: drive.rec, drive.1.rec, drive.2.rec, ...
+    """
+
+    def __init__(self, path, interval=None, size=None, **options):
+        """
+        Parameters
+        ----------
+        path : string
+            name of the first recording
+        interval : float
+            start a new recording for every interval seconds of sent time stamps, counted from the first container
+        size : int
+            start a new recording once the current one would exceed this many (uncompressed) bytes
+        options : dict
+            further arguments of the RecordingWriter, e.g. compression
+        """
+        assert interval is not None or size is not None
+        self.path = path
+        self.intervalNs = int(round(interval * 1e9)) if interval is not None else None
+        self.size = size
+        self.options = options
+        self.files = list()
+        self.writer = None
+        self.fileStart = None
+
+    def write(self, payload, dataType, sent):
+        """
+        Appends a serialized container, see RecordingWriter.write().
+        """
+        due = self.writer is None
+        if self.intervalNs is not None:
+            if self.fileStart is None:
+                self.fileStart = sent
+            elif sent >= self.fileStart + self.intervalNs:
+                # intervals without containers get no file
+                self.fileStart += (sent - self.fileStart) // self.intervalNs * self.intervalNs
+                due = True
+        if self.size is not None and self.writer is not None and self.writer.size() and \
+                self.writer.size() + len(payload) + LENGTH_OPENDAVINCI_HEADER > self.size:
+            due = True
+        if due:
+            if self.writer is not None:
+                self.writer.close()
+            self.writer = RecordingWriter(rotatedName(self.path, len(self.files)), **self.options)
+            self.files.append(self.writer.path)
+        self.writer.write(payload, dataType, sent)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def copyContainers(containers, writer):
+    """
+    Writes containers as yielded by selectContainers() or mergeContainers() into a RecordingWriter or SplitWriter.
+
+    Returns
+    -------
+    int
+        number of containers written
+    """
+    count = 0
+    for sent, dataType, payload in containers:
+        writer.write(payload, dataType, sent)
+        count += 1
+    return count
@@ -0,0 +1,208 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Writing of recordings and their sidecar index, used by the Recorder and the recording tools"""
+
+import os
+import re
+
+from internal.compression import BlockWriter, getCodec
+from internal.recindex import IndexWriter, indexPath, openIndex
+from internal.recreader import RecordingReader
+from internal.wire import LENGTH_OPENDAVINCI_HEADER, packHeader
+
+
+def rotatedName(path, number):
+    """
+    returns the name of the number-th file of a series of recordings: drive.rec, drive.1.rec, drive.2.rec, ...
+    """
+    if number == 0:
+        return path
+    stem, extension = os.path.splitext(path)
+    return stem + "." + str(number) + extension
+
+
+def lastRotatedNumber(path):
+    """
+    returns the highest running number of the existing files of a series of recordings, 0 if there are none
+    """
+    stem, extension = os.path.splitext(os.path.basename(path))
+    pattern = re.compile(re.escape(stem) + r"\.([0-9]+)" + re.escape(extension) + "$")
+    # gaps in the series don't matter
+    numbers = [int(match.group(1)) for match in
+               (pattern.match(name) for name in os.listdir(os.path.dirname(path) or "."))
+               if match is not None]
+    return max(numbers) if numbers else 0
+
+
+class RecordingWriter:
+    """Writes containers in blocks into a plain or compressed recording and its sidecar index
+
+    The containers are buffered until blockSize bytes are together or writeBlock() is called, compressed recordings
+    get one block per write. The size of the recording and the index only move on once a block is completely
+    written, a partially written block (e.g. the disk ran full) is cut off again and its containers are lost.
+    """
+
+    def __init__(self, path, compression=None, level=None, blockSize=1024 * 1024, index=True, append=False,
+                 fsync=False):
+        """
+        Parameters
+        ----------
+        path : string
+            recording to write
+        compression : string
+            zlib, lzma, zstd or lz4, None writes a plain recording
+        level : int
+            compression level, None for the default of the codec
+        blockSize : int
+            containers are written, respectively compressed, in blocks of this many bytes
+        index : bool
+            write the sidecar index along with the recording
+        append : bool
+            append to an existing recording of the same format instead of replacing it
+        fsync : bool
+            force the data to disk on every flush() and on close()
+        """
+        self.path = path
+        self.blockSize = blockSize
+        self.fsync = fsync
+        append = append and os.path.exists(path)
+        existing = None
+        if append and os.path.getsize(path):
+            with RecordingReader(path) as reader:
+                existing = reader.size
+                codec = reader.codec
+                end = reader.compressedEnd if codec is not None else None
+            if (codec and codec.name) != (compression and getCodec(compression).name):
+                raise ValueError("Can't append to " + path + ", it is compressed differently!")
+            if end is not None and end < os.path.getsize(path):
+                # a block truncated by a crash would swallow the new ones
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+        self.indexWriter = None
+        if index:
+            if append:
+                # brings the index up to date with the existing recording
+                openIndex(path)
+            self.indexWriter = IndexWriter(indexPath(path), append)
+        self.file = open(path, 'ab' if append else 'wb')
+        self.blockWriter = None
+        if compression is not None:
+            self.blockWriter = BlockWriter(self.file, compression, level, existing is not None)
+        self.block = list()
+        self.rows = list()
+        self.blockBytes = 0
+
+        # uncompressed size of the recording, including what was there before
+        self.bytes = existing if existing is not None else 0
+        # counters of the containers written by this writer
+        self.containers = 0
+        self.writtenBytes = 0
+        self.fileWrittenBytes = 0
+
+    def size(self):
+        """
+        returns the uncompressed size the recording has once the buffered containers are written
+        """
+        return self.bytes + self.blockBytes
+
+    def write(self, payload, dataType=None, sent=None):
+        """
+        Appends a serialized container.
+
+        Parameters
+        ----------
+        payload : bytes
+            serialized container, any bytes like object
+        dataType : int
+            dataType of the container, for the index
+        sent : int
+            sent time stamp of the container in nanoseconds, for the index
+        """
+        size = len(payload)
+        if self.indexWriter is not None:
+            self.rows.append((self.bytes + self.blockBytes, sent, dataType, size))
+        self.block.append(packHeader(size))
+        self.block.append(payload)
+        self.blockBytes += size + LENGTH_OPENDAVINCI_HEADER
+        if self.blockBytes >= self.blockSize:
+            self.writeBlock()
+
+    def writeBlock(self):
+        """
+        Writes the buffered containers, compressed recordings get one block.
+        """
+        if not self.block:
+            return
+        block, rows, blockBytes = self.block, self.rows, self.blockBytes
+        self.block = list()
+        self.rows = list()
+        self.blockBytes = 0
+        position = self.file.tell()
+        try:
+            if self.blockWriter is not None:
+                written = self.blockWriter.write(b"".join(block))
+            else:
+                self.file.write(b"".join(block))
+                written = blockBytes
+            if self.indexWriter is not None:
+                # the index must never point behind the end of the recording
+                self.file.flush()
+        except Exception:
+            # a partially written block would shift all following containers
+            try:
+                self.file.seek(position)
+                self.file.truncate()
+            except Exception:
+                pass
+            raise
+        self.bytes += blockBytes
+        self.containers += len(block) // 2
+        self.writtenBytes += blockBytes
+        self.fileWrittenBytes += written
+        if self.indexWriter is not None:
+            for row in rows:
+                self.indexWriter.add(*row)
+            self.indexWriter.flush()
+
+    def flush(self):
+        """
+        writes the buffered containers and flushes the file, with fsync to disk
+        """
+        self.writeBlock()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """
+        writes the buffered containers and closes the recording and its index, also if writing failed
+        """
+        try:
+            try:
+                self.flush()
+            finally:
+                self.file.close()
+        finally:
+            if self.indexWriter is not None:
+                self.indexWriter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,125 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Loads the message registry written by autogen_proto.py"""
+
+import json
+import os
+import sys
+import threading
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from import_file import import_file
+
+from internal.logger import Logger
+
+REGISTRY_MODULE = "proto_registry.py"
+REGISTRY_JSON = "proto_dict.json"
+
+
+class ProtoRegistry(Mapping):
+    """Read only dict message identifier --> protobuf message class
+
+    The generated _pb2 modules are only imported when one of their messages is used for the first time.
+    """
+
+    def __init__(self, entries, basePath):
+        """
+        Parameters
+        ----------
+        entries : dict
+            message identifier --> (path of the _pb2 module, message name), relative paths are relative to basePath
+        basePath : string
+            folder of the registry
+        """
+        self.entries = dict()
+        for key, entry in entries.items():
+            self.entries[key] = (os.path.join(basePath, entry[0]), entry[1])
+        self.classes = dict()
+        self.modules = dict()
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        try:
+            return self.classes[key]
+        except KeyError:
+            pass
+        file, message = self.entries[key]
+        with self.lock:
+            module = self.modules.get(file)
+            if module is None:
+                module = self.modules[file] = import_file(file)
+            cls = self.classes[key] = getattr(module, message)
+        return cls
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def getMessageName(self, key):
+        """
+        returns the name of the message class without importing it
+        """
+        return self.entries[key][1]
+
+
+def loadProtoDict(path):
+    """
+    Reads the registry written by autogen_proto.py from the given folder, proto_registry.py is preferred
+    over proto_dict.json. The message classes are imported lazily.
+
+    Parameters
+    ----------
+    path : string
+        folder containing proto_registry.py or proto_dict.json
+
+    Returns
+    -------
+    ProtoRegistry
+        message identifier --> protobuf message class
+    """
+    entries = None
+    if os.path.exists(os.path.join(path, REGISTRY_MODULE)):
+        try:
+            entries = import_file(os.path.join(path, REGISTRY_MODULE)).MESSAGES
+        except Exception:
+            Logger.logWarn(REGISTRY_MODULE + " is broken, falling back to " + REGISTRY_JSON + "!")
+    if entries is None:
+        try:
+            with open(os.path.join(path, REGISTRY_JSON), 'r') as fp:
+                tmp_proto_string_dict = json.load(fp)
+                entries = dict()
+                ## correcting keys to int , since json does't support numbers
+                for key in tmp_proto_string_dict.keys():
+                    entries[int(key)] = tmp_proto_string_dict[key]
+        except:
+            Logger.logError(" proto_dict.json not found! Run autogen_proto.py first!")
+            sys.exit(-1)
+    Logger.logInfo("Registered " + str(len(entries)) + " Messages, loading them on demand..")
+    return ProtoRegistry(entries, path)
@@ -0,0 +1,178 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Release times of replayed containers"""
+
+import threading
+import time
+
+from internal.profiling import Histogram
+from internal.timestamps import monotonicNs
+
+# longest single sleep, pause and speed changes are noticed within this time
+MAX_SLEEP = 0.05
+
+
+class ReplayScheduler:
+    """Releases recorded containers at the time they were sent, scaled by the playback speed
+
+    Every container gets an absolute deadline on the monotonic clock: the start of the replay plus the distance of
+    its sent time stamp to the first one, divided by the speed. A late container therefore doesn't shift the
+    following ones, the replay catches up instead of drifting. The scheduler sleeps until shortly before the deadline
+    and spins for the rest, since sleeping alone overshoots by up to a millisecond.
+
+    pause(), resume() and setSpeed() may be called from any thread, the replay continues seamlessly from the
+    recording time reached.
+    """
+
+    def __init__(self, speed=1.0, spin=0.001, maxGap=None):
+        """
+        Parameters
+        ----------
+        speed : float
+            playback speed, 2.0 replays twice as fast
+        spin : float
+            the last spin seconds before a deadline are busy waited
+        maxGap : float
+            gaps between two containers longer than maxGap seconds (recording time) are shortened to maxGap,
+            None replays them faithfully
+        """
+        assert speed > 0
+        self.speed = float(speed)
+        self.spinNs = int(spin * 1e9)
+        self.maxGapNs = int(maxGap * 1e9) if maxGap is not None else None
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.running.set()
+        self.pausedAt = None
+        # deadline = anchorTime + (sent - anchorSent) / speed
+        self.anchorTime = None
+        self.anchorSent = None
+        self.lastSent = None
+
+        # counters
+        self.released = 0
+        self.late = 0
+        self.reordered = 0
+        self.gaps = 0
+        self.error = Histogram()
+
+    def __deadline(self, sent):
+        return self.anchorTime + int((sent - self.anchorSent) / self.speed)
+
+    def __reanchor(self, now):
+        # the recording time reached at now becomes the new anchor
+        if self.anchorTime is not None:
+            if now > self.anchorTime:
+                self.anchorSent += int((now - self.anchorTime) * self.speed)
+            self.anchorTime = now
+
+    def wait(self, sent):
+        """
+        Blocks until the container sent at the given time is due. The first container is due immediately.
+
+        Parameters
+        ----------
+        sent : int
+            sent time stamp of the container in nanoseconds
+
+        Returns
+        -------
+        int
+            nanoseconds the container is released after its deadline
+        """
+        self.running.wait()
+        with self.lock:
+            if self.anchorTime is None:
+                self.anchorTime = monotonicNs()
+                self.anchorSent = sent
+            elif self.lastSent is not None and self.maxGapNs is not None and sent - self.lastSent > self.maxGapNs:
+                self.anchorSent += sent - self.lastSent - self.maxGapNs
+                self.gaps += 1
+            reordered = self.lastSent is not None and sent < self.lastSent
+            if not reordered:
+                self.lastSent = sent
+            deadline = self.__deadline(sent)
+        now = monotonicNs()
+        if deadline < now:
+            if reordered:
+                # sent before its predecessor, e.g. by another sender, it can only follow right away
+                self.reordered += 1
+                self.released += 1
+                return 0
+            self.late += 1
+        while deadline - now > self.spinNs:
+            time.sleep(min(MAX_SLEEP, (deadline - now - self.spinNs) / 1e9))
+            if not self.running.is_set():
+                self.running.wait()
+            with self.lock:
+                deadline = self.__deadline(sent)
+            now = monotonicNs()
+        while now < deadline:
+            now = monotonicNs()
+        self.released += 1
+        self.error.record(now - deadline)
+        return now - deadline
+
+    def pause(self):
+        with self.lock:
+            if self.pausedAt is None:
+                self.pausedAt = monotonicNs()
+                self.running.clear()
+
+    def resume(self):
+        with self.lock:
+            if self.pausedAt is not None:
+                if self.anchorTime is not None:
+                    # the pause doesn't count as replay time
+                    self.anchorTime += monotonicNs() - self.pausedAt
+                self.pausedAt = None
+                self.running.set()
+
+    def isPaused(self):
+        return self.pausedAt is not None
+
+    def setSpeed(self, speed):
+        """
+        changes the playback speed, the containers not yet released are rescheduled
+        """
+        assert speed > 0
+        with self.lock:
+            self.__reanchor(self.pausedAt if self.pausedAt is not None else monotonicNs())
+            self.speed = float(speed)
+
+    def getStatistics(self):
+        """
+        Returns
+        -------
+        dict
+            released containers, containers released late, out of order and after a shortened gap, and the timing
+            error, a HistogramSnapshot of the time between deadline and release in nanoseconds
+        """
+        return dict(released=self.released, late=self.late, reordered=self.reordered, gaps=self.gaps,
+                    error=self.error.snapshot())
+
+    def report(self):
+        """
+        returns a readable summary of getStatistics()
+        """
+        statistics = self.getStatistics()
+        error = statistics['error']
+        return "Replayed " + str(statistics['released']) + " containers, timing error p50 " + \
+               str(round(error.p50 / 1e3, 1)) + " us, p99 " + str(round(error.p99 / 1e3, 1)) + " us, max " + \
+               str(round(error.max / 1e3, 1)) + " us, " + str(statistics['late']) + " late, " + \
+               str(statistics['reordered']) + " out of order, " + str(statistics['gaps']) + " gaps shortened"
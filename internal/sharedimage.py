@@ -0,0 +1,266 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Access to the OpenDaVINCI SharedImage shared memory segments"""
+
+import struct
+import threading
+import weakref
+
+import numpy as np
+import posix_ipc
+import sysv_ipc
+
+# FIXME: incorporate _POSIX_NAME_MAX if available instead of constant 14, also the fallback to 12 if not defined
+MAX_NAME_LENGTH = 14
+# every segment starts with a 4 byte header in front of the image data
+SHARED_IMAGE_HEADER = 4
+SIZE_HEADER = struct.Struct('<L')
+# mode bit of a removed System V segment, which only lives on until the last process detached (linux)
+SHM_DEST = 0o1000
+
+
+def getCRC32(string):
+    retVal = 0
+
+    for char in string:
+        retVal = retVal ^ ord(char) ^ 0x04C11DB7  # The CRC32 polynomial.
+
+    return retVal
+
+
+def sharedMemoryName(name):
+    """
+    returns the name of the POSIX semaphore of the given SharedImage name, its CRC32 is the System V key
+    """
+    return str("/" + name.replace("/", "_"))[:MAX_NAME_LENGTH]
+
+
+class SharedImageStream:
+    """Semaphore and shared memory segment of one image stream, stays attached across frames"""
+
+    def __init__(self, name):
+        self.name = sharedMemoryName(name)
+        self.key = getCRC32(self.name)
+        self.semaphore = posix_ipc.Semaphore(self.name)
+        self.memory = sysv_ipc.SharedMemory(self.key)
+        self.buffer = memoryview(self.memory)
+        # zero copy arrays handed out by view(), the segment must stay attached while they are alive
+        self.arrays = list()
+
+    def fits(self, size):
+        return size + SHARED_IMAGE_HEADER <= self.memory.size
+
+    def isCurrent(self):
+        """
+        returns False if the producer removed the segment, e.g. since it restarted, the check is one shmctl call
+        """
+        try:
+            return not self.memory.mode & SHM_DEST
+        except sysv_ipc.Error:
+            return False
+
+    def read(self, msg):
+        """
+        returns a copy of the current frame as numpy array, the copy is done under the lock of the producer
+        """
+        self.semaphore.acquire()
+        try:
+            image = self.memory.read(msg.size, offset=SHARED_IMAGE_HEADER)
+        finally:
+            self.semaphore.release()
+        return np.frombuffer(image, np.uint8).reshape(msg.height, msg.width, msg.bytesPerPixel)
+
+    def view(self, msg):
+        """
+        returns a locked SharedImageView onto the current frame
+        """
+        self.semaphore.acquire()
+        try:
+            array = np.frombuffer(self.buffer, np.uint8, count=msg.size, offset=SHARED_IMAGE_HEADER)
+            # reshaped arrays and slices keep their base alive, arrays aren't hashable, so no WeakSet
+            self.arrays = [ref for ref in self.arrays if ref() is not None]
+            self.arrays.append(weakref.ref(array))
+            return SharedImageView(self, array.reshape(msg.height, msg.width, msg.bytesPerPixel))
+        except:
+            self.semaphore.release()
+            raise
+
+    def close(self):
+        """
+        Detaches the segment and closes the semaphore, unless arrays of SharedImageViews are still referenced.
+
+        Returns
+        -------
+        bool
+            False if the stream is still in use, close it again later
+        """
+        if any(ref() is not None for ref in self.arrays):
+            return False
+        # python 2 memoryviews can't be released explicitly
+        if hasattr(self.buffer, 'release'):
+            self.buffer.release()
+        try:
+            self.memory.detach()
+        finally:
+            self.semaphore.close()
+        return True
+
+
+class SharedImageView:
+    """Zero copy view onto a frame in shared memory
+
+    The producer is locked out as long as the view is held, so release it as early as possible. The DVnode releases
+    it after the image callback returned at the latest. Use copy() to keep the frame beyond that.
+    After the release, array still points into the shared memory, but its content may change at any time.
+    """
+
+    def __init__(self, stream, array):
+        self.stream = stream
+        self.array = array
+        self.locked = True
+
+    def copy(self):
+        """
+        returns a copy of the frame which stays valid after the release
+        """
+        return self.array.copy()
+
+    def release(self):
+        """
+        hands the shared memory back to the producer, calling it more than once is allowed
+        """
+        if self.locked:
+            self.locked = False
+            self.stream.semaphore.release()
+
+    def __enter__(self):
+        return self.array
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class SharedImageCache:
+    """Keeps one attached SharedImageStream per image name"""
+
+    def __init__(self):
+        self.streams = dict()
+        # replaced streams whose arrays are still in use
+        self.retired = list()
+        self.lock = threading.Lock()
+
+    def get(self, msg):
+        """
+        returns the stream of the given SharedImage message, reattaches if the segment became too small or was
+        replaced by the producer
+        """
+        stream = self.streams.get(msg.name)
+        if stream is not None and stream.fits(msg.size) and stream.isCurrent():
+            return stream
+        with self.lock:
+            stream = self.streams.get(msg.name)
+            if stream is None or not stream.fits(msg.size) or not stream.isCurrent():
+                if stream is not None:
+                    self.retired.append(stream)
+                self.__closeRetired()
+                stream = self.streams[msg.name] = SharedImageStream(msg.name)
+        return stream
+
+    def __closeRetired(self):
+        self.retired = [stream for stream in self.retired if not stream.close()]
+
+    def close(self):
+        """
+        closes all streams, the ones with arrays still in use stay attached until the next call
+        """
+        with self.lock:
+            self.retired.extend(self.streams.values())
+            self.streams.clear()
+            self.__closeRetired()
+
+
+class SharedImageWriter:
+    """Producer side of one image stream, the segment is created once and reused as long as the frames fit"""
+
+    def __init__(self, name):
+        self.name = name
+        self.semaphoreName = sharedMemoryName(name)
+        self.key = getCRC32(self.semaphoreName)
+        self.semaphore = posix_ipc.Semaphore(self.semaphoreName, posix_ipc.O_CREAT, initial_value=1)
+        self.memory = None
+        self.buffer = None
+
+    def __allocate(self, size):
+        if self.memory is not None:
+            # System V segments can't grow, so the old one is removed, it vanishes once all readers detached
+            self.__detach(remove=True)
+        try:
+            self.memory = sysv_ipc.SharedMemory(self.key, sysv_ipc.IPC_CREAT, size=size + SHARED_IMAGE_HEADER)
+        except ValueError:
+            # a smaller segment of a previous producer is still around
+            sysv_ipc.SharedMemory(self.key).remove()
+            self.memory = sysv_ipc.SharedMemory(self.key, sysv_ipc.IPC_CREAT, size=size + SHARED_IMAGE_HEADER)
+        self.buffer = memoryview(self.memory)
+
+    def write(self, image):
+        """
+        Copies the frame into the shared memory, the only copy on the way to the consumers.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            uint8 array of shape (height, width, bytesPerPixel) or (height, width)
+
+        Returns
+        -------
+        tuple
+            (size, width, height, bytesPerPixel) of the frame
+        """
+        assert image.dtype == np.uint8 and image.ndim in (2, 3)
+        height, width = image.shape[:2]
+        bytesPerPixel = image.shape[2] if image.ndim == 3 else 1
+        size = height * width * bytesPerPixel
+        if self.memory is None or self.memory.size < size + SHARED_IMAGE_HEADER:
+            self.__allocate(size)
+        self.semaphore.acquire()
+        try:
+            self.buffer[:SHARED_IMAGE_HEADER] = SIZE_HEADER.pack(size)
+            target = np.frombuffer(self.buffer, np.uint8, count=size, offset=SHARED_IMAGE_HEADER)
+            np.copyto(target.reshape(image.shape), image)
+        finally:
+            self.semaphore.release()
+        return size, width, height, bytesPerPixel
+
+    def __detach(self, remove):
+        if hasattr(self.buffer, 'release'):
+            self.buffer.release()
+        self.buffer = None
+        if remove:
+            self.memory.remove()
+        self.memory.detach()
+        self.memory = None
+
+    def close(self, remove=True):
+        """
+        detaches the segment, with remove it is deleted once the last consumer detached
+        """
+        if self.memory is not None:
+            self.__detach(remove)
+        if remove:
+            self.semaphore.unlink()
+        self.semaphore.close()
@@ -0,0 +1,129 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Byte ring buffer in anonymous shared memory, used to hand containers to worker processes"""
+
+import mmap
+import multiprocessing
+import struct
+
+
+def forkContext():
+    """
+    Returns the multiprocessing context of the worker processes. They have to be forked, whatever the default start
+    method is (forkserver from python 3.14 on), since they inherit the callbacks and the anonymous shared memory of
+    the rings, which can't be pickled. Python 2 always forks.
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing
+
+
+class SharedRingBuffer:
+    """Single producer / single consumer ring of variable sized records
+
+    The memory is an anonymous shared mapping, so the ring has to be created before the consumer process is forked.
+    Every record is a 4 byte length and a tag of two 64 bit integers followed by the data, padded to 4 bytes.
+    A record which does not fit in front of the end of the ring is preceded by a wrap marker and written to the
+    start instead.
+    The producer only moves the head, the consumer only moves the tail, both are stored in the first 16 bytes.
+    """
+
+    HEADER = struct.Struct('<QQ')
+    LENGTH = struct.Struct('<L')
+    TAG = struct.Struct('<qq')
+    WRAP_MARKER = 0xFFFFFFFF
+
+    def __init__(self, capacity):
+        """
+        Parameters
+        ----------
+        capacity : int
+            size of the data area in bytes, rounded up to a multiple of 4
+        """
+        self.capacity = (capacity + 3) & ~3
+        self.mm = mmap.mmap(-1, self.HEADER.size + self.capacity)
+        self.view = memoryview(self.mm)
+        self.items = forkContext().Semaphore(0)
+        self.dropped = 0
+        self.__pendingTail = None
+
+    def put(self, data, tag=(0, 0)):
+        """
+        Copies data into the ring, never blocks.
+
+        Parameters
+        ----------
+        data : bytes-like
+            record to store
+        tag : tuple
+            two integers stored along with the record
+
+        Returns
+        -------
+        bool
+            False if the ring is full and the record was dropped
+        """
+        size = len(data)
+        record = (self.LENGTH.size + self.TAG.size + size + 3) & ~3
+        head, tail = self.HEADER.unpack_from(self.mm, 0)
+        free = self.capacity - (head - tail)
+        pos = head % self.capacity
+        pad = 0
+        if pos + record > self.capacity:
+            pad = self.capacity - pos
+        if record + pad > free:
+            self.dropped += 1
+            return False
+        if pad:
+            self.LENGTH.pack_into(self.mm, self.HEADER.size + pos, self.WRAP_MARKER)
+            head += pad
+            pos = 0
+        start = self.HEADER.size + pos
+        self.LENGTH.pack_into(self.mm, start, size)
+        self.TAG.pack_into(self.mm, start + self.LENGTH.size, tag[0], tag[1])
+        start += self.LENGTH.size + self.TAG.size
+        self.view[start:start + size] = data
+        struct.pack_into('<Q', self.mm, 0, head + record)
+        self.items.release()
+        return True
+
+    def acquire(self):
+        """
+        Blocks until a record is available and returns its tag and a memoryview onto it.
+        The view stays valid until release() is called.
+        """
+        self.items.acquire()
+        tail = self.HEADER.unpack_from(self.mm, 0)[1]
+        pos = tail % self.capacity
+        size = self.LENGTH.unpack_from(self.mm, self.HEADER.size + pos)[0]
+        if size == self.WRAP_MARKER:
+            tail += self.capacity - pos
+            pos = 0
+            size = self.LENGTH.unpack_from(self.mm, self.HEADER.size)[0]
+        start = self.HEADER.size + pos + self.LENGTH.size
+        tag = self.TAG.unpack_from(self.mm, start)
+        start += self.TAG.size
+        self.__pendingTail = tail + ((self.LENGTH.size + self.TAG.size + size + 3) & ~3)
+        return tag, self.view[start:start + size]
+
+    def release(self):
+        """
+        Hands the memory of the last acquired record back to the producer.
+        """
+        struct.pack_into('<Q', self.mm, 8, self.__pendingTail)
+        self.__pendingTail = None
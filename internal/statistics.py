@@ -0,0 +1,164 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Per message type traffic statistics of the DVnode
+
+The statistics are only written by the receive thread, so no locks are taken. Snapshots may be taken from any
+thread, they are not atomic over all fields but every field itself is consistent.
+"""
+
+from collections import namedtuple
+
+from internal.timestamps import monotonicNs
+
+StatisticsSnapshot = namedtuple('StatisticsSnapshot', [
+    'dataType',  # message identifier
+    'count',  # containers received since start
+    'bytes',  # container bytes received since start
+    'rate',  # containers per second within the window
+    'byteRate',  # bytes per second within the window
+    'interArrival',  # smoothed time between two containers in seconds
+    'jitter',  # smoothed deviation of the inter arrival time in seconds
+    'latency',  # smoothed time between sending and arrival in seconds, needs synchronized clocks
+    'minLatency',
+    'maxLatency',
+    'lastArrival',  # seconds since the last container arrived
+])
+
+
+class TypeStatistics:
+    """Counters of one message type"""
+
+    __slots__ = ('count', 'bytes', 'lastArrival', 'interArrival', 'jitter', 'latency', 'minLatency', 'maxLatency',
+                 'bucketIds', 'bucketCounts', 'bucketBytes')
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.bytes = 0
+        self.lastArrival = None
+        self.interArrival = None
+        self.jitter = 0.0
+        self.latency = None
+        self.minLatency = None
+        self.maxLatency = None
+        self.bucketIds = [-1] * buckets
+        self.bucketCounts = [0] * buckets
+        self.bucketBytes = [0] * buckets
+
+
+class TrafficStatistics:
+    """Counts, rates, jitter and latency per message type
+
+    Rates are computed over sliding windows, made of buckets of bucketLength seconds. The longest possible window is
+    buckets * bucketLength seconds. Inter arrival time, jitter and latency are exponentially smoothed with gain.
+    Reading the sent time stamp from the wire is much more expensive than counting, so the latency is only measured
+    on every latencySampling-th container of a type, see latencyDue().
+    """
+
+    def __init__(self, bucketLength=0.1, buckets=100, gain=1.0 / 16, latencySampling=16):
+        self.bucketNs = int(bucketLength * 1e9)
+        self.buckets = buckets
+        self.gain = gain
+        self.latencySampling = max(1, int(latencySampling))
+        self.types = dict()
+
+    def latencyDue(self, dataType):
+        """
+        returns whether the sent time stamp of the next container of the given type should be passed to update()
+        """
+        stats = self.types.get(dataType)
+        return stats is None or stats.count % self.latencySampling == 0
+
+    def update(self, dataType, size, arrival, sent=None):
+        """
+        Accounts one received container.
+
+        Parameters
+        ----------
+        dataType : int
+            message identifier
+        size : int
+            container size in bytes
+        arrival : tuple
+            (monotonic, wall clock) arrival time in nanoseconds
+        sent : int
+            sent time stamp of the container in nanoseconds, None to skip the latency
+        """
+        stats = self.types.get(dataType)
+        if stats is None:
+            stats = self.types[dataType] = TypeStatistics(self.buckets)
+        stats.count += 1
+        stats.bytes += size
+
+        bucket = arrival[0] // self.bucketNs
+        slot = bucket % self.buckets
+        if stats.bucketIds[slot] != bucket:
+            stats.bucketIds[slot] = bucket
+            stats.bucketCounts[slot] = 0
+            stats.bucketBytes[slot] = 0
+        stats.bucketCounts[slot] += 1
+        stats.bucketBytes[slot] += size
+
+        if stats.lastArrival is not None:
+            delta = (arrival[0] - stats.lastArrival) / 1e9
+            if stats.interArrival is None:
+                stats.interArrival = delta
+            else:
+                stats.jitter += (abs(delta - stats.interArrival) - stats.jitter) * self.gain
+                stats.interArrival += (delta - stats.interArrival) * self.gain
+        stats.lastArrival = arrival[0]
+
+        if sent:
+            latency = (arrival[1] - sent) / 1e9
+            if stats.latency is None:
+                stats.latency = stats.minLatency = stats.maxLatency = latency
+            else:
+                stats.latency += (latency - stats.latency) * self.gain
+                stats.minLatency = min(stats.minLatency, latency)
+                stats.maxLatency = max(stats.maxLatency, latency)
+
+    def snapshot(self, dataType, window=1.0, now=None):
+        """
+        returns a StatisticsSnapshot of the given message type or None if it was never received
+        """
+        stats = self.types.get(dataType)
+        if stats is None:
+            return None
+        if now is None:
+            now = monotonicNs()
+        current = now // self.bucketNs
+        first = current - max(1, min(self.buckets, int(round(window * 1e9 / self.bucketNs)))) + 1
+        count = 0
+        size = 0
+        for slot in range(self.buckets):
+            if first <= stats.bucketIds[slot] <= current:
+                count += stats.bucketCounts[slot]
+                size += stats.bucketBytes[slot]
+        # the current bucket is only partially elapsed
+        covered = ((current - first) * self.bucketNs + now % self.bucketNs) / 1e9
+        rate = count / covered if covered > 0 else 0.0
+        byteRate = size / covered if covered > 0 else 0.0
+        return StatisticsSnapshot(dataType, stats.count, stats.bytes, rate, byteRate, stats.interArrival,
+                                  stats.jitter if stats.interArrival is not None else None, stats.latency,
+                                  stats.minLatency, stats.maxLatency, (now - stats.lastArrival) / 1e9)
+
+    def snapshots(self, window=1.0):
+        """
+        returns a dict message identifier --> StatisticsSnapshot of all received message types
+        """
+        now = monotonicNs()
+        return dict((dataType, self.snapshot(dataType, window, now)) for dataType in list(self.types.keys()))
@@ -0,0 +1,124 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Time stamps handed to the callbacks"""
+
+import datetime
+import time
+
+try:
+    monotonicNs = time.monotonic_ns
+    wallNs = time.time_ns
+except AttributeError:
+    try:
+        _monotonic = time.monotonic
+    except AttributeError:
+        # python 2 has no monotonic clock
+        _monotonic = time.time
+
+    def monotonicNs():
+        return int(_monotonic() * 1000000000)
+
+    def wallNs():
+        return int(time.time() * 1000000000)
+
+DATETIME = 'datetime'
+NANOSECONDS = 'ns'
+SECONDS = 'float'
+MODES = (DATETIME, NANOSECONDS, SECONDS)
+
+
+def arrivalNow():
+    """
+    returns the (monotonic, wall clock) arrival time of a container in nanoseconds
+    """
+    return monotonicNs(), wallNs()
+
+
+class TimeStamps:
+    """Numeric time stamps of one container in seconds
+
+    sent and received are taken from the container, arrival is the monotonic and arrivalTime the wall clock time
+    the datagram was received by the node. Indexing with 0 and 1 returns sent and received, like the datetime list.
+    """
+
+    __slots__ = ('sent', 'received', 'arrival', 'arrivalTime')
+
+    def __init__(self, sent, received, arrival, arrivalTime):
+        self.sent = sent
+        self.received = received
+        self.arrival = arrival
+        self.arrivalTime = arrivalTime
+
+    def __getitem__(self, index):
+        return (self.sent, self.received)[index]
+
+    def __len__(self):
+        return 2
+
+    def __repr__(self):
+        return "%s(sent=%r, received=%r, arrival=%r, arrivalTime=%r)" % (
+            type(self).__name__, self.sent, self.received, self.arrival, self.arrivalTime)
+
+    def latency(self):
+        """
+        returns the time between sending and arrival, only meaningful with synchronized clocks
+        """
+        return self.arrivalTime - self.sent
+
+    def age(self):
+        """
+        returns the time since the arrival of the container, e.g. the queueing delay inside the callback
+        """
+        return monotonicNs() / 1e9 - self.arrival
+
+
+class TimeStampsNs(TimeStamps):
+    """Numeric time stamps of one container in integer nanoseconds"""
+
+    __slots__ = ()
+
+    def age(self):
+        return monotonicNs() - self.arrival
+
+
+def makeTimeStamps(mode, container, arrival):
+    """
+    Builds the time stamps handed to the callbacks.
+
+    Parameters
+    ----------
+    mode : string
+        DATETIME for the [sent, received] list of datetime objects, NANOSECONDS or SECONDS for TimeStamps
+    container : opendavinci_pb2.odcore_data_MessageContainer
+        received container
+    arrival : tuple
+        (monotonic, wall clock) arrival time in nanoseconds as returned by arrivalNow()
+    """
+    sent = container.sent
+    received = container.received
+    if mode == NANOSECONDS:
+        return TimeStampsNs(sent.seconds * 1000000000 + sent.microseconds * 1000,
+                            received.seconds * 1000000000 + received.microseconds * 1000,
+                            arrival[0], arrival[1])
+    if mode == SECONDS:
+        return TimeStamps(sent.seconds + sent.microseconds * 1e-6, received.seconds + received.microseconds * 1e-6,
+                          arrival[0] / 1e9, arrival[1] / 1e9)
+    send = datetime.datetime.fromtimestamp(sent.seconds) + datetime.timedelta(microseconds=sent.microseconds)
+    received = datetime.datetime.fromtimestamp(received.seconds) + datetime.timedelta(
+        microseconds=received.microseconds)
+    return [send, received]
@@ -0,0 +1,350 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Helpers for the OpenDaVINCI wire format (5 byte header followed by a serialized MessageContainer)"""
+
+import struct
+import sys
+
+LENGTH_OPENDAVINCI_HEADER = 5
+MAX_DATAGRAM_SIZE = 65507
+
+HEADER = struct.Struct('<BL')
+
+
+def packHeader(size):
+    """
+    Returns the 5 byte OpenDaVINCI header for a container of the given size.
+    """
+    return HEADER.pack(0x0D, ((size & 0xFFFFFF) << 8) | 0xA4)
+
+
+def unpackHeader(buf, offset=0):
+    """
+    Returns the payload size encoded in the header at buf[offset:offset + 5] or None if it is no OpenDaVINCI header.
+    """
+    byte0, word = HEADER.unpack_from(buf, offset)
+    if byte0 != 0x0D or (word & 0xFF) != 0xA4:
+        return None
+    return word >> 8
+
+
+# pure python protobuf implementations only parse strings, the others parse memoryviews without a copy
+_parseFromView = True
+
+
+def parseContainer(container, buf):
+    """
+    Parses a serialized container from any bytes like object, e.g. a memoryview, copies it only if the protobuf
+    implementation requires that.
+
+    Parameters
+    ----------
+    container : message
+        MessageContainer (or other message) to parse into
+    buf : bytes
+        serialized message, any bytes like object
+
+    Returns
+    -------
+    message
+        container
+    """
+    global _parseFromView
+    if _parseFromView:
+        try:
+            container.ParseFromString(buf)
+            return container
+        except TypeError:
+            _parseFromView = False
+    # bytes() of a memoryview is its repr in python 2
+    container.ParseFromString(buf.tobytes() if isinstance(buf, memoryview) else bytes(buf))
+    return container
+
+
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_FIXED32 = 5
+
+if sys.version_info.major == 2:
+    def _asBytes(buf):
+        # indexing str or memoryview yields characters in python 2
+        return bytearray(buf)
+else:
+    def _asBytes(buf):
+        return buf
+
+
+def readVarint(buf, pos):
+    """
+    Decodes the varint at buf[pos], returns (value, new position).
+    """
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 70:
+            raise ValueError("Malformed varint")
+
+
+def skipField(buf, pos, wireType):
+    """
+    Returns the position behind the value of a field with the given wire type starting at buf[pos].
+    """
+    if wireType == WIRETYPE_VARINT:
+        while buf[pos] & 0x80:
+            pos += 1
+        return pos + 1
+    if wireType == WIRETYPE_LENGTH_DELIMITED:
+        length, pos = readVarint(buf, pos)
+        return pos + length
+    if wireType == WIRETYPE_FIXED64:
+        return pos + 8
+    if wireType == WIRETYPE_FIXED32:
+        return pos + 4
+    raise ValueError("Unsupported wire type " + str(wireType))
+
+
+def writeVarint(out, value):
+    """
+    Appends the varint encoding of the non negative value to the bytearray out.
+    """
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _intEncoder(field):
+    """Returns a function converting the value of the given integer field into its raw varint"""
+    from google.protobuf.descriptor import FieldDescriptor
+    if field.type == FieldDescriptor.TYPE_SINT32:
+        return lambda v: ((v << 1) ^ (v >> 31)) & 0xFFFFFFFF
+    if field.type == FieldDescriptor.TYPE_SINT64:
+        return lambda v: ((v << 1) ^ (v >> 63)) & 0xFFFFFFFFFFFFFFFF
+    # negative int32 and int64 are sign extended to 64 bit
+    return lambda v: v & 0xFFFFFFFFFFFFFFFF
+
+
+def _zigzagDecoder(v):
+    return (v >> 1) ^ -(v & 1)
+
+
+def _intDecoder(field):
+    """Returns a function converting the raw varint of the given integer field into its value"""
+    from google.protobuf.descriptor import FieldDescriptor
+    if field.type in (FieldDescriptor.TYPE_SINT32, FieldDescriptor.TYPE_SINT64):
+        return _zigzagDecoder
+    if field.type in (FieldDescriptor.TYPE_INT32, FieldDescriptor.TYPE_INT64):
+        return lambda v: v - (1 << 64) if v >= (1 << 63) else v
+    return lambda v: v
+
+
+class ContainerPeeker:
+    """Reads dataType and timestamps straight from a serialized MessageContainer without parsing it
+
+    The field numbers and integer encodings are taken from the descriptor of the given container class, so the
+    peeker follows whatever opendavinci.proto was compiled by autogen_proto.py. Without a container class the layout
+    of the OpenDaVINCI MessageContainer is assumed, so recordings can be scanned without generated messages.
+    """
+
+    def __init__(self, containerType=None):
+        if containerType is None:
+            self.dataTypeField = 1
+            self.payloadField = 2
+            self.sentField = 3
+            self.receivedField = 4
+            self.secondsField = 1
+            self.microsecondsField = 2
+            self.decodeDataType = self.decodeSeconds = self.decodeMicroseconds = _zigzagDecoder
+            return
+        fields = containerType.DESCRIPTOR.fields_by_name
+        self.dataTypeField = fields['dataType'].number
+        self.decodeDataType = _intDecoder(fields['dataType'])
+        self.payloadField = fields['serializedData'].number
+        self.sentField = fields['sent'].number
+        self.receivedField = fields['received'].number
+        stampFields = fields['sent'].message_type.fields_by_name
+        self.secondsField = stampFields['seconds'].number
+        self.decodeSeconds = _intDecoder(stampFields['seconds'])
+        self.microsecondsField = stampFields['microseconds'].number
+        self.decodeMicroseconds = _intDecoder(stampFields['microseconds'])
+
+    def peekDataType(self, buf, start=0, end=None):
+        """
+        Returns the dataType of the container serialized in buf[start:end], 0 if the field is not set.
+        """
+        buf = _asBytes(buf)
+        if end is None:
+            end = len(buf)
+        pos = start
+        while pos < end:
+            key, pos = readVarint(buf, pos)
+            if key == (self.dataTypeField << 3) | WIRETYPE_VARINT:
+                value, pos = readVarint(buf, pos)
+                return self.decodeDataType(value)
+            pos = skipField(buf, pos, key & 0x07)
+        return 0
+
+    def peek(self, buf, start=0, end=None):
+        """
+        Scans the container serialized in buf[start:end].
+
+        Returns
+        -------
+        tuple
+            (dataType, sent seconds, sent microseconds, received seconds, received microseconds,
+            payload start, payload end), missing fields are reported as 0 respectively as an empty payload
+        """
+        buf = _asBytes(buf)
+        if end is None:
+            end = len(buf)
+        dataType = 0
+        sent = (0, 0)
+        received = (0, 0)
+        payloadStart = payloadEnd = start
+        pos = start
+        while pos < end:
+            key, pos = readVarint(buf, pos)
+            field = key >> 3
+            wireType = key & 0x07
+            if field == self.dataTypeField and wireType == WIRETYPE_VARINT:
+                value, pos = readVarint(buf, pos)
+                dataType = self.decodeDataType(value)
+            elif wireType == WIRETYPE_LENGTH_DELIMITED:
+                length, pos = readVarint(buf, pos)
+                if field == self.payloadField:
+                    payloadStart, payloadEnd = pos, pos + length
+                elif field == self.sentField:
+                    sent = self.__peekTimeStamp(buf, pos, pos + length)
+                elif field == self.receivedField:
+                    received = self.__peekTimeStamp(buf, pos, pos + length)
+                pos += length
+            else:
+                pos = skipField(buf, pos, wireType)
+        return dataType, sent[0], sent[1], received[0], received[1], payloadStart, payloadEnd
+
+    def __peekTimeStamp(self, buf, pos, end):
+        seconds = 0
+        microseconds = 0
+        while pos < end:
+            key, pos = readVarint(buf, pos)
+            if key == (self.secondsField << 3) | WIRETYPE_VARINT:
+                value, pos = readVarint(buf, pos)
+                seconds = self.decodeSeconds(value)
+            elif key == (self.microsecondsField << 3) | WIRETYPE_VARINT:
+                value, pos = readVarint(buf, pos)
+                microseconds = self.decodeMicroseconds(value)
+            else:
+                pos = skipField(buf, pos, key & 0x07)
+        return seconds, microseconds
+
+
+class ContainerEncoder:
+    """Writes the MessageContainer wire format around an already serialized message
+
+    Saves building a container object and serializing the payload a second time. The fields are written in field
+    number order, like the protobuf serializer does, so the result equals SerializeToString() of the same container.
+    The encoded dataType and seconds are cached, they rarely change from one container to the next.
+    """
+
+    def __init__(self, containerType):
+        fields = containerType.DESCRIPTOR.fields_by_name
+        self.dataTypeKey = (fields['dataType'].number << 3) | WIRETYPE_VARINT
+        self.encodeDataType = _intEncoder(fields['dataType'])
+        self.payloadKey = (fields['serializedData'].number << 3) | WIRETYPE_LENGTH_DELIMITED
+        self.sentKey = (fields['sent'].number << 3) | WIRETYPE_LENGTH_DELIMITED
+        self.receivedKey = (fields['received'].number << 3) | WIRETYPE_LENGTH_DELIMITED
+        stampFields = fields['sent'].message_type.fields_by_name
+        self.secondsKey = (stampFields['seconds'].number << 3) | WIRETYPE_VARINT
+        self.encodeSeconds = _intEncoder(stampFields['seconds'])
+        self.microsecondsKey = (stampFields['microseconds'].number << 3) | WIRETYPE_VARINT
+        self.encodeMicroseconds = _intEncoder(stampFields['microseconds'])
+        # the timestamps have to follow the payload to keep the field order
+        assert fields['dataType'].number < fields['serializedData'].number < fields['sent'].number < \
+            fields['received'].number
+        self.prefixes = dict()
+        self.seconds = dict()
+
+    def __prefix(self, dataType):
+        # dataType field and key of the payload
+        prefix = bytearray()
+        writeVarint(prefix, self.dataTypeKey)
+        writeVarint(prefix, self.encodeDataType(dataType))
+        writeVarint(prefix, self.payloadKey)
+        if len(self.prefixes) > 1024:
+            self.prefixes.clear()
+        prefix = self.prefixes[dataType] = bytes(prefix)
+        return prefix
+
+    def __timeStamp(self, seconds, microseconds):
+        stamp = self.seconds.get(seconds)
+        if stamp is None:
+            stamp = bytearray()
+            writeVarint(stamp, self.secondsKey)
+            writeVarint(stamp, self.encodeSeconds(seconds))
+            writeVarint(stamp, self.microsecondsKey)
+            if len(self.seconds) > 16:
+                self.seconds.clear()
+            stamp = self.seconds[seconds] = bytes(stamp)
+        stamp = bytearray(stamp)
+        writeVarint(stamp, self.encodeMicroseconds(microseconds))
+        return stamp
+
+    def encode(self, dataType, payload, sent, received):
+        """
+        Encodes a container, the payload is not copied.
+
+        Parameters
+        ----------
+        dataType : int
+            message identifier
+        payload : bytes
+            serialized message
+        sent : tuple
+            (seconds, microseconds) sent time stamp
+        received : tuple
+            (seconds, microseconds) received time stamp
+
+        Returns
+        -------
+        tuple
+            (prefix, payload, suffix), the serialized container is their concatenation
+        """
+        prefix = self.prefixes.get(dataType)
+        if prefix is None:
+            prefix = self.__prefix(dataType)
+        prefix = bytearray(prefix)
+        writeVarint(prefix, len(payload))
+
+        suffix = bytearray()
+        stamp = self.__timeStamp(sent[0], sent[1])
+        writeVarint(suffix, self.sentKey)
+        writeVarint(suffix, len(stamp))
+        suffix += stamp
+        if received != sent:
+            stamp = self.__timeStamp(received[0], received[1])
+        writeVarint(suffix, self.receivedKey)
+        writeVarint(suffix, len(stamp))
+        suffix += stamp
+        return bytes(prefix), payload, bytes(suffix)
@@ -17,7 +17,6 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import sys
-from threading import Lock
 from time import sleep
 
 import DVnode
@@ -54,32 +53,6 @@ def echo(msg, timeStamps, msg_id):
     printMessage(msg, msg_id)
 
 
-hz_counter = 0
-hz_lock = Lock()
-
-
-def hzCallback(msg, timeStamps):
-    global hz_lock, hz_counter
-    hz_lock.acquire()
-    hz_counter += 1
-    hz_lock.release()
-
-
-hz_dict = dict()
-def hzContainerCallback(container):
-    global hz_lock, hz_dict
-
-    if container.dataType in hz_dict.keys():
-        hz_lock.acquire()
-        hz_dict[container.dataType] += 1
-        hz_lock.release()
-    else:
-        hz_lock.acquire()
-        hz_dict[container.dataType] = 1
-        hz_lock.release()
-
-
-
 node = DVnode.DVnode(cid=cid)
 
 if sys.argv[2] == "echo":
@@ -95,29 +68,21 @@ if sys.argv[2] == "echo":
     node.spin()
 
 elif sys.argv[2] == "list":
-    node.registerContainerCallback(hzContainerCallback)
     node.connect()
     while True:
+        sleep(1)
         print("Currently known messages:")
-        messages = node.getKnownMessageIDs()
-        for msg in messages:
-            hz_lock.acquire()
-            if msg in hz_dict.keys():
-                print("ID: " + str(msg) + "\t  --> " + str(hz_dict[msg]) + " Hz\t -->  " + str(node.getMessageName(msg)))
-                hz_dict[msg]=0
-            else:
-                print("ID: " + str(msg) + "\t  --> " + str(0) + " Hz\t -->  " + str(node.getMessageName(msg)))
-            hz_lock.release()
+        statistics = node.getStatistics(window=1.0)
+        for msg in node.getKnownMessageIDs():
+            rate = int(round(statistics[msg].rate)) if msg in statistics else 0
+            print("ID: " + str(msg) + "\t  --> " + str(rate) + " Hz\t -->  " + str(node.getMessageName(msg)))
         print("")
-        sleep(1)
 
 elif sys.argv[2] == "hz":
-    node.registerCallback(int(sys.argv[3]),hzCallback)
+    msg_id = int(sys.argv[3])
     node.connect()
     while True:
         sleep(1)
-        hz_lock.acquire()
-        rate = hz_counter
-        hz_counter = 0
-        hz_lock.release()
+        statistics = node.getMessageStatistics(msg_id, window=1.0)
+        rate = int(round(statistics.rate)) if statistics is not None else 0
         print("Rate: " + str(rate) + " Hz")
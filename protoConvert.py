@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import sys
+import time
+
+from internal.compression import CODECS, benchmarkCodecs, convertRecording
+from internal.logger import Logger
+from internal.recreader import RecordingReader
+
+# options look like --compression=lzma, everything else is positional
+options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+flags = set(arg[2:] for arg in sys.argv[1:] if arg.startswith("--") and "=" not in arg)
+sys.argv = [arg for arg in sys.argv if not arg.startswith("--")]
+
+codecNames = sorted(name for name in CODECS if not isinstance(name, int))
+
+if len(sys.argv) < 3 and not (len(sys.argv) == 2 and "benchmark" in flags):
+    Logger.logError("Missing Parameters!")
+    Logger.logInfo("Usage: ")
+    Logger.logInfo("       $ protoConvert.py input.rec output.rec [--compression=codec] [--level=n] [--blocksize=bytes]")
+    Logger.logInfo("       $ protoConvert.py input.rec --benchmark [--blocksize=bytes] [--limit=bytes]")
+    Logger.logInfo("Plain recordings are compressed with zlib by default, compressed ones are decompressed.")
+    Logger.logInfo("Available codecs: " + ", ".join(codecNames) + ", none for a plain recording")
+    Logger.logInfo("")
+    sys.exit(-1)
+
+try:
+    level = int(options["level"]) if "level" in options else None
+    blockSize = int(options.get("blocksize", 1024 * 1024))
+    limit = int(options["limit"]) if "limit" in options else None
+except ValueError:
+    Logger.logError("Level, block size and limit have to be integers!")
+    sys.exit(-1)
+
+if "benchmark" in flags:
+    Logger.logInfo("Compressing blocks of " + str(blockSize) + " bytes of " + sys.argv[1] + " in memory..")
+    for result in benchmarkCodecs(sys.argv[1], [(name, level) for name in codecNames], blockSize, limit):
+        Logger.logInfo(result['codec'].ljust(5) + " level " + str(result['level']).ljust(3) + " ratio " +
+                       str(round(result['ratio'], 2)).ljust(6) + " compress " +
+                       str(round(result['compressSpeed'], 1)).rjust(7) + " MB/s, decompress " +
+                       str(round(result['decompressSpeed'], 1)).rjust(7) + " MB/s")
+    sys.exit(0)
+
+with RecordingReader(sys.argv[1]) as reader:
+    compressed = reader.codec is not None
+compression = options.get("compression", "none" if compressed else "zlib")
+if compression != "none" and compression not in codecNames:
+    Logger.logError("Compression " + compression + " is not available, choose one of " + ", ".join(codecNames) +
+                    " or none!")
+    sys.exit(-1)
+
+started = time.time()
+total, written = convertRecording(sys.argv[1], sys.argv[2], None if compression == "none" else compression, level,
+                                  blockSize)
+elapsed = max(time.time() - started, 1e-9)
+Logger.logInfo("Converted " + str(total) + " into " + str(written) + " bytes (ratio " +
+               str(round(total / float(max(written, 1)), 2)) + ") in " + str(round(elapsed, 2)) + " s, " +
+               str(round(total / 1e6 / elapsed, 1)) + " MB/s")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import sys
+import time
+
+from internal.compression import getCodec
+from internal.logger import Logger
+from internal.rectools import SplitWriter, copyContainers, mergeContainers, recordingStart, selectContainers
+from internal.recwriter import RecordingWriter
+from internal.registry import REGISTRY_JSON, REGISTRY_MODULE, loadProtoDict
+
+
+def usage():
+    Logger.logInfo("Usage: ")
+    Logger.logInfo("       $ protoEdit.py merge output.rec input1.rec input2.rec .. [options]")
+    Logger.logInfo("       $ protoEdit.py filter input.rec output.rec [options]")
+    Logger.logInfo("       $ protoEdit.py split input.rec output.rec --interval=seconds|--size=bytes [options]")
+    Logger.logInfo("Options:")
+    Logger.logInfo("       --types=19,8        only keep these message identifiers")
+    Logger.logInfo("       --exclude=14        drop these message identifiers")
+    Logger.logInfo("       --start=seconds     skip the given number of seconds from the beginning")
+    Logger.logInfo("       --end=seconds       stop the given number of seconds after the beginning")
+    Logger.logInfo("       --compression=zstd  compress the output with zlib, lzma, zstd or lz4")
+    Logger.logInfo("       --level=n           compression level, the default of the codec otherwise")
+    Logger.logInfo("")
+    sys.exit(-1)
+
+
+# options look like --types=19,8, everything else is positional
+options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+sys.argv = [arg for arg in sys.argv if not arg.startswith("--")]
+
+if len(sys.argv) < 4 or sys.argv[1] not in ("merge", "filter", "split") or \
+        (sys.argv[1] != "merge" and len(sys.argv) != 4):
+    Logger.logError("Missing or malformed Parameters!")
+    usage()
+
+command = sys.argv[1]
+if command == "merge":
+    output, inputs = sys.argv[2], sys.argv[3:]
+else:
+    inputs, output = sys.argv[2:3], sys.argv[3]
+if output in inputs:
+    Logger.logError("The output can't be one of the inputs!")
+    sys.exit(-1)
+for name in inputs:
+    if not os.path.isfile(name):
+        Logger.logError("Recording " + name + " not found!")
+        sys.exit(-1)
+
+try:
+    dataTypes = [int(x) for x in options["types"].split(",")] if "types" in options else None
+    exclude = [int(x) for x in options["exclude"].split(",")] if "exclude" in options else None
+    start = float(options["start"]) if "start" in options else None
+    end = float(options["end"]) if "end" in options else None
+    interval = float(options["interval"]) if "interval" in options else None
+    size = int(options["size"]) if "size" in options else None
+    level = int(options["level"]) if "level" in options else None
+except ValueError:
+    Logger.logError("Option malformed!")
+    usage()
+
+if command == "split" and interval is None and size is None:
+    Logger.logError("Split needs --interval or --size!")
+    usage()
+
+# the generated MessageContainer reads small containers faster than the pure python peeker, but isn't required
+containerType = None
+path = os.path.dirname(os.path.abspath(__file__))
+if os.path.exists(os.path.join(path, REGISTRY_MODULE)) or os.path.exists(os.path.join(path, REGISTRY_JSON)):
+    containerType = loadProtoDict(path)[0]
+
+if start is not None or end is not None:
+    # times are relative to the first container of the earliest recording
+    first = min(stamp for stamp in (recordingStart(name) for name in inputs) if stamp is not None)
+    start = first + start if start is not None else None
+    end = first + end if end is not None else None
+
+compression = options.get("compression")
+if compression is not None:
+    try:
+        getCodec(compression)
+    except ValueError as e:
+        Logger.logError(str(e))
+        sys.exit(-1)
+
+if command == "split":
+    writer = SplitWriter(output, interval, size, compression=compression, level=level)
+else:
+    writer = RecordingWriter(output, compression, level)
+
+started = time.time()
+if len(inputs) > 1:
+    containers = mergeContainers(inputs, containerType, dataTypes, exclude, start, end)
+else:
+    containers = selectContainers(inputs[0], containerType, dataTypes, exclude, start, end)
+with writer:
+    count = copyContainers(containers, writer)
+
+files = writer.files if command == "split" else [output]
+Logger.logInfo("Wrote " + str(count) + " containers into " + ", ".join(files) + " in " +
+               str(round(time.time() - started, 2)) + " s")
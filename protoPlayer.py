@@ -16,19 +16,31 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
 
-import datetime
-import struct
 import sys
-import time
+import threading
 
 from DVnode import DVnode
 from internal.logger import Logger
+from internal.readahead import ReadAhead
+from internal.recording import Recording
+from internal.recreader import RecordingReader
+from internal.replay import ReplayScheduler
+
+# options look like --start=120, everything else is positional
+options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+sys.argv = [arg for arg in sys.argv if not arg.startswith("--")]
 
 if len(sys.argv) < 3:
     Logger.logError("Missing Parameters, minimum number of parameter is 2!")
     Logger.logInfo("Usage: ")
-    Logger.logInfo("       $ protoPrint.py CID input.rec [playbackspeed]")
+    Logger.logInfo("       $ protoPrint.py CID input.rec [playbackspeed] [--start=seconds] [--maxgap=seconds]")
+    Logger.logInfo("                                                [--readahead=seconds] [--depth=containers]")
     Logger.logInfo("Set playbackspeed to 0, for unlimited speed")
+    Logger.logInfo("--start skips the given number of seconds from the beginning of the recording")
+    Logger.logInfo("--maxgap shortens pauses in the recording longer than the given number of seconds (default 1, 0")
+    Logger.logInfo("         replays them faithfully)")
+    Logger.logInfo("--readahead reads up to the given number of seconds ahead (default 5, 0 disables it), but at most")
+    Logger.logInfo("            --depth containers (default 100000)")
     Logger.logInfo("")
     sys.exit(-1)
 
@@ -52,62 +64,140 @@ if len(sys.argv) > 3:
         Logger.logInfo("")
         sys.exit(-1)
 
+start = 0.0
+if "start" in options:
+    try:
+        start = float(options["start"])
+    except:
+        Logger.logError("Start malformed!")
+        Logger.logInfo("Usage: ")
+        Logger.logInfo("       $ protoPrint.py 123 input.rec 1.0 --start=120")
+        Logger.logInfo("")
+        sys.exit(-1)
+
+# like the former "very low rate" skip, pauses of more than a second don't block the replay
+maxGap = 1.0
+if "maxgap" in options:
+    try:
+        maxGap = float(options["maxgap"]) or None
+    except:
+        Logger.logError("Maximum gap malformed!")
+        Logger.logInfo("Usage: ")
+        Logger.logInfo("       $ protoPrint.py 123 input.rec 1.0 --maxgap=5")
+        Logger.logInfo("")
+        sys.exit(-1)
+
+readAhead = 5.0
+if "readahead" in options:
+    try:
+        readAhead = float(options["readahead"])
+    except:
+        Logger.logError("Read-ahead malformed!")
+        Logger.logInfo("Usage: ")
+        Logger.logInfo("       $ protoPrint.py 123 input.rec 1.0 --readahead=10")
+        Logger.logInfo("")
+        sys.exit(-1)
+
+depth = 100000
+if "depth" in options:
+    try:
+        depth = int(options["depth"])
+    except:
+        Logger.logError("Depth malformed!")
+        Logger.logInfo("Usage: ")
+        Logger.logInfo("       $ protoPrint.py 123 input.rec 1.0 --depth=10000")
+        Logger.logInfo("")
+        sys.exit(-1)
+
+startOffset = 0
+if start > 0:
+    # the sidecar index is built on the first use
+    with Recording(sys.argv[2]) as recording:
+        position = recording.seek(recording.startTime() + start)
+        if position == len(recording):
+            Logger.logError("The recording is shorter than " + str(start) + " seconds!")
+            sys.exit(-1)
+        startOffset = recording.index.offsets[position]
+
+scheduler = ReplayScheduler(speed, maxGap=maxGap) if speed != 0 else None
+
+
+def control():
+    # a line with p pauses and resumes the replay, a number changes the playback speed
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            return
+        command = line.strip()
+        if command == "p":
+            if scheduler.isPaused():
+                scheduler.resume()
+                Logger.logInfo("Resumed")
+            else:
+                scheduler.pause()
+                Logger.logInfo("Paused, enter p to resume")
+        elif command:
+            try:
+                newSpeed = float(command)
+                assert newSpeed > 0
+            except (ValueError, AssertionError):
+                Logger.logWarn("Enter p to pause or resume, or a playback speed > 0")
+                continue
+            scheduler.setSpeed(newSpeed)
+            Logger.logInfo("Playback speed " + str(newSpeed))
+
+
+if scheduler is not None and sys.stdin.isatty():
+    controlThread = threading.Thread(target=control)
+    controlThread.setDaemon(True)
+    controlThread.start()
+    Logger.logInfo("Enter p to pause or resume, or a number to change the playback speed")
+
+def readContainers(reader, offset):
+    # same items as the ReadAhead yields, read in place
+    peek = reader.peeker.peek
+    for offset, size, buffer in reader.scan(offset):
+        sentSeconds, sentMicroseconds = peek(buffer)[1:3]
+        yield offset, sentSeconds * 1000000000 + sentMicroseconds * 1000, buffer
+
+
 node = DVnode(cid=CID)
 node.run = True
 node.connect()
 
-lasttimestamp = None
-lasttime = datetime.datetime.now()
+# at unlimited speed the containers are published in batches
+BATCH_SIZE = 64
+batch = list()
 
 # Read contents from file.
-with open(sys.argv[2], "rb") as f:
+with RecordingReader(sys.argv[2]) as reader:
     Logger.logInfo("Reading File, please wait..")
+    if readAhead > 0:
+        # a producer thread reads the containers ahead, so slow reads don't delay the publishing
+        containers = ReadAhead(reader, startOffset, depth, readAhead)
+        containers.prefill()
+    else:
+        containers = readContainers(reader, startOffset)
 
-    MessageContainer = node.proto_dict[0]
-    LENGTH_OPENDAVINCI_HEADER = 5
-
-    header = f.read(LENGTH_OPENDAVINCI_HEADER)
-    while len(header) == LENGTH_OPENDAVINCI_HEADER:
-        try:
-            byte0 = ord(header[0])
-            byte1 = ord(header[1])
-        except:
-            byte0 = header[0]
-            byte1 = header[1]
-
-        # Check for OpenDaVINCI header.
-        if byte0 == int('0x0D', 16) and byte1 == int('0xA4', 16):
-            v = struct.unpack('<L', header[1:5])  # Read uint32_t and convert to little endian.
-            expectedBytes = v[0] >> 8  # The second byte belongs to OpenDaVINCI's Container header.
-
-            buffer = f.read(expectedBytes)
-
-            if speed != 0:
-                container = MessageContainer()
-                container.ParseFromString(buffer)
-                if lasttimestamp is None:
-                    lasttimestamp = datetime.datetime.fromtimestamp(
-                        timestamp=container.sent.seconds) + datetime.timedelta(
-                        microseconds=container.sent.microseconds)
-                    lasttime = datetime.datetime.now()
-                else:
-                    newtime = datetime.datetime.fromtimestamp(timestamp=container.sent.seconds) + datetime.timedelta(
-                        microseconds=container.sent.microseconds)
-                    deltatime = ((newtime - lasttimestamp).total_seconds()) / float(speed)
-                    time_to_wait = deltatime - (datetime.datetime.now() - lasttime).total_seconds()
-                    if time_to_wait < 0:
-                        Logger.logWarn("Timestamp is " + str(round(time_to_wait,4)) + " seconds in the past. Skipping Timestamp processing for one message!")
-                    elif time_to_wait > 1/speed:
-                        Logger.logWarn("Very low rate detected! Skipping Timestamp processing for one message, to prevent blocking!")
-                    else:
-                        time.sleep(time_to_wait)
-                    lasttimestamp = newtime
-                    lasttime = datetime.datetime.now()
-
-            node.publish_raw(buffer)
-
-            header = f.read(LENGTH_OPENDAVINCI_HEADER)
-
-        else:
-            Logger.logError("Failed to consume OpenDaVINCI container!")
-            sys.exit(-1)
+    try:
+        for offset, sent, buffer in containers:
+            if scheduler is not None:
+                scheduler.wait(sent)
+                node.publish_raw(buffer)
+            else:
+                batch.append(buffer)
+                if len(batch) >= BATCH_SIZE:
+                    node.publish_raw_many(batch)
+                    del batch[:]
+
+        node.publish_raw_many(batch)
+        del batch[:]
+    except KeyboardInterrupt:
+        del batch[:]
+
+    if readAhead > 0:
+        containers.close()
+        Logger.logInfo(containers.report())
+
+if scheduler is not None:
+    Logger.logInfo(scheduler.report())
@@ -0,0 +1,63 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""MessageContainer and TimeStamp of proto/opendavinci.proto, built without running autogen_proto.py"""
+
+from google.protobuf import descriptor_pb2, descriptor_pool
+
+try:
+    from google.protobuf.message_factory import GetMessageClass
+except ImportError:
+    from google.protobuf import message_factory
+    GetMessageClass = message_factory.MessageFactory().GetPrototype
+
+
+def _buildMessages():
+    fileProto = descriptor_pb2.FileDescriptorProto(name='tests_opendavinci.proto', package='tests')
+    stamp = fileProto.message_type.add(name='odcore_data_TimeStamp')
+    for number, name in ((1, 'seconds'), (2, 'microseconds')):
+        stamp.field.add(name=name, number=number, type=descriptor_pb2.FieldDescriptorProto.TYPE_SINT32,
+                        label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    container = fileProto.message_type.add(name='odcore_data_MessageContainer')
+    container.field.add(name='dataType', number=1, type=descriptor_pb2.FieldDescriptorProto.TYPE_SINT32,
+                        label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    container.field.add(name='serializedData', number=2, type=descriptor_pb2.FieldDescriptorProto.TYPE_BYTES,
+                        label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    for number, name in ((3, 'sent'), (4, 'received'), (5, 'sampleTimeStamp')):
+        container.field.add(name=name, number=number, type=descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE,
+                            type_name='.tests.odcore_data_TimeStamp',
+                            label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(fileProto)
+    return (GetMessageClass(pool.FindMessageTypeByName('tests.odcore_data_MessageContainer')),
+            GetMessageClass(pool.FindMessageTypeByName('tests.odcore_data_TimeStamp')))
+
+
+MessageContainer, TimeStamp = _buildMessages()
+
+
+def makeContainer(dataType, payload, sent=(0, 0), received=(0, 0)):
+    """
+    returns a MessageContainer with the given dataType, serialized message and (seconds, microseconds) time stamps
+    """
+    container = MessageContainer()
+    container.dataType = dataType
+    container.serializedData = payload
+    container.sent.seconds, container.sent.microseconds = sent
+    container.received.seconds, container.received.microseconds = received
+    return container
@@ -0,0 +1,122 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import os
+import unittest
+
+from internal.fragments import FRAGMENT_HEADER, FRAGMENT_MARKER, Reassembler, fragments
+
+
+def datagram(sender, sequence, offset, total, chunk):
+    return bytearray(FRAGMENT_HEADER.pack(0x0D, FRAGMENT_MARKER, sender, sequence, offset, total) + chunk)
+
+
+class ReassemblerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = os.urandom(10000)
+        self.reassembler = Reassembler()
+
+    def add(self, buf, now=0):
+        return self.reassembler.add(buf, len(buf), now)
+
+    def counters(self):
+        counters = self.reassembler.counters()
+        return dict((name, value) for name, value in counters.items() if value)
+
+    def testOutOfOrder(self):
+        parts = [bytearray(header + chunk.tobytes()) for header, chunk in fragments(self.payload, 1, 2, 1024)]
+        self.assertEqual(len(parts), 10)
+        for part in reversed(parts[1:]):
+            self.assertIsNone(self.add(part))
+        self.assertEqual(self.add(parts[0]), self.payload)
+        self.assertEqual(self.counters(), dict(completed=1))
+
+    def testDuplicates(self):
+        parts = [bytearray(header + chunk.tobytes()) for header, chunk in fragments(self.payload, 1, 2, 4000)]
+        self.assertIsNone(self.add(parts[0]))
+        self.assertIsNone(self.add(parts[0]))
+        self.assertIsNone(self.add(parts[1]))
+        self.assertIsNone(self.add(parts[1]))
+        self.assertEqual(self.add(parts[2]), self.payload)
+        self.assertEqual(self.counters(), dict(completed=1, duplicates=2))
+
+    def testOverlaps(self):
+        # as many bytes as the container has, but with a gap covered twice
+        self.assertIsNone(self.add(datagram(1, 2, 0, 10000, self.payload[:6000])))
+        self.assertIsNone(self.add(datagram(1, 2, 5000, 10000, self.payload[5000:9000])))
+        self.assertIsNone(self.add(datagram(1, 2, 2000, 10000, self.payload[2000:3000])))
+        self.assertIsNone(self.add(datagram(1, 2, 9500, 10000, self.payload[9500:])))
+        self.assertEqual(self.add(datagram(1, 2, 6000, 10000, self.payload[6000:9500])), self.payload)
+        self.assertEqual(self.counters(), dict(completed=1, malformed=2))
+
+    def testMalformed(self):
+        self.assertIsNone(self.add(bytearray(b'\x0d\xa5abc')))
+        self.assertIsNone(self.add(datagram(1, 2, 0, 10000, b'')))
+        self.assertIsNone(self.add(datagram(1, 2, 9000, 10000, self.payload[:2000])))
+        self.assertIsNone(self.add(datagram(1, 2, 0, 10000, self.payload[:5000])))
+        # a different size than the first fragment of the container said
+        self.assertIsNone(self.add(datagram(1, 2, 5000, 20000, self.payload[5000:] * 2)))
+        self.assertEqual(self.add(datagram(1, 2, 5000, 10000, self.payload[5000:])), self.payload)
+        self.assertEqual(self.counters(), dict(completed=1, malformed=4))
+
+    def testTimeout(self):
+        reassembler = Reassembler(timeout=1.0)
+        buf = datagram(1, 2, 0, 10000, self.payload[:5000])
+        self.assertIsNone(reassembler.add(buf, len(buf), 0))
+        buf = datagram(1, 3, 0, 10000, self.payload[:5000])
+        self.assertIsNone(reassembler.add(buf, len(buf), 2000000000))
+        self.assertEqual(reassembler.counters()['incomplete'], 1)
+        self.assertEqual(reassembler.counters()['pending'], 1)
+
+    def testLateFragments(self):
+        parts = [bytearray(header + chunk.tobytes()) for header, chunk in fragments(self.payload, 1, 2, 6000)]
+        self.assertIsNone(self.add(parts[0]))
+        self.assertEqual(self.add(parts[1]), self.payload)
+        self.assertIsNone(self.add(parts[0], 10))
+        self.reassembler.expire(5000000000)
+        self.assertIsNone(self.add(parts[1], 5000000000))
+        self.assertEqual(self.counters(), dict(completed=1, late=2))
+
+    def testExpireWhileIdle(self):
+        buf = datagram(1, 2, 0, 10000, self.payload[:5000])
+        self.assertIsNone(self.add(buf))
+        self.reassembler.expire(500000000)
+        self.assertEqual(self.counters(), dict(pending=1))
+        self.reassembler.expire(1000000000)
+        self.assertEqual(self.counters(), dict(incomplete=1))
+        self.assertEqual(self.reassembler.pendingBytes, 0)
+        # the rest of the given up container is late
+        self.assertIsNone(self.add(datagram(1, 2, 5000, 10000, self.payload[5000:]), 1000000001))
+        self.assertEqual(self.counters(), dict(incomplete=1, late=1))
+
+    def testMemoryBound(self):
+        reassembler = Reassembler(maxPending=2, maxBytes=25000)
+        for sequence in range(4):
+            buf = datagram(1, sequence, 0, 10000, self.payload[:5000])
+            reassembler.add(buf, len(buf), 0)
+        self.assertEqual(reassembler.counters()['pending'], 2)
+        self.assertEqual(reassembler.counters()['incomplete'], 2)
+        buf = datagram(2, 0, 0, 20000, self.payload[:5000])
+        reassembler.add(buf, len(buf), 0)
+        self.assertEqual(reassembler.pendingBytes, 20000)
+        self.assertEqual(reassembler.counters()['incomplete'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
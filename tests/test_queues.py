@@ -0,0 +1,177 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import random
+import threading
+import time
+import unittest
+
+from internal.dispatch import KeyedSerialDispatcher
+from internal.queues import DropNewestQueue, DropOldestQueue, LatestValueQueue, PriorityLaneQueue
+
+
+class QueuePolicyTest(unittest.TestCase):
+
+    def drain(self, queue):
+        items = list()
+        while queue.qsize():
+            items.append(queue.get())
+        return items
+
+    def testDropNewest(self):
+        queue = DropNewestQueue(3)
+        accepted = [queue.put(i % 2, i) for i in range(5)]
+        self.assertEqual(accepted, [True, True, True, False, False])
+        self.assertEqual(self.drain(queue), [0, 1, 2])
+        self.assertEqual(queue.getDropCounts(), {1: 1, 0: 1})
+        self.assertEqual(queue.dropped, 2)
+
+    def testDropOldest(self):
+        queue = DropOldestQueue(3)
+        for i in range(5):
+            self.assertTrue(queue.put(i % 2, i))
+        self.assertEqual(self.drain(queue), [2, 3, 4])
+        self.assertEqual(queue.getDropCounts(), {0: 1, 1: 1})
+
+    def testLatestValue(self):
+        queue = LatestValueQueue(3, types=[7])
+        queue.put(7, "a")
+        queue.put(1, "b")
+        queue.put(7, "c")
+        queue.put(1, "d")
+        self.assertFalse(queue.put(1, "e"))
+        # the conflated item keeps the place of the replaced one
+        self.assertEqual(self.drain(queue), ["c", "b", "d"])
+        self.assertEqual(queue.getDropCounts(), {7: 1, 1: 1})
+        queue.put(7, "f")
+        self.assertEqual(self.drain(queue), ["f"])
+
+    def testPriorityLanes(self):
+        queue = PriorityLaneQueue({1: 0, 2: 1}, maxsize=2, neverDrop=[1])
+        for i in range(3):
+            queue.put(3, "low" + str(i))
+            queue.put(2, "mid" + str(i))
+            queue.put(1, "high" + str(i))
+        self.assertEqual(self.drain(queue), ["high0", "high1", "high2", "mid0", "mid1", "low0", "low1"])
+        self.assertEqual(queue.getDropCounts(), {2: 1, 3: 1})
+
+    def testPriorityLanesDropOldest(self):
+        queue = PriorityLaneQueue({1: 0}, maxsize=2, neverDrop=[1], dropOldest=True)
+        queue.put(1, "keep")
+        queue.put(2, "a")
+        queue.put(2, "b")
+        queue.put(2, "c")
+        queue.put(1, "also")
+        queue.put(1, "kept")
+        self.assertEqual(self.drain(queue), ["keep", "also", "kept", "b", "c"])
+        self.assertEqual(queue.getDropCounts(), {2: 1})
+
+
+class OrderedQueueTest(unittest.TestCase):
+
+    def testBusyKeysAreSkipped(self):
+        queue = DropNewestQueue(10)
+        queue.orderBy(lambda item: item[0])
+        for item in [("a", 0), ("a", 1), ("b", 2), ("a", 3), ("b", 4)]:
+            queue.put(0, item)
+        self.assertEqual(queue.getOrdered(), ("a", ("a", 0)))
+        self.assertEqual(queue.getOrdered(), ("b", ("b", 2)))
+        queue.release("b")
+        self.assertEqual(queue.getOrdered(), ("b", ("b", 4)))
+        queue.release("a")
+        self.assertEqual(queue.getOrdered(), ("a", ("a", 1)))
+        self.assertEqual(queue.qsize(), 1)
+        self.assertEqual(queue.deferred, 0)
+        queue.put(0, ("a", 5))
+        self.assertEqual(queue.deferred, 1)
+
+    def testDroppedHeadInOtherLane(self):
+        # the item a key was ready with is dropped, its next item waits in a higher priority lane
+        queue = PriorityLaneQueue({1: 0}, maxsize=1, dropOldest=True)
+        queue.orderBy(lambda item: item[0])
+        queue.put(2, ("k", 0))
+        queue.put(1, ("k", 1))
+        queue.put(2, ("k", 2))
+        self.assertEqual(queue.getOrdered(), ("k", ("k", 1)))
+        queue.release("k")
+        self.assertEqual(queue.getOrdered(), ("k", ("k", 2)))
+        self.assertEqual(queue.getDropCounts(), {2: 1})
+
+    def testManyPendingItemsOfABusyKey(self):
+        queue = PriorityLaneQueue({1: 0}, maxsize=5, neverDrop=[1])
+        queue.orderBy(lambda item: item[0])
+        for i in range(20000):
+            queue.put(1, ("busy", i))
+        self.assertEqual(queue.getOrdered()[1], ("busy", 0))
+        started = time.time()
+        for i in range(20000):
+            queue.put(1, ("free" + str(i % 100), i))
+            queue.release(queue.getOrdered()[0])
+        # skipping the pending items of the busy key must not cost anything
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(queue.qsize(), 19999)
+
+
+class OrderedDispatchTest(unittest.TestCase):
+
+    def dispatch(self, queue, count, keys, workers):
+        dispatcher = KeyedSerialDispatcher(queue, lambda item: item[0])
+        lock = threading.Lock()
+        handled = dict((key, list()) for key in range(keys))
+        running = dict((key, 0) for key in range(keys))
+        overlaps = list()
+        done = threading.Event()
+
+        def handler(item):
+            with lock:
+                running[item[0]] += 1
+                if running[item[0]] > 1:
+                    overlaps.append(item)
+            if random.random() < 0.05:
+                time.sleep(0.0001)
+            with lock:
+                handled[item[0]].append(item[1])
+                running[item[0]] -= 1
+                if sum(len(values) for values in handled.values()) == count:
+                    done.set()
+
+        for _ in range(workers):
+            worker = threading.Thread(target=dispatcher.work, args=(handler,))
+            worker.daemon = True
+            worker.start()
+        for i in range(count):
+            key = i % keys
+            while not queue.put(key + 1, (key, i)):
+                time.sleep(0.0001)
+        self.assertTrue(done.wait(30))
+        self.assertEqual(overlaps, [])
+        return handled
+
+    def testPerKeyOrder(self):
+        handled = self.dispatch(DropNewestQueue(10000), 6000, 3, 4)
+        for key, values in handled.items():
+            self.assertEqual(values, list(range(key, 6000, 3)))
+
+    def testPerKeyOrderWithPriorityLanes(self):
+        handled = self.dispatch(PriorityLaneQueue({1: 0}, 5, neverDrop=[1]), 3000, 3, 4)
+        for key, values in handled.items():
+            self.assertEqual(values, list(range(key, 3000, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from internal.compression import CODECS, convertRecording
+from internal.recindex import indexPath, loadIndex, openIndex
+from internal.recording import Recording
+from internal.recreader import RecordingReader
+from internal.rectools import copyContainers, mergeContainers, selectContainers
+from internal.recwriter import RecordingWriter
+from opendavinci import makeContainer
+
+CODEC_NAMES = sorted(name for name in CODECS if not isinstance(name, int))
+
+
+def makeContainers(count, start=1500000000, seed=1):
+    """
+    returns (sent in nanoseconds, dataType, serialized container) of count containers 10 ms apart
+    """
+    generator = random.Random(seed)
+    containers = list()
+    for i in range(count):
+        sent = (start + i // 100, i % 100 * 10000)
+        dataType = generator.choice((8, 12, 19, 1001))
+        payload = bytes(bytearray(generator.getrandbits(8) for _ in range(generator.randint(0, 600))))
+        containers.append((sent[0] * 1000000000 + sent[1] * 1000, dataType,
+                           makeContainer(dataType, payload, sent, sent).SerializeToString()))
+    return containers
+
+
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.containers = makeContainers(1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def write(self, name, containers=None, **options):
+        path = self.path(name)
+        with RecordingWriter(path, **options) as writer:
+            copyContainers(containers if containers is not None else self.containers, writer)
+        return path
+
+    def read(self, path):
+        with RecordingReader(path) as reader:
+            return [bytes(payload) for offset, size, payload in reader.scan()]
+
+    def checkIndex(self, index, containers):
+        self.assertEqual(len(index), len(containers))
+        self.assertEqual(list(index.sent), [sent for sent, dataType, payload in containers])
+        self.assertEqual(list(index.dataTypes), [dataType for sent, dataType, payload in containers])
+        self.assertEqual(list(index.sizes), [len(payload) for sent, dataType, payload in containers])
+
+    def testPlain(self):
+        path = self.write("plain.rec", blockSize=4096)
+        self.assertEqual(self.read(path), [payload for sent, dataType, payload in self.containers])
+        self.checkIndex(loadIndex(path), self.containers)
+        # the scanned index equals the written one
+        written = loadIndex(path)
+        os.remove(indexPath(path))
+        scanned = openIndex(path)
+        self.assertEqual(list(scanned.offsets), list(written.offsets))
+        self.checkIndex(scanned, self.containers)
+
+    def testCompressed(self):
+        plain = loadIndex(self.write("plain.rec"))
+        for codec in CODEC_NAMES:
+            path = self.write(codec + ".rec", compression=codec, blockSize=8192)
+            self.assertEqual(self.read(path), [payload for sent, dataType, payload in self.containers])
+            # the offsets count the uncompressed bytes, so both formats have the same index
+            written = loadIndex(path)
+            self.assertEqual(list(written.offsets), list(plain.offsets))
+            os.remove(indexPath(path))
+            self.assertEqual(list(openIndex(path).offsets), list(plain.offsets))
+
+    def testConvert(self):
+        path = self.write("plain.rec")
+        with open(path, 'rb') as f:
+            original = f.read()
+        for codec in CODEC_NAMES:
+            compressed = self.path(codec + ".rec")
+            total, written = convertRecording(path, compressed, codec, blockSize=10000)
+            self.assertEqual(total, len(original))
+            self.assertEqual(written, os.path.getsize(compressed))
+            self.assertEqual(self.read(compressed), [payload for sent, dataType, payload in self.containers])
+            restored = self.path(codec + ".plain.rec")
+            convertRecording(compressed, restored, None)
+            with open(restored, 'rb') as f:
+                self.assertEqual(f.read(), original)
+            self.checkIndex(loadIndex(restored), self.containers)
+
+    def testAppend(self):
+        for compression in [None] + CODEC_NAMES:
+            name = str(compression) + ".rec"
+            self.write(name, self.containers[:600], compression=compression, blockSize=4096)
+            path = self.write(name, self.containers[600:], compression=compression, blockSize=4096, append=True)
+            self.assertEqual(self.read(path), [payload for sent, dataType, payload in self.containers])
+            self.checkIndex(loadIndex(path), self.containers)
+
+    def testAppendOtherCompression(self):
+        path = self.write("plain.rec")
+        self.assertRaises(ValueError, RecordingWriter, path, "zlib", append=True)
+
+    def testRecording(self):
+        path = self.write("zlib.rec", compression="zlib", blockSize=8192)
+        with Recording(path) as recording:
+            self.assertEqual(len(recording), len(self.containers))
+            self.assertEqual(recording.startTime(), 1500000000)
+            position = recording.seek(1500000005.5)
+            self.assertEqual(position, 550)
+            self.assertEqual(recording.read(position), self.containers[position][2])
+            selected = list(recording.containers([19], start=1500000002, end=1500000004))
+        self.assertEqual([(dataType, payload) for sent, dataType, payload in selected],
+                         [(dataType, payload) for sent, dataType, payload in self.containers[200:400]
+                          if dataType == 19])
+
+    def testSelectAndMerge(self):
+        first = self.write("first.rec", self.containers[0::2])
+        second = self.write("second.rec", self.containers[1::2], compression="zlib")
+        merged = [(sent, dataType, bytes(payload)) for sent, dataType, payload in mergeContainers([first, second])]
+        self.assertEqual(merged, self.containers)
+        selected = [(sent, dataType, bytes(payload)) for sent, dataType, payload in
+                    selectContainers(first, dataTypes=[8, 12], exclude=[12], start=1500000001, end=1500000003)]
+        self.assertEqual(selected, [container for container in self.containers[100:300:2] if container[1] == 8])
+
+
+if __name__ == '__main__':
+    unittest.main()
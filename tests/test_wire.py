@@ -0,0 +1,101 @@
+# OpenDaVINCI - Portable middleware for distributed components.
+# Copyright (C) 2016  Julian-B. Scholle
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import os
+import random
+import unittest
+
+from internal.wire import ContainerEncoder, ContainerPeeker, packHeader, parseContainer, unpackHeader
+from opendavinci import MessageContainer, makeContainer
+
+# dataType, sent and received time stamps, including negative and the largest values of the sint32 fields
+STAMPS = [
+    (19, (1000, 5), (1000, 7)),
+    (0, (0, 0), (0, 0)),
+    (-3, (-5, 999999), (0, 1)),
+    (2 ** 31 - 1, (2 ** 31 - 1, 123), (-2 ** 31, 999999)),
+]
+
+
+class ContainerEncoderTest(unittest.TestCase):
+
+    def testEqualsSerializeToString(self):
+        encoder = ContainerEncoder(MessageContainer)
+        for payload in (b'', b'\x08\x01', os.urandom(300)):
+            for dataType, sent, received in STAMPS:
+                # twice, the second time from the cached prefixes
+                for _ in range(2):
+                    encoded = b''.join(bytes(part) for part in encoder.encode(dataType, payload, sent, received))
+                    self.assertEqual(encoded, makeContainer(dataType, payload, sent, received).SerializeToString())
+
+
+class ContainerPeekerTest(unittest.TestCase):
+
+    def check(self, peeker, container):
+        buf = container.SerializeToString()
+        self.assertEqual(peeker.peekDataType(buf), container.dataType)
+        peeked = peeker.peek(buf)
+        self.assertEqual(peeked[:5], (container.dataType, container.sent.seconds, container.sent.microseconds,
+                                      container.received.seconds, container.received.microseconds))
+        self.assertEqual(buf[peeked[5]:peeked[6]], container.serializedData)
+        # within a larger buffer
+        view = memoryview(bytearray(b'xx' + buf + b'yy'))
+        self.assertEqual(peeker.peek(view, 2, 2 + len(buf))[:5], peeked[:5])
+        self.assertEqual(peeker.peekDataType(view, 2, 2 + len(buf)), container.dataType)
+
+    def testStamps(self):
+        for peeker in (ContainerPeeker(MessageContainer), ContainerPeeker()):
+            for dataType, sent, received in STAMPS:
+                self.check(peeker, makeContainer(dataType, os.urandom(50), sent, received))
+
+    def testRandomContainers(self):
+        peeker = ContainerPeeker(MessageContainer)
+        generator = random.Random(1)
+        for _ in range(500):
+            container = MessageContainer()
+            # missing fields are reported as 0
+            if generator.random() < 0.9:
+                container.dataType = generator.randint(-2 ** 31, 2 ** 31 - 1)
+            if generator.random() < 0.8:
+                container.serializedData = bytes(bytearray(generator.getrandbits(8)
+                                                           for _ in range(generator.randint(0, 300))))
+            if generator.random() < 0.8:
+                container.sent.seconds = generator.randint(-2 ** 31, 2 ** 31 - 1)
+                container.sent.microseconds = generator.randint(-10, 999999)
+            if generator.random() < 0.8:
+                container.received.seconds = generator.randint(0, 2 ** 31 - 1)
+            if generator.random() < 0.5:
+                container.sampleTimeStamp.seconds = 5
+            self.check(peeker, container)
+
+
+class WireTest(unittest.TestCase):
+
+    def testHeader(self):
+        for size in (0, 1, 255, 65502, 2 ** 24 - 1):
+            self.assertEqual(unpackHeader(bytearray(packHeader(size))), size)
+        self.assertIsNone(unpackHeader(bytearray(b'\x0d\xa5\x00\x00\x00')))
+
+    def testParseContainerFromMemoryview(self):
+        container = makeContainer(19, os.urandom(100), (1, 2), (3, 4))
+        view = memoryview(bytearray(b'xx' + container.SerializeToString()))[2:]
+        self.assertEqual(parseContainer(MessageContainer(), view), container)
+
+
+if __name__ == '__main__':
+    unittest.main()